@@ -0,0 +1,643 @@
+"""Offline benchmarks for the parse, config, alert rule and email stages.
+
+Every stage runs against local fixtures (see `fixtures.py`): saved and
+synthetic NOAA pages served from a local HTTP server, synthetic site
+configs, and a local SMTP sink, so no network access is needed. For each
+stage the best time of `--repeat` runs, the throughput and the peak
+traced memory are printed and compared with a baseline; the run fails if
+a stage got slower or hungrier than `--tolerance` / `--memory-tolerance`
+allow.
+
+Timings depend on the machine, so by default the baseline is measured in
+the same run: the `weather_report` package as of `--against` (the
+merge-base with main, or HEAD) is benchmarked first, in a subprocess,
+with this harness and these fixtures. Stages the older package cannot run
+are not compared.
+
+    python benchmarks/bench.py                  # compare with the merge-base
+    python benchmarks/bench.py --against v1.2   # ... or any git revision
+    python benchmarks/bench.py --quick          # up to 1,000 sites
+    python benchmarks/bench.py --stages parse email
+
+A baseline can also be kept in a file, for repeated runs on one machine;
+it is not compared against on another machine:
+
+    python benchmarks/bench.py --save-baseline  # write baseline.json
+    python benchmarks/bench.py --baseline benchmarks/baseline.json
+"""
+import io
+import os
+import sys
+import gc
+import json
+import time
+import tarfile
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import socketserver
+from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+# the package under test; set when benchmarking another revision
+PACKAGE_ROOT = os.environ.get('WEATHER_REPORT_BENCH_ROOT', ROOT)
+sys.path.insert(0, PACKAGE_ROOT)
+sys.path.insert(0, HERE)
+
+import fixtures  # noqa: E402
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+MACHINE_KEY = '_machine'
+
+FLOAT_COLUMNS = ['dewpoint', 'gust', 'hour', 'humidity', 'mph',
+                 'temperature', '%']
+
+# the forecast dates in the synthetic pages are parsed relative to this
+NOW = datetime(2026, 10, 18, 12)
+
+SITE_COUNTS = [1, 10, 100, 1000, 10000]
+ATTACHMENT_SIZES = [100 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+
+
+class Result(object):
+
+    def __init__(self, name, seconds, peak_bytes, items=1, nbytes=0):
+        self.name = name
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.items = items
+        self.nbytes = nbytes
+
+    @property
+    def per_second(self):
+        return self.items / self.seconds if self.seconds else float('inf')
+
+    @property
+    def mb_per_second(self):
+        if not self.nbytes or not self.seconds:
+            return None
+        return self.nbytes / self.seconds / 1e6
+
+    def to_json(self):
+        return {'seconds': self.seconds, 'peak_bytes': self.peak_bytes,
+                'items': self.items, 'nbytes': self.nbytes}
+
+    @classmethod
+    def from_json(cls, name, data):
+        return cls(name, data['seconds'], data['peak_bytes'],
+                   items=data.get('items', 1), nbytes=data.get('nbytes', 0))
+
+
+def measure(name, fn, setup=None, repeat=5, items=1, nbytes=0):
+    """Best-of-`repeat` time of `fn(setup())`, plus its peak memory.
+
+    Peak memory comes from one extra run under tracemalloc, so tracing
+    does not slow the timed runs.
+    """
+    def args():
+        return () if setup is None else (setup(),)
+
+    best = float('inf')
+    for _ in range(repeat):
+        a = args()
+        gc.collect()
+        start = time.perf_counter()
+        fn(*a)
+        best = min(best, time.perf_counter() - start)
+
+    a = args()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(*a)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(name, best, peak, items=items, nbytes=nbytes)
+
+
+# -- local servers ----------------------------------------------------------
+
+class _PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    pages = {}
+
+    def do_GET(self):
+        body = self.pages.get(self.path.lstrip('/'))
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        if body.startswith(b'{'):
+            self.send_header('Content-Type', 'application/geo+json')
+        else:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SMTPSink(socketserver.StreamRequestHandler):
+    """Accepts and discards mail; just enough SMTP for `smtplib`."""
+
+    disable_nagle_algorithm = True
+
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self._reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b'EHLO':
+                self._reply('250-sink')
+                self._reply('250 8BITMIME')
+            elif verb == b'DATA':
+                self._reply('354 go ahead')
+                for data in iter(self.rfile.readline, b''):
+                    if data == b'.\r\n':
+                        break
+                self._reply('250 ok')
+            elif verb == b'QUIT':
+                self._reply('221 bye')
+                return
+            else:
+                self._reply('250 ok')
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# -- stages -----------------------------------------------------------------
+
+def bench_parse(repeat):
+    """Each parse step on every digital page and gridpoint JSON shape."""
+    from weather_report import weather_report as wr
+    from weather_report import gridpoint
+
+    results = []
+    for shape, body in fixtures.pages('digital').items():
+        raw = wr._read_forecast_table(body, 'utf-8')
+        clean = wr._cleanup_table(raw)
+        floats = wr._coerce_float(clean.copy(), FLOAT_COLUMNS)
+        hours = len(floats)
+
+        results.append(measure(
+            'extract[{}]'.format(shape),
+            lambda: wr._read_forecast_table(body, 'utf-8'),
+            repeat=repeat, nbytes=len(body)))
+        results.append(measure(
+            'cleanup[{}]'.format(shape),
+            lambda: wr._cleanup_table(raw), repeat=repeat, items=hours))
+        results.append(measure(
+            'coerce[{}]'.format(shape),
+            lambda df: wr._coerce_float(df, FLOAT_COLUMNS),
+            setup=clean.copy, repeat=repeat, items=hours))
+        results.append(measure(
+            'date[{}]'.format(shape),
+            lambda df: wr._cleanup_date(df, 'Date', now=NOW),
+            setup=floats.copy, repeat=repeat, items=hours))
+        results.append(measure(
+            'parse[{}]'.format(shape),
+            lambda: wr._parse_tabular(body, 'utf-8'),
+            repeat=repeat, items=hours, nbytes=len(body)))
+
+    for shape, (points, body) in fixtures.gridpoints().items():
+        data = json.loads(body)
+        time_zone = json.loads(points)['properties']['timeZone']
+        # now=0 lays every shape out from its first hour
+        hours = len(gridpoint.gridpoint_frame(data, time_zone, now=0))
+        results.append(measure(
+            'gridpoint[{}]'.format(shape),
+            lambda: gridpoint.gridpoint_frame(json.loads(body), time_zone,
+                                              now=0),
+            repeat=repeat, items=hours, nbytes=len(body)))
+    return results
+
+
+def bench_fetch(repeat):
+    """Fetch and parse each digital page and gridpoint from a local server."""
+    from weather_report import weather_report as wr
+    from weather_report import gridpoint
+    from weather_report.fetch import Fetcher
+
+    pages = fixtures.pages('digital')
+    for kind in ('printable', 'graphical'):
+        pages.update(('{}-{}'.format(kind, k), v)
+                     for k, v in fixtures.pages(kind).items())
+    _PageHandler.pages = {k.replace(':', '-'): v for k, v in pages.items()}
+    # each gridpoint shape is its own api.weather.gov under /gridpoint-<shape>
+    coords = {'lat': 37.8, 'lon': -122.27}
+    grids = fixtures.gridpoints()
+    for shape, (points, body) in grids.items():
+        prefix = 'gridpoint-' + shape.replace(':', '-')
+        props = json.loads(points)['properties']
+        _PageHandler.pages[prefix + '/points/37.8,-122.27'] = points
+        _PageHandler.pages['{}/gridpoints/{}/{},{}'.format(
+            prefix, props['gridId'], props['gridX'], props['gridY'])] = body
+    server = _serve(HTTPServer(('127.0.0.1', 0), _PageHandler))
+    base = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    fetcher = Fetcher()
+
+    def process(url):
+        # forget earlier parses so every run parses
+        with wr._parsed_lock:
+            wr._parsed_pages.clear()
+        return wr._process_html(url, fetcher)
+
+    results = []
+    try:
+        for shape, body in pages.items():
+            url = base + shape.replace(':', '-')
+            if shape.startswith(('printable', 'graphical')):
+                results.append(measure(
+                    'fetch[{}]'.format(shape),
+                    lambda: fetcher.get(url, revalidate=False),
+                    repeat=repeat, nbytes=len(body)))
+            else:
+                results.append(measure(
+                    'fetch+parse[{}]'.format(shape), lambda: process(url),
+                    repeat=repeat, nbytes=len(body)))
+
+        def get(url):
+            return fetcher.get(url, revalidate=False)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # points are resolved once per site, so only the first run
+            # fetches them
+            cache = gridpoint.GridpointCache(os.path.join(tmp, 'points.json'))
+            for shape, (points, body) in grids.items():
+                url = base + 'gridpoint-' + shape.replace(':', '-')
+                results.append(measure(
+                    'fetch+parse[gridpoint:{}]'.format(shape),
+                    lambda: gridpoint.fetch_gridpoint(coords, get, url, cache),
+                    repeat=repeat, nbytes=len(body)))
+    finally:
+        fetcher.close()
+        server.shutdown()
+    return results
+
+
+def bench_sites(repeat, counts):
+    """Config parsing, report loading and grid grouping for many sites."""
+    from weather_report.configurator import (
+        WeatherParser, ConfigCache, read_sites)
+    from weather_report.weather_report import WeatherReport
+    from weather_report.runner import group_by_grid_cell
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='weather_report_bench_') as tmp:
+        paths = fixtures.write_configs(tmp, max(counts))
+        for n in counts:
+            subset = paths[:n]
+            # large runs take seconds; one timed run is plenty
+            r = repeat if n <= 100 else 1
+            results.append(measure(
+                'config[{}]'.format(n),
+                lambda: [WeatherParser(p) for p in subset],
+                repeat=r, items=n))
+            # unchanged files cost a stat once parsed
+            cache = ConfigCache()
+            for p in subset:
+                read_sites(p, cache)
+            results.append(measure(
+                'cached[{}]'.format(n),
+                lambda: [read_sites(p, cache) for p in subset],
+                repeat=r, items=n))
+            results.append(measure(
+                'load[{}]'.format(n),
+                lambda: [WeatherReport.from_input_file(p) for p in subset],
+                repeat=r, items=n))
+            reports = [WeatherReport.from_input_file(p) for p in subset]
+            results.append(measure(
+                'grid[{}]'.format(n),
+                lambda: group_by_grid_cell(reports, km=2.5),
+                repeat=r, items=n))
+    return results
+
+
+def bench_email(repeat, sizes):
+    """`send_msg` to a local SMTP sink with attachments of each size."""
+    from weather_report.email_handler import (
+        SMTPPool, AttachmentCache, send_msg, iter_message)
+
+    server = _serve(socketserver.ThreadingTCPServer(('127.0.0.1', 0),
+                                                    _SMTPSink))
+    host = '127.0.0.1:{}'.format(server.server_address[1])
+    pool = SMTPPool()
+    body = '<p>' + 'forecast table ' * 200 + '</p>'
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='weather_report_bench_') as tmp:
+            for size in sizes:
+                path = os.path.join(tmp, '{}.pdf'.format(size))
+                with open(path, 'wb') as f:
+                    f.write(b'%PDF' + os.urandom(size - 4))
+                label = '{}kB'.format(size // 1024)
+
+                def encode():
+                    cache = AttachmentCache()
+                    for _ in iter_message('a@example.com', ['b@example.com'],
+                                          'subject', body, [path], cache):
+                        pass
+                    cache.clear()
+
+                results.append(measure('mime[{}]'.format(label), encode,
+                                       repeat=repeat, nbytes=size))
+                for recipients in (1, 50):
+                    to = ['r{}@example.com'.format(i)
+                          for i in range(recipients)]
+                    results.append(measure(
+                        'send_msg[{},{}rcpt]'.format(label, recipients),
+                        # the sink offers neither STARTTLS nor AUTH
+                        lambda: send_msg('a@example.com', None, to,
+                                         'subject', body, attachments=[path],
+                                         host=host, pool=pool, tls=False),
+                        repeat=repeat, nbytes=size))
+    finally:
+        pool.close()
+        server.shutdown()
+    return results
+
+
+ALERT_RULES = ['precip >= 40 for 3h', 'gust >= 35', 'wind >= 25',
+               'temp <= 32', 'humidity >= 95 for 2h']
+
+
+def bench_rules(repeat, counts):
+    """Stack many sites' forecasts and evaluate every alert rule at once."""
+    from weather_report import weather_report as wr
+    from weather_report.rules import parse_rules, stack_forecasts, evaluate
+
+    frames = [wr._parse_tabular(body, 'utf-8')
+              for body in fixtures.pages('digital').values()]
+    rules = parse_rules(ALERT_RULES)
+    results = []
+    for n in counts:
+        sites = {i: frames[i % len(frames)] for i in range(n)}
+        stacked = stack_forecasts(sites)
+        r = repeat if n <= 100 else 1
+        results.append(measure(
+            'stack[{}]'.format(n), lambda: stack_forecasts(sites),
+            repeat=r, items=n))
+        results.append(measure(
+            'rules[{}]'.format(n),
+            lambda: evaluate(stacked, {i: rules for i in sites}),
+            repeat=r, items=len(stacked)))
+    return results
+
+
+STAGES = {
+    'parse': lambda args: bench_parse(args.repeat),
+    'fetch': lambda args: bench_fetch(args.repeat),
+    'sites': lambda args: bench_sites(
+        args.repeat, [n for n in SITE_COUNTS if n <= args.max_sites]),
+    'rules': lambda args: bench_rules(
+        args.repeat, [n for n in SITE_COUNTS if n <= args.max_sites]),
+    'email': lambda args: bench_email(args.repeat, ATTACHMENT_SIZES),
+}
+
+
+# -- reporting --------------------------------------------------------------
+
+def compare(results, baseline, tolerance, memory_tolerance, min_ms,
+            min_kb):
+    """Print the results against `baseline`; returns the failing names."""
+    failed = []
+    header = '{:<32} {:>10} {:>12} {:>9} {:>10} {:>9} {:>9}'.format(
+        'stage', 'best ms', 'items/s', 'MB/s', 'peak kB', 'vs time',
+        'vs mem')
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        base = baseline.get(r.name)
+        vs_time = vs_mem = ''
+        flag = ''
+        if base:
+            dt = r.seconds / base['seconds'] - 1 if base['seconds'] else 0
+            dm = (r.peak_bytes / base['peak_bytes'] - 1
+                  if base['peak_bytes'] else 0)
+            vs_time = '{:+.0%}'.format(dt)
+            vs_mem = '{:+.0%}'.format(dm)
+            # a measured baseline knows its noise: the best run here has
+            # to be slower than the worst run there, too
+            slower = (dt > tolerance and
+                      (r.seconds - base['seconds']) * 1000 > min_ms and
+                      r.seconds > base.get('max_seconds', 0))
+            bigger = (dm > memory_tolerance and
+                      (r.peak_bytes - base['peak_bytes']) / 1024 > min_kb)
+            if slower or bigger:
+                failed.append(r.name)
+                flag = '  FAIL'
+        mbs = r.mb_per_second
+        print('{:<32} {:>10.2f} {:>12.1f} {:>9} {:>10.0f} {:>9} {:>9}{}'.format(
+            r.name, r.seconds * 1000, r.per_second,
+            '' if mbs is None else '{:.1f}'.format(mbs),
+            r.peak_bytes / 1024, vs_time, vs_mem, flag))
+    return failed
+
+
+def _machine():
+    """What a baseline's timings are only valid for."""
+    return {'node': platform.node(), 'machine': platform.machine(),
+            'processor': platform.processor(),
+            'python': platform.python_version()}
+
+
+def _merge_base():
+    """The commit this checkout branched from main at, else HEAD."""
+    for branch in ('origin/main', 'main', 'origin/master', 'master'):
+        proc = subprocess.run(
+            ['git', '-C', ROOT, 'merge-base', 'HEAD', branch],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True)
+        if proc.returncode == 0:
+            return proc.stdout.strip()
+    return 'HEAD'
+
+
+def _measure_package(root, args):
+    """Run the stages in a subprocess against the package under `root`.
+
+    Returns `{name: {'seconds': ..., 'peak_bytes': ...}}` like a baseline.
+    """
+    with tempfile.TemporaryDirectory(prefix='weather_report_bench_') as tmp:
+        out = os.path.join(tmp, 'results.json')
+        argv = [sys.executable, os.path.abspath(__file__), '--measure-only',
+                '--json', out, '--repeat', str(args.repeat),
+                '--stages'] + args.stages
+        if args.quick:
+            argv.append('--quick')
+        env = dict(os.environ, WEATHER_REPORT_BENCH_ROOT=root)
+        subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, check=True)
+        with open(out) as f:
+            return json.load(f)
+
+
+def _best(runs):
+    """Per stage, the fastest time and smallest peak over `runs`.
+
+    The slowest time is kept as `max_seconds`: how far the machine's own
+    noise moves the stage.
+    """
+    best = {}
+    for run in runs:
+        for name, r in run.items():
+            b = best.setdefault(name, dict(r, max_seconds=r['seconds']))
+            b['seconds'] = min(b['seconds'], r['seconds'])
+            b['max_seconds'] = max(b['max_seconds'], r['seconds'])
+            b['peak_bytes'] = min(b['peak_bytes'], r['peak_bytes'])
+    return best
+
+
+def measure_against(rev, args):
+    """Measure git `rev` and this tree in alternating rounds.
+
+    Both run in fresh subprocesses with this harness and these fixtures,
+    so machine load drifting during the run affects both alike. Returns
+    `(baseline, results)` as baseline dicts.
+    """
+    archive = subprocess.run(
+        ['git', '-C', ROOT, 'archive', rev, 'weather_report'],
+        stdout=subprocess.PIPE, check=True).stdout
+    base, head = [], []
+    with tempfile.TemporaryDirectory(prefix='weather_report_base_') as tmp:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tmp)
+        for i in range(args.rounds):
+            print('round {} of {}'.format(i + 1, args.rounds))
+            base.append(_measure_package(tmp, args))
+            head.append(_measure_package(ROOT, args))
+    return _best(base), _best(head)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed runs per stage; the best is kept')
+    parser.add_argument('--quick', action='store_true',
+                        help='stop at 1,000 sites')
+    parser.add_argument('--against', metavar='REV',
+                        help='git revision to measure and compare with '
+                             '(default: the merge-base with main)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='alternating runs of the revision and this tree '
+                             '(default: 3)')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='compare with the results saved in PATH '
+                             'instead of measuring a revision')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write these results as the baseline file '
+                             '(default: {})'.format(
+                                 os.path.relpath(BASELINE, ROOT)))
+    parser.add_argument('--measure-only', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown per stage (default: 0.25)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help='allowed peak memory growth per stage '
+                             '(default: 0.25)')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='ignore slowdowns smaller than this')
+    parser.add_argument('--min-kb', type=float, default=64,
+                        help='ignore memory growth smaller than this')
+    parser.add_argument('--json', metavar='PATH',
+                        help='also write the results to this file')
+    args = parser.parse_args(argv)
+    args.max_sites = 1000 if args.quick else max(SITE_COUNTS)
+    if args.save_baseline and args.baseline is None:
+        args.baseline = BASELINE
+    return args
+
+
+def _run_stages(args):
+    results = []
+    for stage in args.stages:
+        try:
+            results.extend(STAGES[stage](args))
+        except (ImportError, AttributeError) as e:
+            if not args.measure_only:
+                raise
+            # an older revision without this stage's code
+            print('skipped {}: {}'.format(stage, e))
+    return results
+
+
+def main(argv=None):
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+
+    against = None
+    baseline = {}
+    if args.measure_only:
+        pass
+    elif args.baseline is None:
+        against = args.against or _merge_base()
+        print('measuring {} against this tree...'.format(against))
+        baseline, measured = measure_against(against, args)
+        results = [Result.from_json(name, r) for name, r in measured.items()]
+        print()
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get(MACHINE_KEY) != _machine():
+            if not args.save_baseline:
+                print('baseline at {} was recorded on {}; not comparing. '
+                      'Run with --save-baseline to record this machine\'s.\n'
+                      .format(args.baseline, baseline.get(MACHINE_KEY) or
+                              'another machine'))
+            baseline = {}
+
+    if against is None:
+        results = _run_stages(args)
+        measured = {r.name: r.to_json() for r in results}
+
+    failed = compare(results, {} if args.save_baseline else baseline,
+                     args.tolerance, args.memory_tolerance, args.min_ms,
+                     args.min_kb)
+
+    if args.json:
+        # in stage order, which `measure_against` reads back
+        with open(args.json, 'w') as f:
+            json.dump(measured, f, indent=1)
+    if args.save_baseline:
+        baseline.update(measured)
+        baseline[MACHINE_KEY] = _machine()
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('\nbaseline written to {}'.format(args.baseline))
+        return 0
+
+    if failed:
+        print('\nFAIL: {} stages regressed against {}: {}'.format(
+            len(failed), against or args.baseline, ', '.join(failed)))
+        return 1
+    if against is not None:
+        print('\ncompared with {}: {} of {} stages measured there'.format(
+            against, sum(r.name in baseline for r in results), len(results)))
+    elif not baseline and not args.measure_only:
+        print('\nno baseline at {}; run with --save-baseline'.format(
+            args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
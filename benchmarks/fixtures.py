@@ -0,0 +1,299 @@
+"""NOAA-shaped pages and site configs for the benchmarks.
+
+Saved pages are read from `benchmarks/fixtures/` (`digital-*.html`,
+`printable-*.html`, `graphical-*.html`, written by `record_fixtures.py`)
+and saved api.weather.gov responses (`points-*.json` /
+`gridpoint-*.json`) from there and from `tests/data/`. Synthetic pages
+with the same markup as NOAA's are generated for every page shape the
+parser has to handle on top of those.
+"""
+import os
+import glob
+import json
+import random
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RECORDED = os.path.join(HERE, 'fixtures')
+# the tests serve the same saved api.weather.gov responses
+TEST_DATA = os.path.join(os.path.dirname(HERE), 'tests', 'data')
+
+KINDS = ('printable', 'digital', 'graphical')
+
+LABELS = ['Date', 'Hour (PDT)', 'Temperature (&deg;F)', 'Dewpoint (&deg;F)',
+          'Wind Chill (&deg;F)', 'Surface Wind (mph)', 'Wind Dir', 'Gust',
+          'Sky Cover (%)', 'Precipitation Potential (%)',
+          'Relative Humidity (%)', 'Rain', 'Thunder', 'Snow', 'Freezing Rain',
+          'Sleet', 'Fog']
+
+WEATHER = ('Rain', 'Thunder', 'Snow', 'Freezing Rain', 'Sleet', 'Fog')
+
+# name: (first month, first day, first hour, 24-hour blocks, options)
+SHAPES = {
+    '48h': (10, 18, 14, 2, {}),
+    '96h': (10, 18, 14, 4, {}),
+    '168h': (10, 18, 14, 7, {}),
+    'heat-index': (7, 3, 5, 2, {'heat_index': True}),
+    'gusty': (1, 9, 0, 2, {'gust_rate': 0.9}),
+    'new-year': (12, 30, 20, 4, {}),
+    # a block missing a row takes the block-by-block fallback
+    'ragged': (3, 2, 9, 4, {'ragged': True}),
+}
+
+_MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+_HEAD = '''<html><head><title>National Weather Service</title>
+<link rel="stylesheet" href="/css/ndfd.css"></head><body>
+<table width="800"><tr><td><a href="/">NWS</a></td><td>
+<table><tr><td>Forecast Office</td></tr></table></td></tr></table>
+<form action="MapClick.php"><table border="0"><tr><td>Hours</td><td>
+<select name="AheadHour"><option>0</option><option>48</option></select>
+</td></tr></table></form>
+'''
+
+_TAIL = '''<p>Note: this is a synthetic page for benchmarks.</p>
+<table><tr><td><a href="/disclaimer">Disclaimer</a></td></tr></table>
+</body></html>'''
+
+
+def _cell(value):
+    return ('<td class="x" align="center"><font size="1"><b>{}</b></font>'
+            '</td>'.format(value))
+
+
+def _hours(month, day, hour, n):
+    out = []
+    for _ in range(n):
+        out.append((month, day, hour))
+        hour += 1
+        if hour == 24:
+            hour = 0
+            day += 1
+            if day > _MONTH_DAYS[month - 1]:
+                day = 1
+                month = month % 12 + 1
+    return out
+
+
+def digital_page(month=10, day=18, hour=14, blocks=2, heat_index=False,
+                 gust_rate=0.3, ragged=False, seed=0):
+    """A page laid out like NOAA's hourly 'digital' (tabular) forecast."""
+    rnd = random.Random(seed)
+    labels = list(LABELS)
+    if heat_index:
+        labels[4] = 'Heat Index (&deg;F)'
+    hours = _hours(month, day, hour, 24 * blocks)
+
+    out = [_HEAD, '<table width="800" border="0"><tr><td>',
+           '<table width="800" border="0" cellspacing="0" cellpadding="0">']
+    for b in range(blocks):
+        block = hours[24 * b:24 * (b + 1)]
+        for label in labels:
+            if ragged and b == blocks - 1 and label == 'Fog':
+                continue
+            cells = [_cell(label)]
+            previous = None
+            for (m, d, h) in block:
+                if label == 'Date':
+                    value = '{:02d}/{:02d}'.format(m, d)
+                    value, previous = ('' if (m, d) == previous else value,
+                                       (m, d))
+                elif label.startswith('Hour'):
+                    value = '{:02d}'.format(h)
+                elif label == 'Wind Dir':
+                    value = rnd.choice(['N', 'NW', 'W', 'SW', 'S', 'SE'])
+                elif label == 'Gust':
+                    value = (str(rnd.randint(15, 45))
+                             if rnd.random() < gust_rate else '')
+                elif label in WEATHER:
+                    value = rnd.choice(['', '--', 'SChc', 'Chc', 'Lkly'])
+                else:
+                    value = str(rnd.randint(0, 100))
+                cells.append(_cell(value))
+            out.append('<tr align="center">' + ''.join(cells) + '</tr>')
+        if b < blocks - 1:
+            out.append('<tr><td colspan="25">&nbsp;</td></tr>')
+    out.append('</table></td></tr></table>')
+    out.append(_TAIL)
+    return '\n'.join(out)
+
+
+def printable_page(days=7, seed=0):
+    """A page shaped like NOAA's printable text forecast."""
+    rnd = random.Random(seed)
+    out = [_HEAD, '<table width="800"><tr><td>']
+    for i in range(days * 2):
+        out.append('<b>Period {}</b>: {} with a {}% chance of rain. Highs '
+                   'near {}. {} wind {} to {} mph.<br><br>'.format(
+                       i, rnd.choice(['Sunny', 'Cloudy', 'Showers']),
+                       rnd.randint(0, 100), rnd.randint(40, 90),
+                       rnd.choice(['West', 'South']), rnd.randint(0, 10),
+                       rnd.randint(10, 20)))
+    out.append('</td></tr></table>')
+    out.append(_TAIL)
+    return '\n'.join(out)
+
+
+def graphical_page(seed=0):
+    """A page shaped like NOAA's graphical forecast (an image map)."""
+    rnd = random.Random(seed)
+    areas = ''.join(
+        '<area shape="rect" coords="{},0,{},400" href="MapClick.php?'
+        'AheadHour={}">'.format(x, x + 10, x) for x in range(0, 800, 10))
+    return (_HEAD + '<map name="points">{}</map><img src="meteograms/'
+            'Plotter.php?seed={}" usemap="#points">'.format(
+                areas, rnd.randint(0, 1 << 30)) + _TAIL)
+
+
+# gridpoint layer: (unit, low, high)
+GRID_LAYERS = {
+    'temperature': ('wmoUnit:degC', -5, 35),
+    'dewpoint': ('wmoUnit:degC', -10, 20),
+    'windChill': ('wmoUnit:degC', -15, 10),
+    'heatIndex': ('wmoUnit:degC', 25, 40),
+    'relativeHumidity': ('wmoUnit:percent', 10, 100),
+    'skyCover': ('wmoUnit:percent', 0, 100),
+    'windDirection': ('wmoUnit:degree_(angle)', 0, 359),
+    'windSpeed': ('wmoUnit:km_h-1', 0, 50),
+    'windGust': ('wmoUnit:km_h-1', 10, 80),
+    'probabilityOfPrecipitation': ('wmoUnit:percent', 0, 100),
+}
+
+GRID_WEATHER = ['rain', 'rain_showers', 'thunderstorms', 'snow', 'fog',
+                'freezing_rain', 'sleet']
+GRID_COVERAGE = ['slight_chance', 'chance', 'likely', 'definite', 'patchy']
+
+
+def points_json(grid_id='MTR', x=85, y=105,
+                time_zone='America/Los_Angeles'):
+    """An api.weather.gov `/points/lat,lon` response."""
+    return json.dumps({'properties': {
+        'gridId': grid_id, 'gridX': x, 'gridY': y, 'timeZone': time_zone,
+        'forecastGridData': 'https://api.weather.gov/gridpoints/'
+                            '{}/{},{}'.format(grid_id, x, y),
+    }}).encode('utf-8')
+
+
+def gridpoint_json(start=datetime(2026, 10, 18, 21), hours=168, seed=0):
+    """An api.weather.gov `/gridpoints/WFO/x,y` response.
+
+    Every layer is a run of `validTime` intervals of 1 to 6 hours, as NWS
+    sends them, covering `hours` from the UTC `start`.
+    """
+    rnd = random.Random(seed)
+
+    def intervals():
+        h = 0
+        while h < hours:
+            n = min(rnd.randint(1, 6), hours - h)
+            yield '{}+00:00/PT{}H'.format(
+                (start + timedelta(hours=h)).isoformat(), n)
+            h += n
+
+    props = {'updateTime': start.isoformat() + '+00:00'}
+    for name, (uom, low, high) in GRID_LAYERS.items():
+        props[name] = {'uom': uom, 'values': [
+            {'validTime': t, 'value': round(rnd.uniform(low, high), 1)}
+            for t in intervals()]}
+    weather = []
+    for t in intervals():
+        if rnd.random() < 0.5:
+            value = [{'coverage': None, 'weather': None, 'intensity': None}]
+        else:
+            value = [{'coverage': rnd.choice(GRID_COVERAGE),
+                      'weather': rnd.choice(GRID_WEATHER),
+                      'intensity': 'light'}]
+        weather.append({'validTime': t, 'value': value})
+    props['weather'] = {'values': weather}
+    return json.dumps({'properties': props}).encode('utf-8')
+
+
+def recorded_json(kind):
+    """`{name: bytes}` of the saved api.weather.gov responses of `kind`."""
+    out = {}
+    paths = [p for d in (RECORDED, TEST_DATA)
+             for p in glob.glob(os.path.join(d, kind + '-*.json'))]
+    for path in sorted(paths):
+        name = os.path.basename(path)[len(kind) + 1:-len('.json')]
+        with open(path, 'rb') as f:
+            out['recorded:' + name] = f.read()
+    return out
+
+
+def recorded_pages(kind):
+    """`{name: bytes}` of the saved NOAA pages of `kind`."""
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(RECORDED, kind + '-*.html'))):
+        name = os.path.basename(path)[len(kind) + 1:-len('.html')]
+        with open(path, 'rb') as f:
+            pages['recorded:' + name] = f.read()
+    return pages
+
+
+def pages(kind='digital'):
+    """`{shape: bytes}` for every synthetic and recorded page of `kind`."""
+    if kind == 'digital':
+        out = {name: digital_page(m, d, h, blocks, **opts).encode('utf-8')
+               for name, (m, d, h, blocks, opts) in SHAPES.items()}
+    elif kind == 'printable':
+        out = {'7day': printable_page().encode('utf-8')}
+    elif kind == 'graphical':
+        out = {'meteogram': graphical_page().encode('utf-8')}
+    else:
+        raise ValueError('unknown page kind {!r}'.format(kind))
+    out.update(recorded_pages(kind))
+    return out
+
+
+def gridpoints():
+    """`{shape: (points bytes, gridpoint bytes)}`, synthetic and recorded."""
+    out = {'{}h'.format(h): (points_json(), gridpoint_json(hours=h, seed=h))
+           for h in (48, 168)}
+    points = recorded_json('points')
+    for name, body in recorded_json('gridpoint').items():
+        if name in points:
+            out[name] = (points[name], body)
+    return out
+
+
+_CONFIG = '''[project_info]
+primary_contact_name = Benchmark
+primary_contact_email = bench@example.com
+site_description = Synthetic site {i}
+site_short_name = Site{i:05d}
+project_number = {i}
+site_map_click_url = https://forecast.weather.gov/MapClick.php?lon={lon:.4f}&lat={lat:.4f}
+pdf_threshold_value = 0
+pdf_email_list = <a{i}@example.com> , b{i}@example.com
+attach_pdf_bool = true
+pdf_save_interval_hours = 24
+pdf_save_interval_start_time = 6:00
+local_pdf_folder = Forecasts
+alert_threshold_value = 50
+alert_email_list = <a{i}@example.com>
+attach_alert_pdf_bool = false
+alert_resend_interval_hours = 12
+
+[options]
+pdf_content_order_list = 2, 1, 3
+additional_urls_list =
+silent_mode_bool = true
+
+[gmail]
+user = bench@example.com
+pwd = secret
+'''
+
+
+def write_configs(directory, n, seed=0):
+    """Write `n` site configs spread over California; returns their paths."""
+    rnd = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(n):
+        path = os.path.join(directory, 'site{:05d}.ini'.format(i))
+        with open(path, 'w') as f:
+            f.write(_CONFIG.format(i=i, lat=rnd.uniform(33.0, 41.0),
+                                   lon=rnd.uniform(-123.5, -115.0)))
+        paths.append(path)
+    return paths
@@ -0,0 +1,76 @@
+"""Check the CLI's cold-start import cost.
+
+Runs `python -X importtime` on the modules every `weather_report`
+invocation loads and fails if any heavy dependency is imported eagerly or
+the cumulative import time goes over budget. `tests/test_import_budget.py`
+runs the same check in the test suite.
+
+    python benchmarks/import_budget.py [--budget-ms 250] [--top 10]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# modules that only the parse, render, archive or email stages need
+HEAVY = ['pandas', 'numpy', 'pdfkit', 'lxml', 'pyarrow', 'smtplib']
+
+ENTRY_POINTS = [
+    'weather_report.cli',
+    'weather_report.weather_report',
+    'weather_report.runner',
+]
+
+
+def import_times(module):
+    """Return `{module: (self_us, cumulative_us)}` for importing `module`."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def check(module, budget_ms, top):
+    times = import_times(module)
+    total_ms = times[module][1] / 1000
+    heavy = sorted(m for m in times if m.split('.')[0] in HEAVY)
+
+    print('{}: {:.1f} ms (budget {:.0f} ms)'.format(module, total_ms, budget_ms))
+    ranked = sorted(times.items(), key=lambda kv: kv[1][0], reverse=True)
+    for name, (self_us, _) in ranked[:top]:
+        print('    {:>8.1f} ms  {}'.format(self_us / 1000, name))
+
+    ok = True
+    if heavy:
+        print('  FAIL: imported eagerly: {}'.format(
+            ', '.join(sorted(set(m.split('.')[0] for m in heavy)))))
+        ok = False
+    if total_ms > budget_ms:
+        print('  FAIL: over budget')
+        ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=250)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = [check(m, args.budget_ms, args.top) for m in ENTRY_POINTS]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
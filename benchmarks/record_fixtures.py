@@ -0,0 +1,80 @@
+"""Save live NOAA pages as benchmark fixtures.
+
+Downloads the printable, digital (tabular) and graphical pages for each
+MapClick url and writes them to `benchmarks/fixtures/<kind>-<name>.html`,
+where `bench.py` picks them up next to the synthetic pages. With
+`--gridpoint`, the site's api.weather.gov points and gridpoint JSON are
+saved too, as `points-<name>.json` and `gridpoint-<name>.json`. Needs
+network access; the benchmarks themselves do not.
+
+    python benchmarks/record_fixtures.py --gridpoint oakland \\
+        "https://forecast.weather.gov/MapClick.php?lon=-122.27&lat=37.80"
+"""
+import os
+import sys
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from weather_report.weather_report import (  # noqa: E402
+    _build_default_url_list, _get_lat_long)
+from weather_report.fetch import Fetcher  # noqa: E402
+from weather_report import gridpoint  # noqa: E402
+
+from fixtures import KINDS, RECORDED  # noqa: E402
+
+
+def record(name, url, directory=RECORDED, fetcher=None):
+    fetcher = fetcher or Fetcher()
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind, page_url in zip(KINDS, _build_default_url_list(url)):
+        response = fetcher.get(page_url, revalidate=False)
+        path = os.path.join(directory, '{}-{}.html'.format(kind, name))
+        with open(path, 'wb') as f:
+            f.write(response.body)
+        paths.append(path)
+        print('{} ({} bytes)'.format(path, len(response.body)))
+    return paths
+
+
+def record_gridpoint(name, url, directory=RECORDED, fetcher=None,
+                     base_url=gridpoint.DEFAULT_BASE_URL):
+    fetcher = fetcher or Fetcher()
+    os.makedirs(directory, exist_ok=True)
+    responses = []
+
+    def get(page_url):
+        responses.append(fetcher.get(page_url, revalidate=False))
+        return responses[-1]
+
+    point = gridpoint.resolve(_get_lat_long(url), get, base_url)
+    get(gridpoint.gridpoint_url(point, base_url))
+    paths = []
+    for kind, response in zip(('points', 'gridpoint'), responses):
+        path = os.path.join(directory, '{}-{}.json'.format(kind, name))
+        with open(path, 'wb') as f:
+            f.write(response.body)
+        paths.append(path)
+        print('{} ({} bytes)'.format(path, len(response.body)))
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('name', help='fixture name, e.g. the site')
+    parser.add_argument('url', help="the site's MapClick url")
+    parser.add_argument('--directory', default=RECORDED)
+    parser.add_argument('--gridpoint', action='store_true',
+                        help='also save the api.weather.gov gridpoint JSON')
+    args = parser.parse_args(argv)
+    fetcher = Fetcher()
+    record(args.name, args.url, args.directory, fetcher)
+    if args.gridpoint:
+        record_gridpoint(args.name, args.url, args.directory, fetcher)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,6 +24,10 @@ with open(os.path.join('weather_report', '__init__.py')) as init_file:
 requirements = ['html5lib', 'lxml', 'pandas',
                 'numpy', 'beautifulsoup4']
 
+extras_requirements = {
+    'archive': ['pyarrow'],
+}
+
 setup_requirements = []
 
 test_requirements = ['pytest']
@@ -48,6 +52,7 @@ setup(
     },
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extras_requirements,
     zip_safe=False,
     keywords='weather_report',
     classifiers=[
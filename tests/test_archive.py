@@ -0,0 +1,80 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+from weather_report.weather_report import _parse_tabular, _compact_table
+from weather_report.archive import ForecastArchive, issued_time
+from weather_report.fetch import Response
+
+pytest.importorskip('pyarrow')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+ISSUED = datetime(2026, 10, 18, 14, 5)
+
+
+@pytest.fixture(scope='module')
+def table():
+    return _parse_tabular(fixtures.digital_page().encode('utf-8'))
+
+
+def _files(root):
+    return sorted(os.path.relpath(os.path.join(d, n), root)
+                  for d, _, names in os.walk(root) for n in names)
+
+
+def test_same_forecast_is_archived_once(tmp_path, table):
+    archive = ForecastArchive(str(tmp_path))
+    first = archive.append('Oakland', table, issued=ISSUED)
+    again = archive.append('Oakland', table.copy(), issued=ISSUED)
+
+    assert first is not None and again is None
+    assert _files(str(tmp_path)) == [os.path.relpath(first, str(tmp_path))]
+    assert first.startswith(os.path.join(
+        str(tmp_path), 'site=Oakland', 'issued=2026-10-18', '140500-'))
+
+
+def test_changed_forecast_is_archived_again(tmp_path, table):
+    archive = ForecastArchive(str(tmp_path))
+    archive.append('Oakland', table, issued=ISSUED)
+    changed = table.copy()
+    changed.iloc[0, 1] = changed.iloc[0, 1] + 1
+
+    assert archive.append('Oakland', changed, issued=ISSUED) is not None
+    # another site with the same forecast has its own copy
+    assert archive.append('Berkeley', table, issued=ISSUED) is not None
+    assert len(_files(str(tmp_path))) == 3
+
+
+def test_compact_frame_is_the_same_forecast(tmp_path, table):
+    archive = ForecastArchive(str(tmp_path))
+    archive.append('Oakland', _compact_table(table), issued=ISSUED)
+
+    assert archive.append('Oakland', _compact_table(table),
+                          issued=ISSUED) is None
+    assert archive.read(site='Oakland')['Date'].iloc[0] == table['Date'][0]
+
+
+def test_read_filters_by_site_and_date(tmp_path, table):
+    archive = ForecastArchive(str(tmp_path))
+    archive.append('Oakland', table, issued=ISSUED)
+    archive.append('Berkeley', table, issued=ISSUED)
+    middle = table['Date'].iloc[len(table) // 2]
+
+    assert len(archive.read()) == 2 * len(table)
+    assert set(archive.read(site='Berkeley')['site']) == {'Berkeley'}
+    late = archive.read(site='Oakland', start=middle)
+    assert len(late) == (table['Date'] >= middle).sum()
+    assert ForecastArchive(str(tmp_path / 'none')).read().empty
+
+
+def test_issued_time_comes_from_last_modified():
+    page = Response('u', 200, {'last-modified':
+                               'Sun, 18 Oct 2026 21:05:00 GMT'}, b'')
+
+    assert issued_time(page) == datetime(2026, 10, 18, 21, 5)
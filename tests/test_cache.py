@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from weather_report import cache as cache_module
+from weather_report.cache import ResponseCache, _normalize_url
+from weather_report.fetch import Fetcher
+
+
+class _Page(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b'<html>forecast</html>'
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Page)
+    server.requests = []
+    server.url = 'http://127.0.0.1:{}/page'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, args=(0.05,),
+                     daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _size(directory):
+    return sum(os.path.getsize(os.path.join(directory, n))
+               for n in os.listdir(directory))
+
+
+def test_urls_that_differ_only_in_noise_share_an_entry():
+    assert _normalize_url(
+        'https://Forecast.weather.gov/MapClick.php?lon=-122.27279&lat=37.8027'
+        '#.WqBjeejwaUk') == _normalize_url(
+        'https://forecast.weather.gov/MapClick.php?lat=37.80270&lon=-122.2728')
+
+
+def test_entries_expire_but_are_kept(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put('https://x/a', 200, {'etag': '"v1"'}, b'body')
+    entry = cache.get('https://x/a')
+
+    assert entry.body == b'body' and entry.headers == {'etag': '"v1"'}
+    assert cache.is_fresh(entry)
+    assert not cache.is_fresh(entry, now=time.time() + 61)
+    assert cache.get('https://x/other') is None
+
+
+def test_fresh_entry_is_served_without_a_request(tmp_path, page):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    Fetcher(timeout=5).get(page.url, cache=cache)
+    response = Fetcher(timeout=5).get(page.url, cache=cache)
+
+    assert response.from_cache
+    assert len(page.requests) == 1
+
+
+def test_stale_entry_is_revalidated(tmp_path, page):
+    cache = ResponseCache(str(tmp_path), ttl=0)
+    Fetcher(timeout=5).get(page.url, cache=cache)
+    # a new process: nothing validated in memory, only on disk
+    response = Fetcher(timeout=5).get(page.url, cache=cache)
+
+    assert response.not_modified
+    assert response.body == b'<html>forecast</html>'
+    assert page.requests == [None, '"v1"']
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    directory = str(tmp_path)
+    cache = ResponseCache(directory, max_bytes=10000)
+    for i in range(5):
+        cache.put('https://x/{}'.format(i), 200, {}, b'x' * 1000)
+        os.utime(cache._path('https://x/{}'.format(i)), (i, i))
+    cache.get('https://x/0')
+    for i in range(5, 12):
+        cache.put('https://x/{}'.format(i), 200, {}, b'x' * 1000)
+
+    assert _size(directory) <= 10000
+    # the entry read last is kept; the oldest unread ones are not
+    assert cache.get('https://x/0') is not None
+    assert cache.get('https://x/1') is None
+
+
+def test_puts_do_not_list_the_directory(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), max_bytes=1 << 20)
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir',
+                        lambda path: listed.append(path) or listdir(path))
+    for i in range(50):
+        cache.put('https://x/{}'.format(i), 200, {}, b'x' * 100)
+        # overwriting an entry replaces its size, not adds to it
+        cache.put('https://x/{}'.format(i), 200, {}, b'x' * 100)
+
+    # counted once, then tracked
+    assert len(listed) == 1
+    usage = cache_module._directory_usage(str(tmp_path))
+    assert usage.total == _size(str(tmp_path))
+
+
+def test_caches_on_one_directory_share_the_count(tmp_path):
+    first = ResponseCache(str(tmp_path), max_bytes=5000)
+    second = ResponseCache(str(tmp_path), max_bytes=5000)
+    for i in range(10):
+        cache = first if i % 2 else second
+        cache.put('https://x/{}'.format(i), 200, {}, b'x' * 1000)
+
+    assert _size(str(tmp_path)) <= 5000
+
+
+def test_cache_write_errors_do_not_fail_the_fetch(tmp_path, page,
+                                                  monkeypatch, caplog):
+    cache = ResponseCache(str(tmp_path))
+
+    def put(*args, **kwargs):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(cache, 'put', put)
+    with caplog.at_level(logging.WARNING, logger='weather_report.fetch'):
+        response = Fetcher(timeout=5).get(page.url, cache=cache)
+
+    assert response.body == b'<html>forecast</html>'
+    assert 'No space left on device' in caplog.text
@@ -0,0 +1,73 @@
+import os
+import sys
+from datetime import datetime
+
+import numpy
+import pandas
+import pytest
+
+from weather_report.weather_report import (
+    _read_forecast_table, _cleanup_table, _cleanup_blocks, _get_nan_indices,
+    _coerce_float, _cleanup_date, _forecast_years)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+DIGITAL = fixtures.pages('digital')
+FLOATS = ['dewpoint', 'gust', 'hour', 'humidity', 'mph', 'temperature', '%']
+
+
+def _clean(html, now):
+    table = _cleanup_table(_read_forecast_table(html))
+    return _cleanup_date(_coerce_float(table, FLOATS), 'Date', now=now)
+
+
+@pytest.mark.parametrize('now, months, years', [
+    # late December: January is next year
+    (datetime(2026, 12, 30), [12, 12, 1, 1], [2026, 2026, 2027, 2027]),
+    # early January: what is left of December is last year
+    (datetime(2027, 1, 1), [12, 1, 1], [2026, 2027, 2027]),
+    (datetime(2026, 10, 18), [10, 10, 11], [2026, 2026, 2026]),
+])
+def test_forecast_years_roll_over_at_the_new_year(now, months, years):
+    assert list(_forecast_years(numpy.array(months), now)) == years
+
+
+@pytest.mark.parametrize('name', sorted(DIGITAL))
+def test_reshape_matches_block_by_block(name):
+    table = _read_forecast_table(DIGITAL[name])
+    fast = _cleanup_table(table)
+    slow = _cleanup_blocks(table, _get_nan_indices(table))
+
+    assert list(fast.columns) == list(slow.columns)
+    numpy.testing.assert_array_equal(fast.values.astype(str),
+                                     slow.values.astype(str))
+
+
+def test_one_row_per_hour():
+    clean = _clean(DIGITAL['96h'], now=datetime(2026, 10, 18))
+
+    assert len(clean) == 96
+    steps = numpy.diff(clean['Date'].values).astype('timedelta64[h]')
+    assert (steps == numpy.timedelta64(1, 'h')).all()
+    assert clean['Date'].iloc[0] == pandas.Timestamp(2026, 10, 18, 14)
+
+
+def test_dates_run_across_the_new_year():
+    # the 'new-year' page starts on 12/30 and runs four days
+    clean = _clean(DIGITAL['new-year'], now=datetime(2026, 12, 30, 20))
+    dates = clean['Date']
+
+    assert dates.is_monotonic_increasing
+    assert dates.iloc[0].year == 2026
+    assert dates.iloc[-1] == pandas.Timestamp(2027, 1, 3, 19)
+
+
+def test_numbers_are_floats_and_text_is_kept():
+    clean = _clean(DIGITAL['48h'], now=datetime(2026, 10, 18))
+
+    temperature = [c for c in clean.columns if 'temperature' in c.lower()][0]
+    assert clean[temperature].dtype == numpy.float64
+    assert clean['Wind Dir'].dtype != numpy.float64
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy
+import pandas
+import pytest
+
+from weather_report.fetch import Response
+from weather_report.weather_report import (
+    WeatherReport, _parse_tabular, _compact_table, _expand_compact)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+URL = 'https://forecast.weather.gov/MapClick.php?lon=-122.27&lat=37.80'
+
+
+@pytest.fixture(scope='module')
+def table():
+    return _parse_tabular(fixtures.digital_page(blocks=4).encode('utf-8'))
+
+
+def _report(table, compact):
+    report = WeatherReport(
+        primary_contact_name='Me', primary_contact_email='me@example.com',
+        site_description='site', site_short_name='Site', project_number='1',
+        site_map_click_url=URL, alert_threshold_value=30,
+        alert_rules_list=['gust >= 20', 'temp <= 60 for 3h'],
+        compact_mode_bool=compact)
+    page = Response(report.urls[1], 200, {}, b'')
+    report.forecast_source = lambda: (page, table.copy())
+    return report
+
+
+def test_only_rule_columns_are_kept(table):
+    compact = _compact_table(table)
+
+    assert 'Wind Dir' not in compact.columns
+    assert any('precip' in c.lower() for c in compact.columns)
+    assert all(compact[c].dtype in (numpy.float32, 'category')
+               for c in compact.columns)
+    assert compact.index.dtype == numpy.int64
+    assert compact.memory_usage(deep=True).sum() < \
+        table.memory_usage(deep=True).sum() / 2
+
+
+def test_dates_survive_the_round_trip(table):
+    expanded = _expand_compact(_compact_table(table))
+
+    pandas.testing.assert_series_equal(expanded['Date'], table['Date'],
+                                       check_dtype=False)
+    # a frame that is not compact is returned as is
+    assert _expand_compact(table) is table
+
+
+def test_compact_report_decides_the_same(table, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    full, compact = _report(table, False), _report(table, True)
+
+    assert compact.precip_max == pytest.approx(full.precip_max)
+    assert compact.triggered_rules == full.triggered_rules != []
+    assert compact.tabular_nbytes < full.tabular_nbytes
+    assert list(compact.precip_table['Date']) == \
+        list(full.precip_table['Date'])
@@ -0,0 +1,125 @@
+import os
+import json
+
+import pytest
+
+from weather_report.configurator import ConfigCache, read_sites
+
+BULK = '''[project_info]
+primary_contact_name = Me
+primary_contact_email = <me@example.com>
+project_number = 1
+alert_threshold_value = 10
+
+[gmail]
+user = me@example.com
+pwd = shared-secret
+
+[site: North]
+site_map_click_url = https://forecast.weather.gov/MapClick.php?lat=38
+alert_threshold_value = 20
+
+[site: South]
+site_map_click_url = https://forecast.weather.gov/MapClick.php?lat=37
+pwd = south-secret
+'''
+
+CSV = '''site_short_name,site_map_click_url,alert_email_list,pwd
+East,https://forecast.weather.gov/MapClick.php?lat=36,a@x.com;b@x.com,
+West,https://forecast.weather.gov/MapClick.php?lat=35,,west-secret
+'''
+
+
+@pytest.fixture
+def write(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def make(name, text):
+        path = str(tmp_path / name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+    return make
+
+
+def _options(sites):
+    return {config.site: options for config, options, _ in sites}
+
+
+def test_site_sections_override_the_shared_options(write):
+    sites = _options(read_sites(write('bulk.ini', BULK), cache=False))
+
+    north, south = sites['North'], sites['South']
+    assert north['project_info']['site_short_name'] == 'North'
+    assert north['project_info']['alert_threshold_value'] == '20'
+    assert south['project_info']['alert_threshold_value'] == '10'
+    assert south['project_info']['primary_contact_email'] == 'me@example.com'
+    assert (north['gmail']['pwd'], south['gmail']['pwd']) == \
+        ('shared-secret', 'south-secret')
+
+
+def test_single_site_file_is_one_unnamed_site(write):
+    path = write('site.ini', BULK.split('[site:')[0])
+    (config, options, error), = read_sites(path, cache=False)
+
+    assert (config.site, config.filename, error) == (None, path, None)
+    assert options['gmail']['user'] == 'me@example.com'
+
+
+def test_csv_rows_are_sites(write):
+    write('sites.csv', CSV)
+    path = write('bulk.ini', BULK + '\n[sites]\ncsv_file = sites.csv\n')
+    sites = read_sites(path, cache=False)
+
+    assert [config.site for config, _, _ in sites] == \
+        ['North', 'South', 'East', 'West']
+    assert sites[2][0].filename == path + '#East'
+    east, west = _options(sites)['East'], _options(sites)['West']
+    assert east['project_info']['alert_email_list'] == ['a@x.com', 'b@x.com']
+    # blank cells keep the shared value
+    assert (east['gmail']['pwd'], west['gmail']['pwd']) == \
+        ('shared-secret', 'west-secret')
+
+
+def test_row_without_a_name_is_an_error(write):
+    path = write('sites.csv', 'site_short_name,project_number\n,1\n')
+
+    with pytest.raises(ValueError, match='line 2: site_short_name'):
+        read_sites(path, cache=False)
+
+
+def test_unchanged_file_is_not_parsed_again(write):
+    path = write('bulk.ini', BULK)
+    cache = ConfigCache()
+    first = read_sites(path, cache=cache)
+    read_sites(path, cache=cache)
+    # touched, not changed
+    os.utime(path, (1, 1))
+    again = read_sites(path, cache=cache)
+
+    assert (cache.parsed, cache.hits, cache.hashed) == (1, 1, 1)
+    assert _options(again) == _options(first)
+
+    write('bulk.ini', BULK.replace('= 20', '= 30'))
+    os.utime(path, (2, 2))
+    changed = _options(read_sites(path, cache=cache))
+    assert cache.parsed == 2
+    assert changed['North']['project_info']['alert_threshold_value'] == '30'
+
+
+def test_secrets_are_not_written_to_the_cache(write, tmp_path):
+    write('sites.csv', CSV)
+    path = write('bulk.ini', BULK + '\n[sites]\ncsv_file = sites.csv\n')
+    cache = ConfigCache()
+    expected = _options(read_sites(path, cache=cache))
+    cache.save()
+
+    with open(str(tmp_path / ConfigCache.filename)) as f:
+        text = f.read()
+    assert '-secret' not in text
+    assert json.loads(text)[path]['sites']
+
+    # a new process reads them from the files again
+    cache = ConfigCache()
+    assert _options(read_sites(path, cache=cache)) == expected
+    assert cache.parsed == 0
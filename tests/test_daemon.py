@@ -0,0 +1,154 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from weather_report.daemon import Scheduler, next_due, _utc_epoch
+from weather_report.weather_report import WeatherReport
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+_SITE = '''[project_info]
+primary_contact_name = Me
+primary_contact_email = me@example.com
+site_description = site
+site_short_name = {name}
+project_number = 1
+site_map_click_url = https://forecast.weather.gov/MapClick.php?lon=-122.27&lat=37.80
+pdf_save_interval_hours = {hours}
+pdf_save_interval_start_time = 0:00
+alert_email_list = {alerts}
+alert_resend_interval_hours = 2
+
+[gmail]
+user = me@example.com
+pwd = secret
+'''
+
+
+def _write(directory, name, hours=24, alerts=''):
+    path = os.path.join(str(directory), name + '.ini')
+    with open(path, 'w') as f:
+        f.write(_SITE.format(name=name, hours=hours, alerts=alerts))
+    # a new mtime, so an edit within the same second is still seen
+    os.utime(path, (time.time() + 1, time.time() + 1))
+    return path
+
+
+class _Clock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock(_utc_epoch(NOW))
+
+
+@pytest.fixture
+def scheduler(tmp_path, clock):
+    def make(*paths, **kwargs):
+        return Scheduler(list(paths), state_db=str(tmp_path / 'state.db'),
+                         clock=clock, **kwargs)
+    return make
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Replace `WeatherReport.run` with one that saves a PDF."""
+    ran = []
+
+    def run(self):
+        ran.append(self.site_short_name)
+        self.state_store.write(self.state_key, 'pdf', when=NOW)
+
+    monkeypatch.setattr(WeatherReport, 'run', run)
+    return ran
+
+
+def _names(sites):
+    return [s.report.site_short_name for s in sites]
+
+
+def test_next_due_is_the_earlier_interval(tmp_path, scheduler, clock):
+    path = _write(tmp_path, 'Site', alerts='you@example.com')
+    report = scheduler(path).pop_due(clock.now)[0].report
+    now = clock.now
+
+    # never run: due now
+    assert next_due(report, now) == now
+    report.state_store.write(report.state_key, 'pdf', when=NOW)
+    report.state_store.write(report.state_key, 'alert', when=NOW)
+    # the alert every 2 hours, less 5 minutes' slack
+    assert next_due(report, now) == now + 2 * 3600 - 300
+    report.alert_email_list = []
+    assert next_due(report, now) == now + 24 * 3600 - 300
+
+
+def test_only_due_sites_are_popped(tmp_path, scheduler, clock, runs):
+    paths = [_write(tmp_path, 'Hourly', hours=1),
+             _write(tmp_path, 'Daily', hours=24)]
+    daemon = scheduler(*paths)
+
+    due = daemon.pop_due(clock.now)
+    assert _names(due) == ['Hourly', 'Daily']
+    daemon.run_due(due)
+    assert daemon.pop_due(clock.now) == []
+    assert daemon.seconds_until_next(clock.now) == 3600 - 300
+
+    clock.now += 3600
+    assert _names(daemon.pop_due(clock.now)) == ['Hourly']
+
+
+def test_site_with_nothing_due_is_polled(tmp_path, scheduler, clock,
+                                         monkeypatch):
+    # runs, but saves nothing: the forecast crossed no threshold
+    monkeypatch.setattr(WeatherReport, 'run', lambda self: None)
+    daemon = scheduler(_write(tmp_path, 'Quiet'), poll_minutes=10)
+    daemon.run_due(daemon.pop_due(clock.now))
+
+    assert daemon.seconds_until_next(clock.now) == 600
+
+
+def test_edited_file_is_rescheduled_once(tmp_path, scheduler, clock):
+    path = _write(tmp_path, 'Site')
+    daemon = scheduler(path)
+    _write(tmp_path, 'Site', hours=6)
+    daemon.reload()
+
+    due = daemon.pop_due(clock.now)
+    # the entry from before the edit is skipped
+    assert len(due) == 1
+    assert due[0].report.pdf_save_interval_hours == 6
+
+
+def test_unchanged_file_is_not_reloaded(tmp_path, scheduler, clock):
+    path = _write(tmp_path, 'Site')
+    daemon = scheduler(path)
+    report = daemon.pop_due(clock.now)[0].report
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    daemon.reload()
+
+    assert daemon._sites[os.path.realpath(path)].report is report
+
+
+def test_removed_site_is_dropped(tmp_path, scheduler, clock):
+    def write(*names):
+        with open(path, 'w') as f:
+            f.write(_SITE.format(name='x', hours=24, alerts=''))
+            for name in names:
+                f.write('\n[site: {}]\n'.format(name))
+        os.utime(path, (time.time() + 1, time.time() + 1))
+
+    path = str(tmp_path / 'bulk.ini')
+    write('North', 'South')
+    daemon = scheduler(path)
+    write('North')
+    daemon.reload()
+
+    assert _names(daemon.pop_due(clock.now)) == ['North']
@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pytest
+
+from weather_report.digest import Digest
+from weather_report.fetch import Response
+from weather_report.weather_report import WeatherReport, _parse_tabular
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+URL = 'https://forecast.weather.gov/MapClick.php?lon=-122.27&lat=37.80'
+
+
+@pytest.fixture(scope='module')
+def table():
+    return _parse_tabular(fixtures.digital_page().encode('utf-8'))
+
+
+@pytest.fixture
+def site(table, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def make(name, alerts=(), pdfs=()):
+        report = WeatherReport(
+            primary_contact_name='Me', primary_contact_email='me@example.com',
+            site_description='site', site_short_name=name, project_number='1',
+            site_map_click_url=URL, user='me@example.com', pwd='secret',
+            alert_threshold_value=10, alert_email_list=list(alerts),
+            pdf_email_list=list(pdfs), attach_alert_pdf_bool=False,
+            # keyed by site; the dotfiles would be shared in one folder
+            state_db_path='state.db')
+        page = Response(report.urls[1], 200, {}, b'')
+        report.forecast_source = lambda: (page, table.copy())
+        return report
+    return make
+
+
+class _Outbox(object):
+    """Stands in for `send_msg`; recipients in `refuse` fail."""
+
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+        self.sent = []
+
+    def __call__(self, user, pwd, recipients, subject, body,
+                 attachments=None, verbose=False, host=None, tls=True):
+        if recipients[0] in self.refuse:
+            raise OSError('refused ' + recipients[0])
+        self.sent.append((recipients[0], subject, body, attachments))
+
+
+def test_one_email_per_recipient(site):
+    digest = Digest()
+    north = site('North', alerts=['a@x.com', 'b@x.com'])
+    south = site('South', alerts=['a@x.com'], pdfs=['a@x.com'])
+    north.digest = south.digest = digest
+    north.send_alert_email()
+    south.send_alert_email()
+    south._pdf_path = 'south.pdf'
+    south.send_pdf_email()
+    outbox = _Outbox()
+
+    assert digest.send(outbox) == 2
+    (to_a, subject, body, attachments), (to_b, _, _, _) = outbox.sent
+    assert (to_a, to_b) == ('a@x.com', 'b@x.com')
+    assert subject == 'NOAA Forecast Digest: 2 site alerts and 1 forecast.'
+    assert 'North:' in body and 'South:' in body
+    assert attachments == ['south.pdf']
+    assert digest.replaced == 4
+
+
+def test_alert_is_recorded_once_its_digest_is_sent(site):
+    report = site('North', alerts=['a@x.com'])
+    report.digest = Digest()
+    report.send_alert_email()
+
+    assert report.last_alert_time is None
+    report.digest.send(_Outbox())
+    assert report.last_alert_time is not None
+
+
+def test_alert_that_missed_a_recipient_is_not_recorded(site):
+    digest = Digest()
+    missed = site('Missed', alerts=['a@x.com', 'down@x.com'])
+    delivered = site('Delivered', alerts=['a@x.com'])
+    for report in (missed, delivered):
+        report.digest = digest
+        report.send_alert_email()
+
+    digest.send(_Outbox(refuse=['down@x.com']))
+
+    assert (digest.sent, digest.failed) == (1, 1)
+    # due again next run
+    assert missed.last_alert_time is None
+    assert delivered.last_alert_time is not None
+
+
+def test_each_account_sends_its_own_digests(site):
+    digest = Digest()
+    first, second = site('First', alerts=['a@x.com']), \
+        site('Second', alerts=['a@x.com'])
+    second.user = 'other@example.com'
+    for report in (first, second):
+        report.digest = digest
+        report.send_alert_email()
+
+    assert digest.send(_Outbox()) == 2
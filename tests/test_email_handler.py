@@ -0,0 +1,258 @@
+import os
+import ssl
+import base64
+import smtplib
+import threading
+import socketserver
+
+import pytest
+
+from weather_report import email_handler
+from weather_report.email_handler import SMTPPool, send_msg
+from weather_report.weather_report import WeatherReport
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+KEYCERT = os.path.join(HERE, 'keycert.pem')
+
+
+class _Sink(socketserver.StreamRequestHandler):
+    """A local SMTP stand-in that records what each session did.
+
+    Offers STARTTLS when the server has a `tls` context and AUTH PLAIN
+    unless `auth` is off; hangs up after `drop_after` messages in a
+    session, the way a server drops an idle client.
+    """
+
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def _starttls(self):
+        self._reply('220 go ahead')
+        self.connection = self.server.tls.wrap_socket(self.connection,
+                                                      server_side=True)
+        self.rfile = self.connection.makefile('rb')
+        self.wfile = self.connection.makefile('wb')
+
+    def handle(self):
+        server = self.server
+        session = {'commands': [], 'tls': False, 'login': None,
+                   'messages': 0}
+        with server.lock:
+            server.sessions.append(session)
+        self._reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().decode('ascii')
+            verb = command.split(' ', 1)[0].upper()
+            session['commands'].append(verb)
+            if verb == 'EHLO':
+                # the first line is the greeting, not an extension
+                self._reply('250-sink')
+                if server.tls is not None and not session['tls']:
+                    self._reply('250-STARTTLS')
+                if server.auth:
+                    self._reply('250-AUTH PLAIN')
+                self._reply('250 8BITMIME')
+            elif verb == 'STARTTLS':
+                self._starttls()
+                session['tls'] = True
+            elif verb == 'AUTH':
+                token = command.split(' ')[2]
+                _, user, pwd = base64.b64decode(token).decode().split('\0')
+                session['login'] = (user, pwd)
+                self._reply('235 ok')
+            elif verb == 'DATA':
+                self._reply('354 go ahead')
+                data = []
+                for chunk in iter(self.rfile.readline, b''):
+                    if chunk == b'.\r\n':
+                        break
+                    data.append(chunk)
+                with server.lock:
+                    server.messages.append(b''.join(data))
+                session['messages'] += 1
+                self._reply('250 ok')
+                if session['messages'] == server.drop_after:
+                    return
+            elif verb == 'QUIT':
+                self._reply('221 bye')
+                return
+            else:
+                self._reply('250 ok')
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, tls=None, auth=True, drop_after=None):
+        super().__init__(('127.0.0.1', 0), _Sink)
+        self.tls = tls
+        self.auth = auth
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.messages = []
+
+    @property
+    def host(self):
+        return '127.0.0.1:{}'.format(self.server_address[1])
+
+
+def _server_tls():
+    tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    tls.load_cert_chain(KEYCERT)
+    return tls
+
+
+@pytest.fixture
+def sink():
+    servers = []
+
+    def start(tls=False, **kwargs):
+        server = _SinkServer(tls=_server_tls() if tls else None, **kwargs)
+        threading.Thread(target=server.serve_forever, args=(0.05,),
+                         daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def pool():
+    # trusts only the sink's self-signed certificate
+    pool = SMTPPool(timeout=5,
+                    ssl_context=ssl.create_default_context(cafile=KEYCERT))
+    yield pool
+    pool.close()
+
+
+def _send(pool, host, subject='hello', user='me@example.com', pwd='secret',
+          tls=False):
+    send_msg(user, pwd, ['you@example.com'], subject, '<p>body</p>',
+             host=host, pool=pool, tls=tls)
+
+
+def test_sessions_are_reused_after_a_noop(sink, pool):
+    server = sink()
+    for i in range(3):
+        _send(pool, server.host, subject='message {}'.format(i))
+
+    assert len(server.messages) == 3
+    assert len(server.sessions) == 1
+    # each reuse is checked with NOOP first
+    assert server.sessions[0]['commands'].count('NOOP') == 2
+
+
+def test_dropped_session_is_reconnected_and_retried(sink, pool):
+    server = sink(drop_after=1)
+    _send(pool, server.host, subject='first')
+    _send(pool, server.host, subject='second')
+
+    assert len(server.messages) == 2
+    assert b'Subject: second' in server.messages[1]
+    assert len(server.sessions) == 2
+
+
+def test_dropped_session_found_mid_send_is_retried(sink, pool):
+    server = sink(drop_after=1)
+    _send(pool, server.host, subject='first')
+    # a session that passes its health check but is gone by the time
+    # the message is sent
+    pool._healthy = lambda session: True
+    _send(pool, server.host, subject='second')
+
+    assert [b'Subject: second' in m for m in server.messages] == \
+        [False, True]
+    assert len(server.sessions) == 2
+
+
+def test_starttls_and_login(sink, pool):
+    server = sink(tls=True)
+    _send(pool, server.host, user='me@example.com', pwd='secret', tls=True)
+
+    session = server.sessions[0]
+    assert session['tls']
+    assert session['login'] == ('me@example.com', 'secret')
+    # AUTH only after the session is encrypted
+    commands = session['commands']
+    assert commands.index('STARTTLS') < commands.index('AUTH')
+    assert len(server.messages) == 1
+
+
+def test_server_without_starttls_is_refused(sink, pool):
+    server = sink()
+    with pytest.raises(smtplib.SMTPNotSupportedError):
+        _send(pool, server.host, tls=True)
+
+    # nothing is sent in the clear, least of all the password
+    assert server.sessions[0]['commands'] == ['EHLO']
+    assert server.messages == []
+
+
+def test_unverified_certificate_is_refused(sink):
+    server = sink(tls=True)
+    pool = SMTPPool(timeout=5)
+    try:
+        with pytest.raises(ssl.SSLCertVerificationError):
+            _send(pool, server.host, tls=True)
+    finally:
+        pool.close()
+
+    assert 'AUTH' not in server.sessions[0]['commands']
+    assert server.messages == []
+
+
+def test_server_without_auth_is_refused(sink, pool):
+    server = sink(tls=True, auth=False)
+    with pytest.raises(smtplib.SMTPNotSupportedError):
+        _send(pool, server.host, tls=True)
+
+    assert server.messages == []
+
+
+def test_no_login_without_a_password(sink, pool):
+    server = sink()
+    _send(pool, server.host, pwd=None)
+
+    assert server.sessions[0]['login'] is None
+    assert len(server.messages) == 1
+
+
+def test_sessions_are_pooled_per_host(sink, pool):
+    first, second = sink(), sink()
+    _send(pool, first.host)
+    _send(pool, second.host)
+    _send(pool, first.host)
+
+    assert len(first.messages) == 2 and len(first.sessions) == 1
+    assert len(second.messages) == 1
+
+
+def test_smtp_host_option_is_used(sink, monkeypatch):
+    server = sink()
+    pool = SMTPPool(timeout=5)
+    monkeypatch.setattr(email_handler, '_default_pool', pool)
+    report = WeatherReport(
+        primary_contact_name='Me', primary_contact_email='me@example.com',
+        site_description='site', site_short_name='Site',
+        project_number='1', user='me@example.com', pwd='secret',
+        site_map_click_url='https://forecast.weather.gov/MapClick.php'
+                           '?lon=-122.27&lat=37.80',
+        smtp_host=server.host, smtp_tls_bool=False)
+    try:
+        status = report._send_email('alert', ['you@example.com'], 'ALERT',
+                                    '<p>rain</p>', [])
+    finally:
+        pool.close()
+
+    assert status == 'Sent'
+    assert len(server.messages) == 1
+    assert b'Subject: ALERT' in server.messages[0]
@@ -0,0 +1,90 @@
+import io
+import os
+import sys
+
+import pandas
+import pytest
+
+from weather_report.extract import extract_forecast_table
+from weather_report.weather_report import (
+    _find_weather_data, _read_forecast_table)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+DIGITAL = fixtures.pages('digital')
+
+
+def _read_html(html):
+    return _find_weather_data(pandas.read_html(io.StringIO(html)))
+
+
+def _table(rows):
+    """A table of `rows` (lists of cell markup)."""
+    return '<table>{}</table>'.format(
+        ''.join('<tr>{}</tr>'.format(''.join(r)) for r in rows))
+
+
+def _page(*tables):
+    return '<html><body>{}</body></html>'.format(''.join(tables))
+
+
+def _forecast_rows(n=20):
+    rows = [['<td>Date</td>'] + ['<td>10/18</td>'] * 4,
+            ['<td>Hour (PDT)</td>'] + ['<td>{:02d}</td>'.format(h)
+                                        for h in range(4)]]
+    for i in range(n - 2):
+        rows.append(['<td>Row {}</td>'.format(i)] +
+                    ['<td>{}</td>'.format(i * 4 + j) for j in range(4)])
+    return rows
+
+
+@pytest.mark.parametrize('name', sorted(DIGITAL))
+def test_same_frame_as_read_html(name):
+    html = DIGITAL[name]
+    table = extract_forecast_table(html)
+
+    pandas.testing.assert_frame_equal(table, _read_html(html.decode()))
+
+
+def test_text_and_bytes_give_the_same_frame():
+    html = DIGITAL['48h']
+    pandas.testing.assert_frame_equal(extract_forecast_table(html),
+                                      extract_forecast_table(html.decode()))
+
+
+def test_other_tables_are_skipped():
+    # labelled like the forecast, but too short to be it
+    small = _table([['<td>Date</td><td>Hour</td>']] * 3)
+    html = _page(small, _table(_forecast_rows()))
+
+    assert extract_forecast_table(html).iloc[1, 0] == 'Hour (PDT)'
+
+
+def test_spans_are_repeated_like_read_html():
+    rows = _forecast_rows()
+    rows[0] = ['<td>Date</td>', '<td colspan="3">10/18</td>',
+               '<td rowspan="2">10/19</td>']
+    rows[1] = rows[1][:4]
+    html = _page(_table(rows))
+
+    pandas.testing.assert_frame_equal(extract_forecast_table(html),
+                                      _read_html(html))
+
+
+@pytest.mark.parametrize('kind', ['printable', 'graphical'])
+def test_pages_without_the_forecast_table_give_none(kind):
+    for html in fixtures.pages(kind).values():
+        assert extract_forecast_table(html) is None
+
+
+def test_header_row_falls_back_to_read_html():
+    rows = _forecast_rows()
+    rows.insert(0, ['<th>Label</th>'] + ['<th>h{}</th>'.format(i)
+                                         for i in range(4)])
+    html = _page(_table(rows))
+
+    assert extract_forecast_table(html) is None
+    assert list(_read_forecast_table(html).columns)[0] == 'Label'
@@ -0,0 +1,127 @@
+import gzip
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from weather_report.fetch import Fetcher, FetchError
+
+PAGE = b'<html><body>' + b'forecast ' * 200 + b'</body></html>'
+
+
+class _Noaa(BaseHTTPRequestHandler):
+    """Serves `PAGE` with an ETag, gzip-compressed when asked."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', '/page')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path != '/page':
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+        body, encoding = server.page, None
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body, encoding = gzip.compress(body), 'gzip'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', server.etag)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def noaa():
+    # threaded: the fetcher keeps its connection alive between requests
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Noaa)
+    server.requests = []
+    server.connections = 0
+    server.page = PAGE
+    server.etag = '"v1"'
+    server.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, args=(0.05,),
+                     daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = Fetcher(timeout=5)
+    yield fetcher
+    fetcher.close()
+
+
+def test_gzip_body_is_decoded(noaa, fetcher):
+    response = fetcher.get(noaa.url + '/page')
+
+    assert response.body == PAGE
+    assert 'gzip' in noaa.requests[0][1]['Accept-Encoding']
+    assert 'content-encoding' not in response.headers
+
+
+def test_unchanged_page_is_revalidated(noaa, fetcher):
+    first = fetcher.get(noaa.url + '/page')
+    second = fetcher.get(noaa.url + '/page')
+
+    assert not first.not_modified
+    assert second.not_modified and second.status == 304
+    assert second.body == PAGE
+    assert noaa.requests[1][1]['If-None-Match'] == '"v1"'
+
+
+def test_changed_page_is_downloaded_again(noaa, fetcher):
+    fetcher.get(noaa.url + '/page')
+    noaa.page, noaa.etag = b'<html>new</html>', '"v2"'
+    response = fetcher.get(noaa.url + '/page')
+
+    assert not response.not_modified
+    assert response.body == b'<html>new</html>'
+
+
+def test_connection_is_kept_alive(noaa, fetcher):
+    for _ in range(3):
+        fetcher.get(noaa.url + '/page', revalidate=False)
+
+    assert len(noaa.requests) == 3
+    assert noaa.connections == 1
+
+
+def test_redirect_is_followed(noaa, fetcher):
+    response = fetcher.get(noaa.url + '/moved#fragment')
+
+    assert response.body == PAGE
+    assert [path for path, _ in noaa.requests] == ['/moved', '/page']
+
+
+def test_http_error_raises(noaa, fetcher):
+    with pytest.raises(FetchError, match='HTTP 404'):
+        fetcher.get(noaa.url + '/nowhere')
+
+
+def test_unreachable_host_raises(fetcher):
+    with pytest.raises(FetchError):
+        fetcher.get('http://127.0.0.1:9/page')
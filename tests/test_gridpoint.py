@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import copy
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from weather_report import gridpoint
+from weather_report.gridpoint import gridpoint_frame, GridpointCache
+from weather_report.weather_report import WeatherReport, _parse_tabular
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA = os.path.join(HERE, 'data')
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+URL = 'https://forecast.weather.gov/MapClick.php?lon=-122.27&lat=37.80'
+TIME_ZONE = 'America/Los_Angeles'
+DEG_F = '\N{DEGREE SIGN}F'
+
+
+def _read(name):
+    with open(os.path.join(DATA, name), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def data():
+    return json.loads(_read('gridpoint-oakland.json'))
+
+
+class _Api(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = self.server.pages.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/geo+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    """A local api.weather.gov serving the saved Oakland responses."""
+    # threaded: the fetcher keeps its connection alive between requests
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Api)
+    server.requests = []
+    server.pages = {
+        '/points/37.8,-122.27': _read('points-oakland.json'),
+        '/gridpoints/MTR/85,105': _read('gridpoint-oakland.json'),
+    }
+    server.base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, args=(0.05,),
+                     daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _report(api, name='Oakland', **kwargs):
+    return WeatherReport(
+        primary_contact_name='Me', primary_contact_email='me@example.com',
+        site_description='site', site_short_name=name, project_number='1',
+        site_map_click_url=URL, cache_ttl_minutes=0,
+        forecast_backend='gridpoint', gridpoint_base_url=api.base_url,
+        **kwargs)
+
+
+def _value_at(layer, when):
+    """The value of a gridpoint layer at naive UTC `when`, by brute force."""
+    for v in layer['values']:
+        start, _, duration = v['validTime'].partition('/')
+        start = datetime.fromisoformat(start).replace(tzinfo=None)
+        days, _, rest = duration[1:].partition('D') if 'D' in duration \
+            else ('0', '', duration[1:])
+        hours = int(rest.strip('TH') or 0)
+        end = start + timedelta(days=int(days), hours=hours)
+        if start <= when < end:
+            return v['value']
+
+
+def _utc_hours(frame):
+    local = frame['Date'].dt.tz_localize(
+        TIME_ZONE, ambiguous='NaT').dt.tz_convert('UTC')
+    return [t.to_pydatetime().replace(tzinfo=None) for t in local]
+
+
+def test_frame_has_the_digital_columns(api, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    frame = _report(api).noaa_tabular
+    digital = _parse_tabular(fixtures.digital_page().encode('utf-8'))
+
+    assert list(frame.columns) == list(digital.columns)
+    for column in digital.columns:
+        assert frame[column].dtype.kind == digital[column].dtype.kind, column
+
+
+def test_values_are_in_digital_units(data):
+    frame = gridpoint_frame(data, TIME_ZONE, now=0)
+    props = data['properties']
+    first = datetime(2026, 10, 18, 15)
+
+    assert len(frame) == 48
+    assert frame['Date'][0] == datetime(2026, 10, 18, 8)
+    assert frame['Hour (PDT)'][0] == 8
+    celsius = _value_at(props['temperature'], first)
+    assert frame['Temperature ({})'.format(DEG_F)][0] == \
+        round(celsius * 9 / 5 + 32)
+    kmh = _value_at(props['windSpeed'], first)
+    assert frame['Surface Wind (mph)'][0] == round(kmh / 1.609344)
+
+
+def test_every_hour_takes_its_interval_value(data):
+    props = data['properties']
+    frame = gridpoint_frame(data, TIME_ZONE, now=0)
+    hours = _utc_hours(frame)
+
+    for name, column in [('probabilityOfPrecipitation',
+                          'Precipitation Potential (%)'),
+                         ('relativeHumidity', 'Relative Humidity (%)'),
+                         ('skyCover', 'Sky Cover (%)')]:
+        expected = [_value_at(props[name], h) for h in hours]
+        assert list(frame[column]) == expected, name
+
+
+def test_weather_coverage_codes(data):
+    props = data['properties']
+    frame = gridpoint_frame(data, TIME_ZONE, now=0)
+    seen = set()
+    for i, hour in enumerate(_utc_hours(frame)):
+        kinds = {w['weather']: w['coverage']
+                 for w in _value_at(props['weather'], hour) if w['weather']}
+        if kinds.get('rain_showers') == 'chance':
+            assert frame['Rain'][i] == 'Chc'
+            assert frame['Thunder'][i] == 'SChc'
+            seen.add('showers')
+        elif kinds.get('fog') == 'areas':
+            assert frame['Fog'][i] == 'Areas'
+            assert frame['Rain'][i] == 'Patchy'
+            seen.add('fog')
+        elif not kinds:
+            assert set(frame.loc[i, ['Rain', 'Thunder', 'Snow', 'Fog']]) \
+                == {'--'}
+            seen.add('none')
+    assert seen == {'showers', 'fog', 'none'}
+
+
+def test_heat_index_replaces_wind_chill_when_forecast(data):
+    data = copy.deepcopy(data)
+    for v in data['properties']['heatIndex']['values']:
+        v['value'] = 30.0
+    frame = gridpoint_frame(data, TIME_ZONE, now=0)
+
+    assert 'Heat Index ({})'.format(DEG_F) in frame.columns
+    assert 'Wind Chill ({})'.format(DEG_F) not in frame.columns
+    assert frame['Heat Index ({})'.format(DEG_F)][0] == '86'
+
+
+def test_frame_starts_at_the_current_hour(data):
+    now = datetime(2026, 10, 19, 2, 30).timestamp() - \
+        datetime(1970, 1, 1).timestamp()
+    frame = gridpoint_frame(data, TIME_ZONE, now=now)
+
+    # 02:00 UTC is 19:00 PDT the day before
+    assert frame['Date'][0] == datetime(2026, 10, 18, 19)
+    assert len(frame) == 48
+
+
+def test_points_are_resolved_once(api, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _report(api, 'A').noaa_tabular
+    _report(api, 'B').noaa_tabular
+    assert api.requests.count('/points/37.8,-122.27') == 1
+    assert api.requests.count('/gridpoints/MTR/85,105') == 2
+
+    # a new process reads the gridpoint from the file
+    path = os.path.join(str(tmp_path), '.weather_cache', 'gridpoints.json')
+    del api.requests[:]
+    gridpoint.resolve({'lat': '37.80', 'lon': '-122.27'}, None,
+                      api.base_url, GridpointCache(path))
+    assert api.requests == []
+
+
+def test_alert_rules_on_a_gridpoint_forecast(api, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    report = _report(api, alert_email_list=['you@example.com'],
+                     alert_threshold_value=0,
+                     alert_rules_list=['humidity >= 0', 'temp > 200'],
+                     user='me@example.com', pwd='secret')
+
+    assert [r.name for r in report.triggered_rules] == ['humidity >= 0']
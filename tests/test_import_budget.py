@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import import_budget  # noqa: E402
+
+BUDGET_MS = 250
+MODULES = ['weather_report'] + import_budget.ENTRY_POINTS
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_heavy_dependencies_are_not_imported(module):
+    times = import_budget.import_times(module)
+    imported = set(name.split('.')[0] for name in times)
+
+    assert imported.isdisjoint(import_budget.HEAVY), \
+        sorted(imported & set(import_budget.HEAVY))
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_time_is_within_budget(module):
+    # the best of a few runs, so a busy machine does not fail it
+    total_ms = min(import_budget.import_times(module)[module][1] / 1000
+                   for _ in range(3))
+
+    assert total_ms <= BUDGET_MS
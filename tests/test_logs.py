@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+
+from weather_report import logs
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    """Configure routing afresh; records are written once it shuts down."""
+    logs.shutdown()
+
+    def make(**kwargs):
+        # pytest's capture handlers would take the site-less records
+        monkeypatch.setattr(logging.getLogger(), 'handlers', [])
+        logs.setup(**kwargs)
+    yield make
+    logs.shutdown()
+
+
+def _read(path):
+    with open(str(path)) as f:
+        return f.read()
+
+
+def test_site_logger_writes_its_file(setup, tmp_path):
+    setup()
+    north = logs.site_logger(str(tmp_path / 'North.log'), 'weather_report.x')
+    south = logs.site_logger(str(tmp_path / 'South.log'), 'weather_report.x')
+    north.info('north ran')
+    south.warning('south failed')
+    logs.shutdown()
+
+    assert 'INFO' in _read(tmp_path / 'North.log')
+    assert 'north ran' in _read(tmp_path / 'North.log')
+    assert 'south failed' in _read(tmp_path / 'South.log')
+    assert 'south' not in _read(tmp_path / 'North.log')
+
+
+def test_package_records_follow_the_running_site(setup, tmp_path):
+    setup(path=str(tmp_path / 'process.log'))
+    logger = logging.getLogger('weather_report.fetch')
+    with logs.site(str(tmp_path / 'North.log')):
+        logger.info('fetched North')
+    logger.warning('pool is full')
+    logger.info('not important')
+    logs.shutdown()
+
+    assert 'fetched North' in _read(tmp_path / 'North.log')
+    process = _read(tmp_path / 'process.log')
+    assert 'pool is full' in process
+    # below the process level
+    assert 'not important' not in process
+    assert 'fetched North' not in process
+
+
+def test_files_beyond_max_open_are_reopened(setup, tmp_path):
+    setup(max_open=2)
+    loggers = [logs.site_logger(str(tmp_path / '{}.log'.format(i)),
+                                'weather_report.x') for i in range(4)]
+    for round_ in range(2):
+        for i, logger in enumerate(loggers):
+            logger.info('site %d round %d', i, round_)
+    assert len(logs._router._files) <= 2
+    logs.shutdown()
+
+    for i in range(4):
+        text = _read(tmp_path / '{}.log'.format(i))
+        assert 'round 0' in text and 'round 1' in text
+
+
+def test_setup_is_configured_once(setup, tmp_path):
+    setup(path=str(tmp_path / 'first.log'))
+    router = logs._router
+    setup(path=str(tmp_path / 'second.log'))
+
+    assert logs._router is router
@@ -0,0 +1,95 @@
+import json
+import threading
+
+import pytest
+
+from weather_report import metrics
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = metrics.Recorder()
+    monkeypatch.setattr(metrics, '_recorder', recorder)
+    monkeypatch.setattr(metrics, '_exports', {'jsonl': None,
+                                              'prometheus': None})
+    return recorder
+
+
+def test_span_times_a_stage(recorder):
+    with metrics.span('fetch', site='North', bytes=100) as s:
+        s.attrs['rows'] = 7
+
+    span, = recorder.drain()
+    assert (span.stage, span.site, span.error) == ('fetch', 'North', None)
+    assert span.seconds >= 0
+    assert span.to_json()['rows'] == 7 and span.to_json()['ok']
+    assert recorder.drain() == []
+
+
+def test_failed_span_is_recorded_and_raised(recorder):
+    with pytest.raises(ValueError):
+        with metrics.span('parse', site='North'):
+            raise ValueError('bad table')
+
+    out = recorder.drain()[0].to_json()
+    assert not out['ok']
+    assert out['error'] == "ValueError('bad table')"
+
+
+def test_site_labels_spans_in_its_thread_only(recorder):
+    def other():
+        with metrics.span('fetch'):
+            pass
+
+    with metrics.site('North'):
+        with metrics.span('fetch'):
+            pass
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+    with metrics.span('digest'):
+        pass
+
+    assert [(s.stage, s.site) for s in recorder.drain()] == \
+        [('fetch', 'North'), ('fetch', None), ('digest', None)]
+
+
+def test_jsonl_is_appended(recorder, tmp_path):
+    path = str(tmp_path / 'spans.jsonl')
+    metrics.configure(jsonl=path)
+    for stage in ('fetch', 'render'):
+        with metrics.span(stage, site='North'):
+            pass
+        metrics.export()
+
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['stage'] for line in lines] == ['fetch', 'render']
+    assert all(line['site'] == 'North' for line in lines)
+
+
+def test_prometheus_totals(recorder, tmp_path):
+    for size in (100, 50):
+        with metrics.span('fetch', site='North', bytes=size):
+            pass
+    with metrics.span('render', site='North', pdf_bytes=10):
+        pass
+    with metrics.span('render', site='North', pdf_bytes=20):
+        pass
+    with pytest.raises(OSError):
+        with metrics.span('render', site='Say "hi"'):
+            raise OSError('wkhtmltopdf')
+    path = str(tmp_path / 'weather.prom')
+    metrics.configure(prometheus=path)
+    metrics.export()
+
+    with open(path) as f:
+        text = f.read()
+    assert 'weather_report_stage_seconds_count{site="North",stage="fetch"} 2' \
+        in text
+    assert 'weather_report_bytes_fetched_total{site="North"} 150' in text
+    # gauges keep the latest value
+    assert 'weather_report_pdf_bytes{site="North"} 20' in text
+    assert 'weather_report_stage_failures_total{site="Say \\"hi\\"",' \
+        'stage="render"} 1' in text
+    assert [p.name for p in tmp_path.iterdir()] == ['weather.prom']
@@ -0,0 +1,137 @@
+import time
+import smtplib
+import threading
+
+import pytest
+
+from weather_report.outbox import Outbox, queued_send_msg
+from weather_report.state import StateStore
+
+
+class _Pool(object):
+    """Stands in for `SMTPPool`; raises the queued `errors` first."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def sendmail(self, host, user, pwd, from_addr, to_addrs, msg, tls=True):
+        with self.lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.sent.append((host, user, pwd, to_addrs, tls,
+                              b''.join(msg())))
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    """An outbox whose messages are only sent by `deliver_due`."""
+    def make(pool, **kwargs):
+        outbox = Outbox(str(tmp_path / 'outbox.db'), pool=pool, **kwargs)
+        outbox.start = lambda: None
+        return outbox
+    return make
+
+
+def _row(outbox, message_id, columns='status, attempts, next_attempt'):
+    return outbox._connection().execute(
+        'SELECT {} FROM outbox WHERE id = ?'.format(columns),
+        (message_id,)).fetchone()
+
+
+def _make_due(outbox):
+    with outbox._transaction() as conn:
+        conn.execute('UPDATE outbox SET next_attempt = 0')
+
+
+def test_failed_sends_back_off_exponentially(outbox):
+    pool = _Pool(*[OSError('connection refused')] * 4)
+    box = outbox(pool, base_delay=10, max_delay=30, max_attempts=8)
+    message_id = box.enqueue('me@x.com', ['you@x.com'], 'hi', '<p>hi</p>',
+                             pwd='secret', tls=False)
+
+    delays = []
+    for _ in range(4):
+        box.deliver_due()
+        status, attempts, next_attempt = _row(box, message_id)
+        delays.append(round(next_attempt - time.time()))
+        _make_due(box)
+    box.deliver_due()
+
+    assert delays == [10, 20, 30, 30]
+    assert _row(box, message_id)[:2] == ('sent', 5)
+    assert pool.sent[0][:5] == (None, 'me@x.com', 'secret', ['you@x.com'],
+                                False)
+    assert b'Subject: hi' in pool.sent[0][5]
+
+
+def test_undeliverable_message_rewinds_the_sites_state(outbox, tmp_path):
+    state = StateStore(str(tmp_path / 'state.db'))
+    state.register('site', alert_interval_hours=12)
+    state.write('site', 'alert')
+    box = outbox(_Pool(*[OSError('timeout')] * 3), max_attempts=3)
+    message_id = box.enqueue('me@x.com', ['you@x.com'], 'ALERT', 'body',
+                             pwd='secret', site_key='site', kind='alert',
+                             state_db=state.path)
+    for _ in range(3):
+        _make_due(box)
+        box.deliver_due()
+
+    assert _row(box, message_id, 'status, last_error') == \
+        ('failed', "OSError('timeout')")
+    # never delivered, so the site is due again
+    assert state.read('site', 'alert') is None
+    assert state.due() == ['site']
+
+
+def test_refused_recipients_are_not_retried(outbox):
+    refused = smtplib.SMTPRecipientsRefused({'you@x.com': (550, b'no')})
+    box = outbox(_Pool(refused))
+    message_id = box.enqueue('me@x.com', ['you@x.com'], 'hi', 'body',
+                             pwd='secret')
+    box.deliver_due()
+
+    assert _row(box, message_id)[:2] == ('failed', 1)
+
+
+def test_message_waits_for_its_password(outbox):
+    pool = _Pool()
+    box = outbox(pool)
+    # left by an earlier process: the password was never stored
+    box.enqueue('me@x.com', ['you@x.com'], 'hi', 'body')
+
+    assert box.deliver_due() == 0
+    box.set_password(None, 'me@x.com', 'secret')
+    assert box.deliver_due() == 1
+    assert pool.sent[0][2] == 'secret'
+
+
+def test_stale_claim_is_handed_out_again(outbox):
+    box = outbox(_Pool(), stale_seconds=60)
+    message_id = box.enqueue('me@x.com', ['you@x.com'], 'hi', 'body',
+                             pwd='secret')
+    # claimed by a process that died
+    with box._transaction() as conn:
+        conn.execute("UPDATE outbox SET status = 'sending', claimed = ?",
+                     (time.time() - 120,))
+
+    assert box.deliver_due() == 1
+    assert _row(box, message_id)[0] == 'sent'
+
+
+def test_background_sender_drains(tmp_path):
+    pool = _Pool(OSError('busy'))
+    # the failed send is due again at once
+    box = Outbox(str(tmp_path / 'outbox.db'), pool=pool, base_delay=0)
+    send_msg = queued_send_msg(box, kind='pdf')
+    try:
+        for i in range(3):
+            send_msg('me@x.com', 'secret', ['you@x.com'],
+                     'message {}'.format(i), 'body')
+        assert box.drain(timeout=5) == 0
+    finally:
+        box.stop(5)
+
+    assert box.counts() == {'sent': 3}
+    assert len(pool.sent) == 3
@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from weather_report import weather_report as wr
+from weather_report.fetch import Response
+from weather_report.pdfstore import PdfStore, image_urls
+from weather_report.render import RenderResult
+
+URL = 'https://forecast.weather.gov/MapClick.php?lon=-122.27&lat=37.80'
+PAGE = (b'<html><body><!-- generated 10:05 -->\n<p>Rain likely</p>'
+        b'<img src="meteograms/Plotter.php?lat=37.8&amp;lon=-122.27">'
+        b'<img src="/images/logo.png"></body></html>')
+
+
+class _Renderer(object):
+    """Stands in for the shared `RenderQueue`; counts renders."""
+
+    def __init__(self):
+        self.renders = 0
+
+    def render(self, pages, output, options=None, site=None):
+        self.renders += 1
+        with open(output, 'wb') as f:
+            f.write(b'%PDF-1.4 render ' + str(self.renders).encode())
+        result = RenderResult(output, site)
+        result.started = result.finished = result.submitted
+        result.attempts = 1
+        return result
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    """A report whose pages and images come from `site.pages` and whose
+    PDFs are counted by `site.renderer`."""
+    monkeypatch.chdir(tmp_path)
+    report = wr.WeatherReport(
+        primary_contact_name='Me', primary_contact_email='me@example.com',
+        site_description='site', site_short_name='Site', project_number='1',
+        site_map_click_url=URL, pdf_content_order_list=['1'],
+        cache_ttl_minutes=0)
+    report.pages = {}
+    report.images = {}
+
+    def page(url):
+        if url in report.images:
+            etag = report.images[url]
+            return Response(url, 200, {'etag': etag}, b'\x89PNG')
+        return Response(url, 200, {'content-type': 'text/html'}, PAGE)
+
+    monkeypatch.setattr(report, '_get_page', page)
+    monkeypatch.setattr(wr, '_fetch_page', lambda url, *a, **k: page(url))
+    report.renderer = _Renderer()
+    monkeypatch.setattr(wr, 'get_render_queue', lambda: report.renderer)
+    return report
+
+
+def _graph(report):
+    return image_urls(PAGE, report.urls[0])[0]
+
+
+def test_image_urls_are_absolute_and_unescaped():
+    assert image_urls(PAGE, URL) == [
+        'https://forecast.weather.gov/meteograms/Plotter.php'
+        '?lat=37.8&lon=-122.27',
+        'https://forecast.weather.gov/images/logo.png']
+
+
+def test_digest_ignores_comments_and_spacing_only():
+    digest = PdfStore.digest([PAGE])
+
+    assert PdfStore.digest([PAGE.replace(b'10:05', b'11:05')]) == digest
+    assert PdfStore.digest([PAGE.replace(b'\n', b'  \n ')]) == digest
+    assert PdfStore.digest([PAGE.replace(b'likely', b'')]) != digest
+    assert PdfStore.digest([PAGE], table_digest='abc') != digest
+    assert PdfStore.digest([PAGE], options={'quiet': ''}) != digest
+    assert PdfStore.digest([PAGE], images=[('u', '"v1"')]) != \
+        PdfStore.digest([PAGE], images=[('u', '"v2"')])
+
+
+def test_stored_pdf_is_linked_not_copied(tmp_path):
+    store = PdfStore(str(tmp_path / '.pdf_store'))
+    first, second = str(tmp_path / 'first.pdf'), str(tmp_path / 'second.pdf')
+    with open(first, 'wb') as f:
+        f.write(b'%PDF-1.4')
+    avoided = PdfStore.renders_avoided
+
+    assert not store.reuse('abc', second)
+    store.add('abc', first)
+    assert store.reuse('abc', second)
+    assert os.path.samefile(first, second)
+    assert PdfStore.renders_avoided == avoided + 1
+
+
+def test_prune_keeps_only_linked_pdfs(tmp_path):
+    store = PdfStore(str(tmp_path / '.pdf_store'))
+    for name in ('kept', 'deleted'):
+        path = str(tmp_path / (name + '.pdf'))
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4 ' + name.encode())
+        store.add(name, path)
+    os.remove(str(tmp_path / 'deleted.pdf'))
+
+    assert store.prune() == 1
+    assert os.path.exists(store.path('kept'))
+    assert not os.path.exists(store.path('deleted'))
+
+
+def test_unchanged_forecast_is_not_rendered_again(site):
+    site.save_pdf()
+    first = site.pdf_path
+    os.rename(first, first + '.old')
+    site.save_pdf()
+
+    assert site.renderer.renders == 1
+    assert site._pdf_reused
+    assert os.path.samefile(site.pdf_path, first + '.old')
+
+
+def test_new_graph_is_rendered(site):
+    graph = _graph(site)
+    site.images[graph] = '"v1"'
+    site.save_pdf()
+    site.images[graph] = '"v2"'
+    site.save_pdf()
+
+    assert site.renderer.renders == 2
+    assert not site._pdf_reused
+
+
+def test_graph_that_cannot_be_fetched_is_rendered(site, monkeypatch):
+    site.save_pdf()
+
+    def fail(url, *args, **kwargs):
+        raise wr.FetchError('GET {} failed'.format(url))
+
+    monkeypatch.setattr(wr, '_fetch_page', fail)
+    site.save_pdf()
+
+    assert site.renderer.renders == 2
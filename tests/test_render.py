@@ -0,0 +1,123 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from weather_report.render import RenderQueue, RenderError
+
+# stands in for wkhtmltopdf: fails the first `fails` times it is run for an
+# output, then writes a PDF; `mode` picks how it fails or succeeds
+FAKE = textwrap.dedent('''
+    import sys, time
+    output, fails, mode = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    count = output + '.count'
+    try:
+        with open(count) as f:
+            n = int(f.read())
+    except OSError:
+        n = 0
+    with open(count, 'w') as f:
+        f.write(str(n + 1))
+    if mode == 'slow':
+        time.sleep(float(sys.argv[4]))
+    if n < fails or mode == 'hang':
+        if mode == 'hang':
+            time.sleep(30)
+        sys.stderr.write('Error: Failed loading page\\n')
+        sys.exit(1)
+    with open(output, 'wb') as f:
+        f.write(b'%PDF-1.4 fake')
+    if mode == 'partial':
+        sys.stderr.write('Loading pages (1/6)\\nPrinting pages (6/6)\\n'
+                         'Done\\nExit with code 1 due to network error\\n')
+        sys.exit(1)
+''')
+
+
+class _FakeQueue(RenderQueue):
+    """Runs `FAKE` instead of wkhtmltopdf; `inputs` are its arguments."""
+
+    def __init__(self, script, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        super().__init__(**kwargs)
+        self.script = script
+
+    def _command(self, inputs, output, options):
+        return [sys.executable, self.script, output] + inputs
+
+
+@pytest.fixture
+def script(tmp_path):
+    path = str(tmp_path / 'fake_wkhtmltopdf.py')
+    with open(path, 'w') as f:
+        f.write(FAKE)
+    return path
+
+
+@pytest.fixture
+def queue(script):
+    queue = _FakeQueue(script, workers=2, retries=2, timeout=10)
+    yield queue
+    queue.shutdown()
+
+
+def _runs(output):
+    with open(output + '.count') as f:
+        return int(f.read())
+
+
+def test_failed_render_is_retried(queue, tmp_path):
+    output = str(tmp_path / 'a.pdf')
+    result = queue.render(['2', 'fail'], output)
+
+    assert result.attempts == 3 and _runs(output) == 3
+    assert result.warning is None
+    assert result.render_seconds >= 0 and result.queue_wait >= 0
+
+
+def test_render_gives_up_after_its_retries(queue, tmp_path):
+    output = str(tmp_path / 'a.pdf')
+    with pytest.raises(RenderError, match='Failed loading page'):
+        queue.render(['5', 'fail'], output)
+
+    assert _runs(output) == 3
+    assert queue.results[-1].attempts == 3
+
+
+def test_complete_pdf_with_errors_is_not_rendered_again(queue, tmp_path):
+    output = str(tmp_path / 'a.pdf')
+    result = queue.render(['0', 'partial'], output)
+
+    assert result.attempts == 1
+    assert 'network error' in result.warning
+    assert os.path.getsize(output) > 0
+
+
+def test_hung_render_is_killed(script, tmp_path):
+    queue = _FakeQueue(script, retries=1, timeout=0.5)
+    output = str(tmp_path / 'a.pdf')
+    try:
+        with pytest.raises(RenderError, match='timed out'):
+            queue.render(['0', 'hang'], output)
+    finally:
+        queue.shutdown()
+
+    assert _runs(output) == 2
+
+
+def test_at_most_workers_renders_at_once(queue, tmp_path):
+    futures = [queue.submit(['0', 'slow', '0.3'],
+                            str(tmp_path / '{}.pdf'.format(i)))
+               for i in range(6)]
+    results = [f.result() for f in futures]
+
+    # most renders running at any moment
+    events = sorted([(r.started, 1) for r in results] +
+                    [(r.finished, -1) for r in results])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    assert peak == 2
+    assert max(r.queue_wait for r in results) >= 0.25
@@ -0,0 +1,78 @@
+import pandas
+import pytest
+
+from weather_report.rules import Rule, evaluate, parse_rules, stack_forecasts
+
+
+def _forecast(start, precip, gust=None, skip=()):
+    """An hourly forecast from `start`, without the hours in `skip`."""
+    hours = [h for h in range(len(precip)) if h not in skip]
+    data = {'Date': pandas.Timestamp(start) + pandas.to_timedelta(hours, 'h'),
+            'Precipitation Potential (%)': [precip[h] for h in hours]}
+    if gust is not None:
+        data['Gust (mph)'] = [gust[h] for h in hours]
+    # newest first, as some sources order it
+    return pandas.DataFrame(data).iloc[::-1]
+
+
+def test_parse():
+    rule = Rule.parse(' Precip >= 40% for 3 hours ')
+
+    assert (rule.variable, rule.op, rule.value, rule.hours) == \
+        ('precip', '>=', 40.0, 3)
+    assert rule.name == 'precip >= 40 for 3h'
+    assert rule.describe() == 'chance of rain at or above 40% for 3 hours'
+    assert Rule.parse('gust>35') == Rule.parse('gust > 35.0')
+    assert parse_rules(['gust > 35', 'gust >35', 'temp < 32']) == \
+        [Rule.parse('gust > 35'), Rule.parse('temp < 32')]
+
+
+@pytest.mark.parametrize('text, error', [
+    ('gust = 35', 'invalid alert rule'),
+    ('gust >= fast', 'invalid alert rule'),
+    ('snow >= 1', 'unknown rule variable'),
+    ('gust >= 35 for 0h', 'at least 1 hour'),
+])
+def test_parse_errors(text, error):
+    with pytest.raises(ValueError, match=error):
+        Rule.parse(text)
+
+
+def test_stack_orders_each_site_by_time():
+    stacked = stack_forecasts({
+        'North': _forecast('2026-10-18 00:00', [10, 20, 30], gust=[5, 6, 7]),
+        'South': _forecast('2026-10-18 06:00', [40, 50])})
+
+    assert list(stacked.loc['North', 'precip']) == [10, 20, 30]
+    # South has no gust column
+    assert stacked.loc['South', 'gust'].isna().all()
+    times = stacked.loc['South'].index
+    assert times[1] - times[0] == 3600
+
+
+def test_rule_must_hold_for_consecutive_hours():
+    rule = Rule.parse('precip >= 40 for 3h')
+    stacked = stack_forecasts({
+        'Held': _forecast('2026-10-18', [0, 40, 50, 60, 0]),
+        'Short': _forecast('2026-10-18', [40, 50, 0, 60, 70]),
+        # three hits, but not three hours in a row
+        'Gap': _forecast('2026-10-18', [40, 50, 0, 60], skip=[2]),
+        # two hits at the end of one site and one at the start of the next
+        'End': _forecast('2026-10-18', [0, 0, 0, 40, 50]),
+        'Start': _forecast('2026-10-18 05:00', [60, 0, 0])})
+    sites = ['Held', 'Short', 'Gap', 'End', 'Start']
+
+    assert evaluate(stacked, {site: [rule] for site in sites}) == \
+        {('Held', rule)}
+
+
+def test_rules_are_kept_for_their_own_sites():
+    gust, precip = Rule.parse('gust >= 20'), Rule.parse('precip > 50')
+    stacked = stack_forecasts({
+        'North': _forecast('2026-10-18', [60, 0], gust=[25, 0]),
+        'South': _forecast('2026-10-18', [60, 0], gust=[25, 0]),
+        'East': _forecast('2026-10-18', [0, 0], gust=[0, 0])})
+
+    triggered = evaluate(stacked, {'North': [gust], 'South': [gust, precip],
+                                   'East': [gust, precip], 'Gone': [gust]})
+    assert triggered == {('North', gust), ('South', gust), ('South', precip)}
@@ -0,0 +1,167 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from weather_report.runner import (
+    SharedForecast, share_forecasts, run_sites, main_parallel)
+from weather_report.weather_report import WeatherReport
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+_SITE = '''[project_info]
+primary_contact_name = Me
+primary_contact_email = me@example.com
+site_description = site
+site_short_name = {name}
+project_number = 1
+site_map_click_url = https://forecast.weather.gov/MapClick.php?lon={lon}&lat={lat}
+
+[options]
+silent_mode_bool = {silent}
+'''
+
+
+def _write(directory, name, lat=37.80, lon=-122.27, silent=False):
+    path = os.path.join(str(directory), name + '.ini')
+    with open(path, 'w') as f:
+        f.write(_SITE.format(name=name, lat=lat, lon=lon, silent=silent))
+    return path
+
+
+def _report(name, lat, lon):
+    return WeatherReport(
+        primary_contact_name='Me', primary_contact_email='me@example.com',
+        site_description='site', site_short_name=name, project_number='1',
+        site_map_click_url='https://forecast.weather.gov/MapClick.php'
+                           '?lon={}&lat={}'.format(lon, lat))
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Replace `WeatherReport.run`; sites named 'Broken*' raise."""
+    ran = []
+    lock = threading.Lock()
+
+    def run(self):
+        with lock:
+            ran.append(self.site_short_name)
+        if self.site_short_name.startswith('Broken'):
+            raise RuntimeError('no forecast for ' + self.site_short_name)
+
+    monkeypatch.setattr(WeatherReport, 'run', run)
+    return ran
+
+
+def test_shared_forecast_loads_once_per_round():
+    loads = []
+    source = SharedForecast(lambda: loads.append(1) or ('page', 'frame'),
+                            users=3)
+
+    assert [source() for _ in range(3)] == [('page', 'frame')] * 3
+    assert source.loads == 1
+    # every user was served, so the next call starts a new round
+    source()
+    assert source.loads == 2
+
+
+def test_shared_forecast_gives_every_user_the_error():
+    def load():
+        raise ValueError('NOAA is down')
+
+    source = SharedForecast(load, users=2)
+    for _ in range(2):
+        with pytest.raises(ValueError, match='NOAA is down'):
+            source()
+    assert source.loads == 1
+
+
+def test_shared_forecast_is_loaded_once_across_threads():
+    started = threading.Event()
+    loads = []
+
+    def load():
+        started.wait(1)
+        loads.append(1)
+        return 'frame'
+
+    source = SharedForecast(load, users=8)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(source()))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    started.set()
+    for t in threads:
+        t.join()
+
+    assert results == ['frame'] * 8
+    assert len(loads) == 1
+
+
+def test_nearby_sites_share_one_forecast():
+    reports = [_report('A', 37.800, -122.270), _report('B', 37.801, -122.271),
+               _report('C', 34.050, -118.240)]
+    cells = share_forecasts(reports)
+
+    assert cells == 2
+    assert reports[0].forecast_source is reports[1].forecast_source
+    assert reports[2].forecast_source is not reports[0].forecast_source
+    assert reports[0].forecast_source.users == 2
+
+
+def test_failing_site_does_not_stop_the_others(tmp_path, runs):
+    paths = [_write(tmp_path, 'First'), _write(tmp_path, 'Broken'),
+             str(tmp_path / 'missing.ini'), _write(tmp_path, 'Last')]
+    results = run_sites(paths, workers=1)
+
+    assert runs == ['First', 'Broken', 'Last']
+    assert [r.ok for r in results] == [True, False, False, True]
+    assert isinstance(results[1].error, RuntimeError)
+    assert isinstance(results[2].error, FileNotFoundError)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_results_follow_input_order(tmp_path, runs, workers):
+    paths = fixtures.write_configs(str(tmp_path), 12)
+    results = run_sites(paths, workers=workers)
+
+    assert [r.site for r in results] == \
+        ['Site{:05d}'.format(i) for i in range(12)]
+    assert sorted(runs) == [r.site for r in results]
+    assert all(r.ok for r in results)
+
+
+def test_serial_run_shares_forecasts(tmp_path, runs):
+    paths = [_write(tmp_path, 'A'), _write(tmp_path, 'B', lat=37.801),
+             _write(tmp_path, 'C', lat=34.05, lon=-118.24)]
+    results = run_sites(paths, workers=1)
+
+    assert results[0].cell == results[1].cell != results[2].cell
+    assert run_sites(paths, workers=1, grid_km=None)[0].cell is None
+
+
+def test_exit_code_counts_only_sites_that_are_not_silent(tmp_path, runs,
+                                                        capsys):
+    quiet = _write(tmp_path, 'BrokenQuiet', silent=True)
+    loud = _write(tmp_path, 'BrokenLoud')
+
+    assert main_parallel([quiet], workers=1, summary=False) == 0
+    assert main_parallel([quiet, loud], workers=1, summary=False) == 1
+    # without a summary table, failures still reach stderr
+    err = capsys.readouterr().err
+    assert 'BrokenLoud: RuntimeError' in err
+    assert 'BrokenQuiet' not in err
+
+
+def test_summary_lists_every_site(tmp_path, runs, capsys):
+    paths = [_write(tmp_path, 'Fine'), _write(tmp_path, 'Broken')]
+    main_parallel(paths, workers=2, summary=True)
+
+    out = capsys.readouterr().out
+    assert '2 sites, 1 ok, 1 failed' in out
+    assert 'RuntimeError: no forecast for Broken' in out
@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from weather_report.helper import _write_timestamp
+from weather_report.state import (
+    StateStore, register_reports, _SCHEMA, _DELIVERY_COLUMNS)
+from weather_report.weather_report import WeatherReport
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'))
+    yield store
+    store.close()
+
+
+def _columns(path):
+    conn = sqlite3.connect(path)
+    try:
+        return set(r[1] for r in conn.execute('PRAGMA table_info(sites)'))
+    finally:
+        conn.close()
+
+
+def test_dotfiles_are_imported_once(tmp_path, store):
+    dotfile = str(tmp_path / '.pdf_last_saved')
+    _write_timestamp(dotfile, note='PDF saved at ')
+    store.register('site', 24, 12, dotfiles={
+        'pdf': (dotfile, 'PDF saved at '),
+        'alert': (str(tmp_path / 'missing'), '')})
+    imported = store.read('site', 'pdf')
+
+    assert abs(imported - datetime.utcnow()) < timedelta(seconds=5)
+    assert store.read('site', 'alert') is None
+    # the store is the record from now on
+    store.write('site', 'pdf', when=NOW)
+    store.register('site', 24, 12, dotfiles={
+        'pdf': (dotfile, 'PDF saved at ')})
+    assert store.read('site', 'pdf') == NOW
+
+
+def test_due_follows_each_sites_intervals(store):
+    store.register('daily', pdf_interval_hours=24, alert_interval_hours=24)
+    store.register('hourly', pdf_interval_hours=1, alert_interval_hours=1)
+    store.register('new')
+    for site in ('daily', 'hourly'):
+        store.write(site, 'pdf', when=NOW)
+        store.write(site, 'alert', when=NOW)
+
+    assert store.due(now=NOW) == ['new']
+    assert store.due(now=NOW + timedelta(hours=1)) == ['new', 'hourly']
+    assert store.due(now=NOW + timedelta(days=1)) == \
+        ['new', 'hourly', 'daily']
+    assert store.next_due('hourly') == NOW + timedelta(minutes=55)
+
+
+def test_undelivered_email_makes_the_site_due_again(store):
+    store.register('site', alert_interval_hours=12)
+    store.write('site', 'alert', when=NOW)
+    store.record_delivery('site', 'alert', True, when=NOW)
+    later = NOW + timedelta(hours=12)
+    store.write('site', 'alert', when=later)
+
+    store.record_delivery('site', 'alert', False, error='timeout')
+    assert store.read('site', 'alert') == later
+    store.record_delivery('site', 'alert', False, error='refused',
+                          final=True)
+    # back to the last alert that was delivered
+    assert store.read('site', 'alert') == NOW
+    assert store.delivery('site', 'alert') == (NOW, 'refused')
+
+
+def test_old_databases_are_migrated_once(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    conn.close()
+
+    errors = []
+
+    def open_store():
+        try:
+            StateStore(path).close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_store) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert set(name for name, _ in _DELIVERY_COLUMNS) <= _columns(path)
+
+
+def test_many_sites_register_in_one_transaction(store):
+    statements = []
+    store._connection().set_trace_callback(statements.append)
+    store.register_many([('site{}'.format(i), 24, 12, None)
+                         for i in range(50)])
+
+    assert statements.count('BEGIN IMMEDIATE') == 1
+    assert len(store.due(now=NOW)) == 50
+
+
+def test_reports_sharing_a_database_are_registered_together(tmp_path,
+                                                             monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reports = [WeatherReport(
+        primary_contact_name='Me', primary_contact_email='me@example.com',
+        site_description='site', site_short_name='Site{}'.format(i),
+        project_number='1', state_db_path='state.db',
+        site_map_click_url='https://forecast.weather.gov/MapClick.php'
+                           '?lon=-122.27&lat=37.80') for i in range(3)]
+    register_reports(reports)
+
+    store = reports[0].state_store
+    assert all(r.state_store is store for r in reports)
+    assert store.due(now=NOW) == ['Site0', 'Site1', 'Site2']
@@ -4,5 +4,14 @@ __version__ = "0.1.0"
 __author__ = "Austin Orr"
 __email__ = "aorr@geosyntec.com"
 
-from .weather_report import WeatherReport
 from .configurator import WeatherParser
+
+
+def __getattr__(name):
+    # `WeatherReport` is imported on first use so that `import weather_report`
+    # and the CLI start quickly.
+    if name == 'WeatherReport':
+        from .weather_report import WeatherReport
+        return WeatherReport
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,181 @@
+import os
+import re
+import glob
+import hashlib
+import tempfile
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from .helper import _lazy_import
+
+numpy = _lazy_import('numpy')
+pandas = _lazy_import('pandas')
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError:
+        e = ('The forecast archive requires `pyarrow`. '
+             'Install it with `pip install pyarrow`.')
+        raise ImportError(e)
+    return pyarrow
+
+
+def _site_slug(site):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', site).strip('_') or 'site'
+
+
+def _frame_digest(df):
+    hashed = pandas.util.hash_pandas_object(df, index=False).values
+    h = hashlib.sha1(hashed.tobytes())
+    h.update('|'.join(map(str, df.columns)).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def issued_time(response=None):
+    """Issuance time of a forecast page as a naive UTC datetime.
+
+    Taken from the page's `Last-Modified` header when there is one, else
+    the current time.
+    """
+    if response is not None and response.last_modified:
+        try:
+            ts = parsedate_to_datetime(response.last_modified)
+            if ts.tzinfo is not None:
+                ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+            return ts
+        except (TypeError, ValueError):
+            pass
+    return datetime.utcnow().replace(microsecond=0)
+
+
+class ForecastArchive(object):
+    """Append-only Parquet archive of parsed `noaa_tabular` frames.
+
+    Files are laid out as `site=<site>/issued=<YYYY-MM-DD>/<time>-<hash>.parquet`
+    so readers can prune by site and date without opening other files. A
+    forecast whose content hash already exists for the site is not written
+    again, so refetching the same issuance is a no-op.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _site_dir(self, site):
+        return os.path.join(self.root, 'site=' + _site_slug(site))
+
+    def contains(self, site, digest):
+        pattern = os.path.join(self._site_dir(site), 'issued=*',
+                               '*-{}.parquet'.format(digest))
+        return bool(glob.glob(pattern))
+
+    def _to_arrow(self, df, issued):
+        pa = _require_pyarrow()
+        arrays = []
+        names = []
+        for c in df.columns:
+            col = df[c]
+            if c == 'Date':
+                arr = pa.array(col.values.astype('datetime64[s]'),
+                               type=pa.timestamp('s'))
+            elif col.dtype.kind in 'fiu':
+                arr = pa.array(col.values.astype(numpy.float64),
+                               type=pa.float64(), from_pandas=True)
+            else:
+                arr = pa.array(col.astype(object).where(col.notnull(), None),
+                               type=pa.string(), from_pandas=True)
+            arrays.append(arr)
+            names.append(str(c))
+        arrays.append(pa.array([issued] * len(df), type=pa.timestamp('s')))
+        names.append('issued_at')
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def append(self, site, df, issued=None):
+        """Archive one parsed forecast for `site`.
+
+        Returns the path written, or `None` if this forecast is already in
+        the archive.
+        """
+        pa = _require_pyarrow()
+        if issued is None:
+            issued = issued_time()
+        if 'Date' not in df.columns:
+            # compact frames keep Date as an epoch-seconds index
+            df = df.reset_index()
+            df['Date'] = pandas.to_datetime(df['Date'], unit='s')
+
+        digest = _frame_digest(df)
+        if self.contains(site, digest):
+            return None
+
+        directory = os.path.join(self._site_dir(site),
+                                 'issued=' + issued.strftime('%Y-%m-%d'))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{}-{}.parquet'.format(
+            issued.strftime('%H%M%S'), digest))
+
+        # dot-prefixed so dataset discovery skips partial files
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        os.close(fd)
+        try:
+            pa.parquet.write_table(self._to_arrow(df, issued), tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return path
+
+    def read(self, site=None, start=None, end=None, columns=None):
+        """Load archived forecasts as one frame.
+
+        `site` (a name or list of names) and the `start`/`end` bounds on
+        forecast `Date` are pushed down to the Parquet dataset, so only the
+        matching partitions and row groups are read.
+        """
+        pa = _require_pyarrow()
+        ds = pa.dataset
+        if not os.path.isdir(self.root):
+            return pandas.DataFrame()
+
+        partitioning = ds.partitioning(
+            pa.schema([('site', pa.string()), ('issued', pa.string())]),
+            flavor='hive')
+        dataset = ds.dataset(self.root, format='parquet',
+                             partitioning=partitioning)
+
+        expr = None
+
+        def _and(a, b):
+            return b if a is None else a & b
+
+        if site is not None:
+            sites = [site] if isinstance(site, str) else list(site)
+            expr = _and(expr, ds.field('site').isin(
+                [_site_slug(s) for s in sites]))
+        if start is not None:
+            start = pandas.Timestamp(start).to_pydatetime()
+            expr = _and(expr, ds.field('Date') >= pa.scalar(
+                start, type=pa.timestamp('s')))
+        if end is not None:
+            end = pandas.Timestamp(end).to_pydatetime()
+            # forecasts are issued before the hours they cover
+            expr = _and(expr, ds.field('issued') <= end.strftime('%Y-%m-%d'))
+            expr = _and(expr, ds.field('Date') < pa.scalar(
+                end, type=pa.timestamp('s')))
+
+        # sites report different variables (e.g. wind chill vs heat index);
+        # read with the union of the matching files' columns.
+        fragments = list(dataset.get_fragments(filter=expr))
+        if not fragments:
+            return pandas.DataFrame()
+        schema = pa.unify_schemas(
+            [f.physical_schema for f in fragments] + [partitioning.schema])
+        dataset = ds.dataset([f.path for f in fragments], schema=schema,
+                             format='parquet', partitioning=partitioning,
+                             partition_base_dir=self.root)
+
+        table = dataset.to_table(columns=columns, filter=expr)
+        return table.to_pandas()
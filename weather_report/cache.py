@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+
+def _normalize_url(url):
+    """Canonical form of `url` used for cache keys.
+
+    The fragment is dropped, query parameters are sorted and `lat`/`lon`
+    are rounded to 4 decimals (~10 m), so links copied from a browser with
+    different trailing digits or parameter order share an entry.
+    """
+    parts = urlsplit(url.split('#')[0])
+    query = []
+    for k, v in parse_qsl(parts.query, keep_blank_values=True):
+        if k.lower() in ('lat', 'lon'):
+            try:
+                v = '{:.4f}'.format(float(v))
+            except ValueError:
+                pass
+        query.append((k, v))
+    return '{}://{}{}?{}'.format(parts.scheme.lower(), parts.netloc.lower(),
+                                 parts.path, urlencode(sorted(query)))
+
+
+class CacheEntry(object):
+
+    def __init__(self, url, status, headers, body, stored):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored = stored
+
+    def age(self, now=None):
+        if now is None:
+            now = time.time()
+        return now - self.stored
+
+
+class _Usage(object):
+    """Bytes held by one cache directory, kept up to date by each `put`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = None
+
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+def _directory_usage(directory):
+    directory = os.path.realpath(directory)
+    with _usage_lock:
+        if directory not in _usage:
+            _usage[directory] = _Usage()
+        return _usage[directory]
+
+
+class ResponseCache(object):
+    """Persistent response cache shared by every run using one directory.
+
+    Entries expire after `ttl` seconds (NOAA refreshes the digital forecast
+    about once an hour) but are kept past expiry so their validators can be
+    used for a conditional GET. Writes go through a temp file and
+    `os.replace`, so concurrent runs never see a partial entry. When the
+    directory grows past `max_bytes`, the least recently used entries are
+    removed until it is back under `low_water` of that.
+
+    The directory's size is counted once per process and then tracked by
+    every `put`, so writing an entry does not list the directory; writes by
+    other processes are picked up at the next eviction.
+    """
+
+    suffix = '.cache'
+
+    def __init__(self, directory, ttl=3600, max_bytes=64 * 2 ** 20,
+                 low_water=0.8):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._usage = _directory_usage(directory)
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            # `put` reports it; reads just miss
+            pass
+
+    def _path(self, url):
+        key = hashlib.sha256(_normalize_url(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        try:
+            # mark as recently used for LRU eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return CacheEntry(meta['url'], meta['status'], meta['headers'], body,
+                          meta['stored'])
+
+    def is_fresh(self, entry, now=None):
+        return entry is not None and entry.age(now) < self.ttl
+
+    def put(self, url, status, headers, body, stored=None):
+        if stored is None:
+            stored = time.time()
+        meta = {'url': url, 'status': status, 'headers': headers,
+                'stored': stored}
+        path = self._path(url)
+        head = json.dumps(meta).encode('utf-8') + b'\n'
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(head)
+                f.write(body)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        usage = self._usage
+        with usage.lock:
+            if usage.total is None:
+                usage.total = self._scan()[1]
+            else:
+                usage.total += len(head) + len(body) - replaced
+            if usage.total > self.max_bytes:
+                self._evict(usage)
+
+    def _scan(self):
+        """`(entries, total bytes)`, entries as `(mtime, size, name)`."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        return entries, total
+
+    def _evict(self, usage):
+        entries, total = self._scan()
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, name in entries:
+                if total <= self.max_bytes * self.low_water:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                total -= size
+        usage.total = total
+
+    def evict(self):
+        """Remove least recently used entries if over `max_bytes`."""
+        usage = self._usage
+        with usage.lock:
+            self._evict(usage)
+
+    def clear(self):
+        with self._usage.lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.suffix):
+                    os.remove(os.path.join(self.directory, name))
+            self._usage.total = 0
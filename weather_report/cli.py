@@ -1,16 +1,128 @@
+import os
 import sys
+import logging
+import argparse
 
-from .weather_report import WeatherReport
 from .default_config import defaults
 
 
-def main():
+def _parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog='weather_report',
+        description='Save NOAA weather reports and send alerts for each site '
+                    'described by the given input files.')
+    parser.add_argument('input_files', nargs='*',
+                        help='site initialization files (.ini or .dat), bulk '
+                             'files of many sites, or site CSVs')
+    parser.add_argument('--project-file', action='store_true',
+                        help='print a default initialization file and exit')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of sites to run concurrently (default: 1)')
+    parser.add_argument('--summary', action='store_true',
+                        help='print per-site timings and outcomes at the end '
+                             '(always on when --workers > 1)')
+    parser.add_argument('--grid-km', type=float, default=2.5,
+                        help='share one forecast fetch between sites within '
+                             'the same grid cell of this size in km; 0 '
+                             'fetches every site separately (default: 2.5)')
+    parser.add_argument('--compact', action='store_true',
+                        help='hold forecasts in compact form (float32, '
+                             'categoricals, only the columns used for alerts)')
+    parser.add_argument('--state-db', metavar='PATH',
+                        help='keep last-sent times for every site in this '
+                             'SQLite database (overrides state_db_path)')
+    parser.add_argument('--outbox', metavar='PATH',
+                        help='queue emails in this SQLite database and send '
+                             'them in the background with retries '
+                             '(overrides outbox_path)')
+    parser.add_argument('--digest', action='store_true',
+                        help='send each recipient one email covering all of '
+                             'their sites instead of one email per site')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running, waking only when a site is due')
+    parser.add_argument('--poll-minutes', type=float, default=15,
+                        help='in --daemon mode, how often to re-check the '
+                             'forecast of a site whose interval has passed '
+                             'but which did not cross a threshold '
+                             '(default: 15)')
+    parser.add_argument('--render-workers', type=int, default=2,
+                        help='wkhtmltopdf processes allowed at once '
+                             '(default: 2)')
+    parser.add_argument('--render-timeout', type=float, default=120,
+                        help='seconds before a PDF render is killed and '
+                             'retried (default: 120)')
+    parser.add_argument('--metrics-jsonl', metavar='PATH',
+                        help='append a JSON line per timed stage (fetch, '
+                             'parse, cleanup, render, smtp, ...) to PATH')
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help='write per-stage totals to PATH in the '
+                             'Prometheus textfile-collector format')
+    parser.add_argument('--log-file', metavar='PATH',
+                        help='write log records that belong to no site '
+                             '(daemon, outbox, digest) to PATH instead of '
+                             'stderr; INFO and up are logged with --daemon '
+                             'or --log-file, warnings otherwise')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='write cProfile stats for the run to PATH '
+                             '(main thread only; best with -j 1)')
+    return parser.parse_args(args)
 
-    args = sys.argv[1:]
 
-    if any(i in args for i in ["--project-file"]):
+def _run(args):
+    """Dispatch to the requested mode; returns the process exit code."""
+    if args.project_file:
         print(defaults)
+    elif args.daemon:
+        from .daemon import main_daemon
+        return main_daemon(args.input_files, args.workers,
+                           poll_minutes=args.poll_minutes,
+                           grid_km=args.grid_km,
+                           compact=args.compact,
+                           state_db=args.state_db and
+                           os.path.realpath(args.state_db),
+                           outbox=args.outbox and
+                           os.path.realpath(args.outbox),
+                           digest=args.digest)
     else:
-        for i in args:
-            f = WeatherReport.from_input_file(i)
-            f.run()
+        from .runner import main_parallel
+        return main_parallel(args.input_files, args.workers,
+                             grid_km=args.grid_km,
+                             compact=args.compact,
+                             state_db=args.state_db,
+                             outbox=args.outbox,
+                             digest=args.digest,
+                             summary=(args.workers > 1 or args.summary or
+                                      args.digest))
+    return 0
+
+
+def main():
+
+    args = _parse_args(sys.argv[1:])
+
+    from . import logs
+    verbose = args.daemon or args.log_file
+    logs.setup(path=args.log_file and os.path.realpath(args.log_file),
+               process_level=logging.INFO if verbose else logging.WARNING)
+
+    from .render import configure_render_queue
+    configure_render_queue(workers=args.render_workers,
+                           timeout=args.render_timeout)
+
+    from . import metrics
+    metrics.configure(jsonl=args.metrics_jsonl,
+                      prometheus=args.metrics_prom)
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        code = _run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        metrics.export()
+    sys.exit(code)
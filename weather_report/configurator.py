@@ -1,6 +1,21 @@
 import os
+import re
+import csv
+import copy
+import json
+import hashlib
+import tempfile
+import threading
 from configparser import ConfigParser
 
+# sections shared by every site of a bulk file, and the prefix of the
+# per-site sections that override them
+SECTIONS = ['project_info', 'options', 'gmail']
+SITE_PREFIX = 'site:'
+
+# options never written to the config cache; read from the file instead
+SECRETS = ['pwd']
+
 
 def _clean_path(path):
     return path.replace("\\", os.sep)
@@ -25,8 +40,15 @@ def _convert_to_list(string, list_delim=[",", ";"]):
     return [i.strip() for i in string.split(",") if i]
 
 
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+
+
 class WeatherParser(ConfigParser):
 
+    # parsers read one site's file; see `SiteConfig` for bulk files
+    site = None
+
     def __init__(self, filename=None):
         super().__init__(inline_comment_prefixes='#')
 
@@ -37,15 +59,15 @@ class WeatherParser(ConfigParser):
 
         self._directory = None
 
-        self._dict = {}
+        # not `_dict`, which ConfigParser uses for new sections
+        self._parsed = {}
         for sect in self.sections():
-            self._dict[sect] = {}
-            for opt in self.options(sect):
-                self._dict[sect][opt] = self._parse_opt(sect, opt)
+            if not self._is_site(sect):
+                self._parsed[sect] = self._parse_section(sect)
 
     @property
     def dict(self):
-        return self._dict
+        return self._parsed
 
     @property
     def directory(self):
@@ -54,6 +76,68 @@ class WeatherParser(ConfigParser):
                 os.path.dirname(_clean_path(self.filename)))
         return self._directory
 
+    @staticmethod
+    def _is_site(section):
+        return section.lower().startswith(SITE_PREFIX)
+
+    def _parse_section(self, section):
+        return {opt: self._parse_opt(section, opt)
+                for opt in self.options(section)}
+
+    @property
+    def csv_files(self):
+        """CSV files of sites named by `csv_file` in the `[sites]` section."""
+        if not self.has_option('sites', 'csv_file'):
+            return []
+        return [os.path.realpath(os.path.join(self.directory, _clean_path(f)))
+                for f in _convert_to_list(self.get('sites', 'csv_file'))]
+
+    def read_csv(self, path):
+        """Add a `[site: <site_short_name>]` section for each row of a CSV.
+
+        The header names the options; blank cells keep the shared value.
+        """
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for n, row in enumerate(csv.DictReader(f), start=2):
+                values = {k.strip(): v.strip() for k, v in row.items()
+                          if k and v and v.strip()}
+                if 'site_short_name' not in values:
+                    e = '{} line {}: site_short_name is required'.format(
+                        path, n)
+                    raise ValueError(e)
+                self.read_dict(
+                    {SITE_PREFIX + ' ' + values['site_short_name']: values})
+
+    def sites(self):
+        """`(name, options, error)` for every site this file describes.
+
+        A single-site file describes one site named None. In a bulk file
+        the `[project_info]`, `[options]` and `[gmail]` sections hold
+        defaults shared by every `[site: Name]` section (and CSV row), whose
+        options override them. A site whose options do not parse gets its
+        error instead of options, so it does not stop the others.
+        """
+        sections = [s for s in self.sections() if self._is_site(s)]
+        if not sections:
+            return [(None, self.dict, None)]
+
+        sites = []
+        for section in sections:
+            name = section.split(':', 1)[1].strip()
+            try:
+                overrides = self._parse_section(section)
+            except ValueError as e:
+                sites.append((name, None, str(e)))
+                continue
+            options = {s: dict(self.dict.get(s, {})) for s in SECTIONS}
+            overrides.setdefault('site_short_name', name)
+            for opt, val in overrides.items():
+                target = next((s for s in SECTIONS if opt in options[s]),
+                              'project_info')
+                options[target][opt] = val
+            sites.append((name, options, None))
+        return sites
+
     def _parse_opt(self, section, option):
 
         raw = self.get(section, option)
@@ -78,7 +162,7 @@ class WeatherParser(ConfigParser):
         if '_path' in option:
             val = _clean_string(raw)
             path = _clean_path(val)
-            if '_list' in opt:
+            if '_list' in option:
                 path = [os.path.realpath(s.strip())
                         for s in _convert_to_list(path)]
             else:
@@ -93,3 +177,249 @@ class WeatherParser(ConfigParser):
 
         else:
             return raw
+
+
+class SiteConfig(object):
+    """Where one site's options came from.
+
+    Stands in for the `WeatherParser` of a site loaded through
+    `read_sites`: `filename` identifies the site (the file, plus `#name`
+    for a site of a bulk file) and `directory` is the folder its relative
+    paths start from.
+    """
+
+    def __init__(self, path, site=None):
+        self.path = path
+        self.site = site
+
+    @property
+    def filename(self):
+        if self.site is None:
+            return self.path
+        return '{}#{}'.format(self.path, self.site)
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def slug(self):
+        """The site's name made safe for use in a file name."""
+        return _slug(self.site or '')
+
+
+def _stats(paths):
+    out = []
+    for path in paths:
+        st = os.stat(path)
+        out.append([st.st_mtime_ns, st.st_size])
+    return out
+
+
+def _digest(paths, h=None):
+    h = h or hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h
+
+
+def _parse(path):
+    """Parse `path` (and any CSV it names) into a cache entry."""
+    # each file is stat'ed and hashed before it is read, so a change made
+    # while parsing shows up as a different file next time
+    files = [path]
+    stats, h = _stats(files), _digest(files)
+    if path.lower().endswith('.csv'):
+        parser = WeatherParser()
+        parser.filename = path
+        csvs = [path]
+    else:
+        parser = WeatherParser(path)
+        csvs = parser.csv_files
+        files += csvs
+        stats += _stats(csvs)
+        _digest(csvs, h)
+    for f in csvs:
+        parser.read_csv(f)
+    return {'cwd': os.getcwd(), 'files': files, 'stats': stats,
+            'sha1': h.hexdigest(),
+            'sites': [list(s) for s in parser.sites()]}
+
+
+def _read_secrets(entry):
+    """`{site: {option: value}}` of the `SECRETS` in an entry's files."""
+    path = entry['files'][0]
+    parser = WeatherParser()
+    parser.filename = path
+    if path.lower().endswith('.csv'):
+        csvs = [path]
+    else:
+        parser.read(path, encoding='utf-8-sig')
+        csvs = entry['files'][1:]
+    for f in csvs:
+        # only a CSV with a secret column needs reading again
+        with open(f, newline='', encoding='utf-8-sig') as fh:
+            header = next(csv.reader(fh), [])
+        if any(h.strip() in SECRETS for h in header):
+            parser.read_csv(f)
+
+    def secrets(section):
+        return {opt: parser._parse_opt(section, opt) for opt in SECRETS
+                if parser.has_option(section, opt)}
+
+    shared = {}
+    for section in SECTIONS:
+        if parser.has_section(section):
+            shared.update(secrets(section))
+    out = {None: shared}
+    for section in parser.sections():
+        if parser._is_site(section):
+            name = section.split(':', 1)[1].strip()
+            out[name] = dict(shared, **secrets(section))
+    return out
+
+
+def _has_secrets(entry):
+    return any(section.get(opt) is not None
+               for _, options, _ in entry['sites']
+               for section in (options or {}).values() for opt in SECRETS)
+
+
+def _strip_secrets(entry):
+    """A copy of `entry` with its `SECRETS` blanked, for writing out."""
+    entry = copy.deepcopy(entry)
+    entry.pop('restore', None)
+    for _, options, _ in entry['sites']:
+        for section in (options or {}).values():
+            for opt in SECRETS:
+                if opt in section:
+                    section[opt] = None
+    return entry
+
+
+def _restore_secrets(entry):
+    found = _read_secrets(entry)
+    for name, options, _ in entry['sites']:
+        values = found.get(name, found[None])
+        for section in (options or {}).values():
+            for opt in SECRETS:
+                if opt in section:
+                    section[opt] = values.get(opt)
+
+
+class ConfigCache(object):
+    """Parsed site configs, reused while their files are unchanged.
+
+    Entries are kept in memory and in a `.weather_config_cache.json` next
+    to the config files, keyed by path. A file whose mtime and size still
+    match is not parsed; one whose mtime changed is hashed and only parsed
+    again if its contents changed too. Call `save` after loading to write
+    the new entries out for the next process. `SECRETS` such as `pwd` are
+    never written out: entries loaded from disk read them again from the
+    config file itself.
+    """
+
+    filename = '.weather_config_cache.json'
+
+    def __init__(self):
+        self._dirs = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.hashed = 0
+        self.hits = 0
+
+    def _entries(self, directory):
+        entries = self._dirs.get(directory)
+        if entries is None:
+            try:
+                with open(os.path.join(directory, self.filename)) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            for entry in entries.values():
+                if _has_secrets(entry):
+                    # written before secrets were left out; rewrite it
+                    self._dirty.add(directory)
+                entry['restore'] = True
+            self._dirs[directory] = entries
+        return entries
+
+    def _lookup(self, path, entries):
+        entry = entries.get(path)
+        # `_path` options are resolved against the working directory
+        if entry is None or entry.get('cwd') != os.getcwd():
+            return None
+        try:
+            stats = _stats(entry['files'])
+            if stats == entry['stats']:
+                self.hits += 1
+            elif _digest(entry['files']).hexdigest() == entry['sha1']:
+                self.hashed += 1
+                entry['stats'] = stats
+                self._dirty.add(os.path.dirname(path))
+            else:
+                return None
+            if entry.get('restore'):
+                _restore_secrets(entry)
+                del entry['restore']
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def entry(self, path):
+        directory = os.path.dirname(path)
+        with self._lock:
+            entries = self._entries(directory)
+            entry = self._lookup(path, entries)
+            if entry is None:
+                entry = _parse(path)
+                self.parsed += 1
+                entries[path] = entry
+                self._dirty.add(directory)
+        return entry
+
+    def save(self):
+        """Write out the folders whose entries changed since last time."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            for directory in dirty:
+                fd, tmp = None, None
+                try:
+                    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.',
+                                               suffix='.tmp')
+                    entries = {path: _strip_secrets(entry) for path, entry
+                               in self._dirs[directory].items()}
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(entries, f)
+                    os.replace(tmp, os.path.join(directory, self.filename))
+                except OSError:
+                    # read-only folder; the entries stay in memory
+                    if tmp is not None and os.path.exists(tmp):
+                        os.remove(tmp)
+
+
+_config_cache = ConfigCache()
+
+
+def get_config_cache():
+    """Return the process-wide `ConfigCache`."""
+    return _config_cache
+
+
+def read_sites(input_file, cache=None):
+    """`(SiteConfig, options, error)` for every site `input_file` describes.
+
+    `input_file` may be a single-site file, a bulk file of `[site: Name]`
+    sections, or a CSV with one site per row (see `WeatherParser.sites`).
+    Parsed files come from `cache` (default: the process-wide one); pass
+    `cache=False` to always parse.
+    """
+    path = os.path.realpath(_clean_path(input_file))
+    if cache is False:
+        entry = _parse(path)
+    else:
+        entry = (cache or get_config_cache()).entry(path)
+    return [(SiteConfig(path, name), copy.deepcopy(options), error)
+            for name, options, error in entry['sites']]
@@ -0,0 +1,298 @@
+import os
+import heapq
+import signal
+import logging
+import threading
+import time
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .configurator import read_sites, get_config_cache
+from .weather_report import WeatherReport
+from .runner import (
+    SiteResult, share_forecasts, evaluate_alerts, prune_pdf_stores, _run_site)
+from .digest import Digest
+from .outbox import get_outbox, queued_send_msg, drain_outboxes
+from .state import register_reports
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+# same slack `needs_new_pdf` / `needs_alert` allow on their intervals
+_TOLERANCE = 5 * 60
+
+
+def _utc_epoch(naive_utc):
+    return (naive_utc - _EPOCH).total_seconds()
+
+
+def _after_interval(last, hours, now):
+    if last is None:
+        return now
+    return _utc_epoch(last) + max(float(hours) * 3600 - _TOLERANCE, 0)
+
+
+def _after_start_time(when, start):
+    """Push `when` forward to the local `start` (hour, minute) that day."""
+    local = datetime.fromtimestamp(when)
+    if (local.hour, local.minute) >= tuple(start):
+        return when
+    h, m = start
+    return local.replace(hour=h, minute=m, second=0, microsecond=0).timestamp()
+
+
+def next_due(report, now):
+    """Epoch seconds at which `report` next has something that may be due.
+
+    The PDF is due once `pdf_save_interval_hours` has passed and the local
+    time is past `pdf_save_interval_start_time`; the alert once
+    `alert_resend_interval_hours` has passed, if anyone is on the alert
+    list. Whether the forecast crosses a threshold is only known by running.
+    """
+    pdf = _after_interval(report.last_pdf_time,
+                          report.pdf_save_interval_hours, now)
+    due = [_after_start_time(pdf, report.pdf_save_interval_start_time)]
+    if report.alert_email_list:
+        due.append(_after_interval(report.last_alert_time,
+                                   report.alert_resend_interval_hours, now))
+    return min(due)
+
+
+class _Site(object):
+
+    def __init__(self, path, source):
+        # `path` identifies the site, `source` is the file it is read from;
+        # they differ for the sites of a bulk file
+        self.path = path
+        self.source = source
+        self.report = None
+        self.version = 0
+
+
+class Scheduler(object):
+    """Run many sites from one long-lived process.
+
+    Every site is loaded once and kept in a heap keyed by its next due time
+    (see `next_due`). The scheduler sleeps until the earliest one, runs
+    only the sites that are due on a pool of `workers` threads, and puts
+    them back with their new due time. A site whose interval has passed
+    but whose forecast did not cross a threshold is checked again after
+    `poll_minutes`. Config files are checked for changes every
+    `reload_seconds` and reloaded when they change; a bulk file adds,
+    replaces or drops its sites as a whole. With `digest`, the emails of
+    all sites run together are sent as one per recipient.
+    """
+
+    def __init__(self, input_files, workers=1, poll_minutes=15,
+                 reload_seconds=30, grid_km=2.5, compact=False,
+                 state_db=None, digest=False, outbox=None, clock=time.time):
+        self.workers = max(1, int(workers))
+        self.poll_seconds = float(poll_minutes) * 60
+        self.reload_seconds = float(reload_seconds)
+        self.grid_km = grid_km
+        self.compact = compact
+        self.state_db = state_db
+        self.digest = digest
+        self.outbox = outbox
+        self.clock = clock
+
+        self._files = OrderedDict()
+        self._sites = {}
+        self._heap = []
+        self._seq = 0
+        self._stop = threading.Event()
+
+        for path in input_files:
+            self._files[os.path.realpath(path)] = None
+        self.reload()
+
+    def _push(self, site, when):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, site.version, site.path))
+
+    def _load(self, site, config, options, error):
+        """Load `site`'s report; the caller schedules it."""
+        site.version += 1
+        site.report = None
+        try:
+            if error is not None:
+                raise ValueError(error)
+            report = WeatherReport.from_options(options, config)
+        except Exception as e:
+            logger.exception('Could not load {}: {}'.format(site.path, e))
+            return
+        if self.compact:
+            report.compact_mode_bool = True
+        if self.state_db:
+            report.state_db_path = self.state_db
+        if self.outbox:
+            report.outbox_path = self.outbox
+        if report.outbox is not None:
+            # resume delivering mail queued before a restart
+            report.outbox.start()
+        site.report = report
+        logger.info('Loaded {}'.format(site.path))
+
+    def _load_file(self, path):
+        try:
+            configs = read_sites(path)
+        except Exception as e:
+            logger.exception('Could not load {}: {}'.format(path, e))
+            configs = []
+
+        loaded = set()
+        sites = []
+        for config, options, error in configs:
+            key = config.filename
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = _Site(key, path)
+            self._load(site, config, options, error)
+            loaded.add(key)
+            if site.report is not None:
+                sites.append(site)
+        # one state transaction for the whole file, not one per site
+        register_reports([site.report for site in sites])
+        now = self.clock()
+        for site in sites:
+            self._push(site, next_due(site.report, now))
+        for key, site in list(self._sites.items()):
+            if site.source == path and key not in loaded:
+                # its heap entries are skipped from now on
+                del self._sites[key]
+                logger.info('Dropped {}'.format(key))
+
+    def reload(self):
+        """(Re)load the sites of every config file whose contents changed.
+
+        A file counts as changed when its `ConfigCache` hash does, so any
+        CSV of sites it names is watched too and touching a file without
+        editing it reloads nothing.
+        """
+        cache = get_config_cache()
+        for path, sha1 in list(self._files.items()):
+            try:
+                current = cache.entry(path)['sha1']
+            except Exception:
+                # logged by `_load_file` the first time
+                current = False
+            if current != sha1:
+                self._files[path] = current
+                self._load_file(path)
+        cache.save()
+
+    def pop_due(self, now):
+        """Remove and return every site due at or before `now`."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, version, path = heapq.heappop(self._heap)
+            site = self._sites.get(path)
+            # entries from before a reload are stale
+            if site is not None and version == site.version and \
+                    site.report is not None:
+                due.append(site)
+        return due
+
+    def seconds_until_next(self, now):
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - now, 0)
+
+    def run_due(self, sites, pool=None):
+        """Run `sites` once and reschedule them; returns their results."""
+        reports = [s.report for s in sites]
+        collector = None
+        if self.digest:
+            collector = Digest()
+        for report in reports:
+            report.reset()
+            report.forecast_source = None
+            report.digest = collector
+        if self.grid_km:
+            share_forecasts(reports, km=self.grid_km)
+        evaluate_alerts(reports, pool)
+
+        jobs = []
+        for report in reports:
+            result = SiteResult(report.config.filename, report.site_short_name,
+                                silent=bool(report.silent_mode_bool))
+            jobs.append((report, result))
+
+        if pool is None or len(jobs) <= 1:
+            results = [_run_site(*job) for job in jobs]
+        else:
+            results = list(pool.map(lambda job: _run_site(*job), jobs))
+        if collector is not None:
+            send_msg = None
+            if self.outbox:
+                send_msg = queued_send_msg(get_outbox(self.outbox),
+                                           kind='digest')
+            collector.send(send_msg)
+        prune_pdf_stores(reports)
+
+        now = self.clock()
+        for site, result in zip(sites, results):
+            if not result.ok:
+                logger.error('{} failed: {}'.format(site.path, result.error))
+            due = next_due(site.report, now)
+            if due <= now:
+                # nothing crossed a threshold; look again later
+                due = now + self.poll_seconds
+            self._push(site, due)
+            # free the forecast until the next run, including the shared
+            # one that every site of its grid group points at
+            site.report.reset()
+            site.report.forecast_source = None
+            site.report.grid_key = None
+            site.report.digest = None
+        return results
+
+    def stop(self, *args):
+        self._stop.set()
+
+    def serve_forever(self):
+        pool = None
+        if self.workers > 1:
+            pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while not self._stop.is_set():
+                self.reload()
+                now = self.clock()
+                due = self.pop_due(now)
+                if due:
+                    results = self.run_due(due, pool)
+                    metrics.export()
+                    logger.info(
+                        'Ran {} due sites, {} failed, {} skipped the forecast '
+                        'fetch, {} reused an unchanged PDF'.format(
+                            len(results),
+                            sum(not r.ok for r in results),
+                            sum(not r.fetched for r in results),
+                            sum(r.reused for r in results)))
+                    continue
+
+                wait = self.seconds_until_next(now)
+                if wait is None or wait > self.reload_seconds:
+                    wait = self.reload_seconds
+                self._stop.wait(wait)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+
+def main_daemon(input_files, workers=1, poll_minutes=15, grid_km=2.5,
+                compact=False, state_db=None, digest=False, outbox=None):
+    scheduler = Scheduler(input_files, workers=workers,
+                          poll_minutes=poll_minutes, grid_km=grid_km,
+                          compact=compact, state_db=state_db, digest=digest,
+                          outbox=outbox)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, scheduler.stop)
+    try:
+        scheduler.serve_forever()
+    finally:
+        drain_outboxes()
+    return 0
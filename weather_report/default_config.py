@@ -71,6 +71,14 @@ alert_email_list = <you@domain.com> , other_staff@domain.com
 attach_alert_pdf_bool = false
 alert_resend_interval_hours = 12
 
+# Further alert conditions, as `<variable> <op> <value>` with an optional
+# `for <n>h` to require n consecutive forecast hours. Variables are precip,
+# gust, wind, temp and humidity; ops are >=, >, <= and <. Write percentages
+# without the '%' sign. An alert is sent when alert_threshold_value or any
+# of these is met, e.g.:
+#   alert_rules_list = gust >= 35, precip >= 40 for 3h, temp <= 32
+alert_rules_list =
+
 
 [options]
 # built-in pages are as follows:
@@ -83,6 +91,42 @@ alert_resend_interval_hours = 12
 pdf_content_order_list = 1,2,3
 silent_mode_bool = false
 
+# NOAA pages are cached in a `.weather_cache` folder next to this file and
+# reused for this many minutes, so repeated runs don't download them again.
+# Set to 0 to always fetch.
+cache_ttl_minutes = 60
+
+# Keep only the columns used for alerts in memory, in a compact form. Useful
+# when one process handles many sites.
+compact_mode_bool = false
+
+# Where the forecast table comes from: `digital` scrapes NOAA's tabular
+# MapClick page; `gridpoint` reads the same hourly values from the
+# api.weather.gov JSON, which is smaller and faster to parse. The PDF still
+# shows the MapClick pages either way.
+forecast_backend = digital
+
+# api.weather.gov (or a mirror of it) for the gridpoint backend. Leave blank
+# for https://api.weather.gov.
+gridpoint_base_url =
+
+# Folder (relative to this file) in which every parsed forecast is archived
+# as Parquet for later analysis. Requires `pyarrow`. Leave blank to disable.
+archive_folder =
+
+# Keep the last-sent times for PDFs and alerts in this SQLite database
+# instead of the `.pdf_last_saved` / `.alert_last_sent` files. Sites may share
+# one database. Existing timestamp files are imported on first use.
+state_db_path =
+
+# Queue outgoing emails in this SQLite database and deliver them in the
+# background, retrying failed sends with exponential backoff, instead of
+# sending them while the site runs. Delivery outcomes are recorded in the
+# state database, so that an email the outbox gives up on makes the site due
+# again; without state_db_path, the outbox file also holds the last-sent
+# times. Leave blank to send immediately.
+outbox_path =
+
 # List additional urls to append to the report separated by a comma.
 # New lines must break at commas and be indented by at least one space.
 # These will be appended at the end of the pdf in order.
@@ -93,4 +137,12 @@ additional_urls_list =
 # --- REQUIRED if sending email --- #
 user =
 pwd =
+
+# SMTP server as host:port. Leave blank to use smtp.gmail.com:587.
+smtp_host =
+
+# Sessions are encrypted with STARTTLS and the server's certificate is
+# checked; a server that does not offer STARTTLS is refused. Set to False
+# only for a trusted local relay, e.g. localhost.
+smtp_tls_bool =
 '''
@@ -0,0 +1,191 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from .helper import _lazy_import
+from . import metrics
+
+pandas = _lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+PRECIP_LABEL = 'Precipitation Potential (%)'
+
+_HEADER = '''
+        <p><TT>
+        This is an automated message sent
+        from the Water and Natural
+        Resources Group in Oakland, CA.</TT>
+        '''
+
+_SECTION = '''
+        <p><TT>{}</TT>
+        <ul>{}</ul>
+        '''
+
+_FOOTER = '''
+        <p><TT>{}</TT>
+        <hr>
+        <p><TT>
+        To remove yourself from these messages
+        contact {}.
+        </TT>
+        '''
+
+
+class Notice(object):
+    """One PDF or alert email a site would have sent on its own.
+
+    `on_sent` is called once every recipient's digest carrying the notice
+    has been sent.
+    """
+
+    def __init__(self, report, kind, recipients, attachments=None,
+                 on_sent=None):
+        self.kind = kind
+        self.on_sent = on_sent
+        self.site = report.site_short_name
+        self.recipients = list(recipients)
+        self.attachments = [a for a in attachments or [] if a]
+        self.threshold = report.alert_threshold_value
+        self.precip_max = report.precip_max
+        self.source = report.urls[1]
+        self.contact = report.primary_contact_name
+        self.conditions = report.alert_conditions if kind == 'alert' else []
+        self.account = (report.smtp_host, report.user, report.pwd,
+                        report.smtp_tls_bool)
+
+        # copied now; the report frees its forecast after the run
+        table = report.precip_table.rename(
+            columns={report.precip_column: PRECIP_LABEL})
+        table.insert(0, 'Site', self.site)
+        self.table = table
+
+    @property
+    def line(self):
+        if self.kind == 'alert' and self.conditions:
+            return '{}: {} expected'.format(self.site,
+                                            '; '.join(self.conditions))
+        if self.kind == 'alert':
+            return ('{}: greater than {}% chance of rain expected '
+                    '(max {}%)'.format(self.site, self.threshold,
+                                       self.precip_max))
+        return '{}: {}% chance of rain in the next 48 hrs'.format(
+            self.site, self.precip_max)
+
+
+class Digest(object):
+    """Collects the PDF and alert emails of a multi-site run.
+
+    Sites with a digest attached (`WeatherReport.digest`) hand their
+    emails to `add` instead of sending them. `send` then sends every
+    recipient one message listing all of their alerts and forecast
+    notices, with a combined table built from each site's `precip_table`
+    and each distinct PDF attached once, so a run sends one email per
+    recipient rather than one per site and recipient.
+    """
+
+    def __init__(self):
+        self._notices = []
+        self._lock = threading.Lock()
+        self.replaced = 0
+        self.sent = 0
+        self.failed = 0
+
+    def add(self, report, kind, recipients, attachments=None, on_sent=None):
+        notice = Notice(report, kind, recipients, attachments, on_sent)
+        with self._lock:
+            self._notices.append(notice)
+
+    def __len__(self):
+        return len(self._notices)
+
+    def by_recipient(self):
+        """Notices grouped by `(account, recipient)`, in the order added."""
+        return self._by_recipient(self._notices)
+
+    @staticmethod
+    def _by_recipient(notices):
+        groups = OrderedDict()
+        for notice in notices:
+            for recipient in notice.recipients:
+                groups.setdefault((notice.account, recipient), []).append(
+                    notice)
+        return groups
+
+    def _message(self, notices):
+        alerts = [n for n in notices if n.kind == 'alert']
+        pdfs = [n for n in notices if n.kind == 'pdf']
+
+        parts = []
+        if alerts:
+            parts.append('{} site alert{}'.format(
+                len(alerts), '' if len(alerts) == 1 else 's'))
+        if pdfs:
+            parts.append('{} forecast{}'.format(
+                len(pdfs), '' if len(pdfs) == 1 else 's'))
+        subject = 'NOAA Forecast Digest: {}.'.format(' and '.join(parts))
+
+        body = [_HEADER]
+        for title, group in [('ALERTS:', alerts), ('Forecasts:', pdfs)]:
+            if group:
+                items = ''.join('<li><TT>{}</TT></li>'.format(n.line)
+                                for n in group)
+                body.append(_SECTION.format(title, items))
+
+        # a site on both lists would otherwise appear twice
+        sites = OrderedDict()
+        for n in notices:
+            sites.setdefault(n.site, n)
+        table = pandas.concat([n.table for n in sites.values()],
+                              ignore_index=True)
+        sources = ''.join('<br>{}: {}'.format(n.site, n.source)
+                          for n in sites.values())
+        contacts = sorted(set(n.contact for n in notices))
+        body.append(_FOOTER.format(
+            table.to_html(index=False) + '<p><TT>Sources:' + sources,
+            ', '.join(contacts)))
+
+        attachments = list(OrderedDict.fromkeys(
+            a for n in notices for a in n.attachments))
+        return subject, ''.join(body), attachments
+
+    def send(self, send_msg=None):
+        """Send one message per recipient; returns the number sent.
+
+        Notices whose digests were all sent then get their `on_sent`
+        call; a notice that missed a recipient does not, so its site is
+        due again next run.
+        """
+        if send_msg is None:
+            from .email_handler import send_msg
+        with self._lock:
+            all_notices, self._notices = self._notices, []
+        failed = set()
+        for ((host, user, pwd, tls), recipient), notices in \
+                self._by_recipient(all_notices).items():
+            subject, body, attachments = self._message(notices)
+            try:
+                with metrics.span('smtp', kind='digest', notices=len(notices)):
+                    send_msg(user, pwd, [recipient], subject, body,
+                             attachments=attachments, verbose=False,
+                             host=host, tls=tls)
+            except Exception as e:
+                self.failed += 1
+                failed.update(id(n) for n in notices)
+                logger.exception('Digest to {} failed: {}'.format(
+                    recipient, e))
+                continue
+            self.sent += 1
+            self.replaced += len(notices)
+            logger.info('Digest of {} notices sent to {}'.format(
+                len(notices), recipient))
+        for notice in all_notices:
+            if notice.on_sent is None or id(notice) in failed:
+                continue
+            try:
+                notice.on_sent()
+            except Exception as e:
+                logger.exception('Could not record {} of {}: {}'.format(
+                    notice.kind, notice.site, e))
+        return self.sent
@@ -1,17 +1,48 @@
 import smtplib
+import ssl
 import os
+import re
 import sys
+import time
+import uuid
+import atexit
+import base64
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
 import email
+from email.message import Message
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
-from email import encoders
 from html.parser import HTMLParser
 
 if not sys.version_info[:2][0] == (3):
     e = 'Python 3.x required'
     raise ImportError(e)
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = 'smtp.gmail.com:587'
+
+# a session that fails one of these mid-send is reconnected and retried once
+_RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected,
+                     smtplib.SMTPConnectError, ConnectionError)
+
+_default_lock = threading.Lock()
+
+# base64 lines are 76 characters, i.e. 57 input bytes, plus CRLF
+_B64_LINE_IN = 57
+_B64_LINE_OUT = 78
+_BLOCK_LINES = 1024
+_SEND_BUFFER = 64 * 1024
+
+_EOL = re.compile(rb'\r\n|\r|\n')
+_LEADING_DOT = re.compile(rb'(?m)^\.')
+
 
 class MLStripper(HTMLParser):
 
@@ -36,64 +67,361 @@ def strip_tags(html):
     return s.read(html)
 
 
-def send_msg(user, pwd, recipients, subject, htmlmsgtext, attachments=None, verbose=False):
+def _wire(text):
+    """SMTP DATA bytes for `text`: CRLF line endings, leading dots doubled."""
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return _LEADING_DOT.sub(b'..', _EOL.sub(b'\r\n', text))
+
+
+def _file_digest(path, blocksize=1 << 16):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class AttachmentCache(object):
+    """Base64 encodings of attachment files, made once per file content.
+
+    Encodings are spooled to files in a private temporary directory, keyed
+    by the SHA-256 of the attachment, and streamed back in fixed-size
+    blocks, so the same PDF attached to several emails is read and encoded
+    once and never held in memory whole. The `keep` most recently used
+    encodings are kept.
+    """
+
+    def __init__(self, keep=32):
+        self.keep = keep
+        self.encodes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._directory = None
+
+    def _path(self, digest):
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='weather_report_mime_')
+        return os.path.join(self._directory, digest + '.b64')
+
+    def _encode(self, source, target):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                blocksize = _B64_LINE_IN * _BLOCK_LINES
+                for block in iter(lambda: src.read(blocksize), b''):
+                    dst.write(base64.encodebytes(block).replace(b'\n', b'\r\n'))
+            os.replace(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def encoded(self, path):
+        """Path of the CRLF-wrapped base64 encoding of the file at `path`."""
+        digest = _file_digest(path)
+        with self._lock:
+            target = self._path(digest)
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                return target
+            self._encode(path, target)
+            self.encodes += 1
+            self._entries[digest] = target
+            while len(self._entries) > self.keep:
+                _, old = self._entries.popitem(last=False)
+                os.remove(old)
+            return target
+
+    def iter_encoded(self, path):
+        """Yield the encoding of `path` in blocks of whole lines."""
+        with open(self.encoded(path), 'rb') as f:
+            for block in iter(lambda: f.read(_B64_LINE_OUT * _BLOCK_LINES), b''):
+                yield block
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+
+
+_default_cache = None
+
+
+def get_attachment_cache():
+    """Return the process-wide shared `AttachmentCache`."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = AttachmentCache()
+            atexit.register(_default_cache.clear)
+        return _default_cache
+
+
+def _attachment_header(filename):
+    part = MIMEBase('application', 'octet-stream')
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition',
+                    'attachment; filename="%s"' % os.path.basename(filename))
+    return part.as_bytes()
+
+
+def iter_message(user, recipients, subject, htmlmsgtext, attachments=None,
+                 cache=None):
+    """Yield the message as SMTP DATA bytes, one part at a time.
+
+    Only the text parts are built in memory; attachments are streamed from
+    `cache` (see `AttachmentCache`).
+    """
+    # Make text version from HTML - First convert tags that produce a line
+    # break to carriage returns
+    msgtext = htmlmsgtext.replace(
+        '</br>', "\r").replace('<br />', "\r").replace('</p>', "\r")
+    # Then strip all the other tags out
+    msgtext = strip_tags(msgtext)
+
+    if cache is None:
+        cache = get_attachment_cache()
+    boundary = '=' * 15 + uuid.uuid4().hex + '=='
+
+    # necessary mimey stuff
+    head = Message()
+    head['Content-Type'] = 'multipart/mixed; boundary="{}"'.format(boundary)
+    head['MIME-Version'] = '1.0'
+    head['From'] = user
+    head['To'] = ", ".join(recipients)
+    head['Subject'] = subject
+    # headers only; the parts follow
+    yield _wire(b''.join(head.policy.fold_binary(k, v)
+                         for k, v in head.raw_items()) + b'\n')
+    yield _wire('This is a multi-part message in MIME format.\n')
+
+    body = MIMEMultipart('alternative')
+    body.attach(MIMEText(msgtext))
+    body.attach(MIMEText(htmlmsgtext, 'html'))
+    yield _wire('--{}\n'.format(boundary).encode('ascii') + body.as_bytes()
+                + b'\n')
+
+    for filename in attachments or []:
+        yield _wire('--{}\n'.format(boundary).encode('ascii')
+                    + _attachment_header(filename))
+        for block in cache.iter_encoded(filename):
+            yield block
+
+    yield _wire('--{}--\n'.format(boundary))
+
+
+def _send_stream(server, from_addr, to_addrs, chunks):
+    """`SMTP.sendmail`, writing the DATA section chunk by chunk."""
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(from_addr)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    refused = {}
+    for addr in to_addrs:
+        code, resp = server.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, resp)
+    if len(refused) == len(to_addrs):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, resp = server.docmd('data')
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    # coalesce the small header and text parts; many tiny writes stall on
+    # Nagle's algorithm and delayed ACKs
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) >= _SEND_BUFFER:
+            server.send(bytes(buf))
+            buf.clear()
+    buf += b'.\r\n'
+    server.send(bytes(buf))
+    code, resp = server.getreply()
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+class _Session(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.last_used = time.monotonic()
+
+
+class SMTPPool(object):
+    """Logged-in SMTP sessions kept open between sends.
+
+    Sessions are keyed by `(host, user, tls)`, so every site sending through
+    the same account shares them. An idle session is checked with `NOOP` before
+    it is reused and is dropped once it has been idle for `max_idle_seconds`
+    (servers hang up on idle clients anyway). A send that fails because the
+    server went away is retried once on a fresh session.
+
+    Sessions are encrypted with STARTTLS, verifying the server's certificate
+    against `ssl_context` (the system's trusted CAs by default); a server
+    that does not offer STARTTLS is refused, as is one that does not offer
+    AUTH when there is a password. Plain sessions are only opened for sends
+    made with `tls=False`, e.g. to a local relay.
+    """
+
+    def __init__(self, timeout=30, max_idle_per_key=2, max_idle_seconds=240,
+                 factory=smtplib.SMTP, ssl_context=None):
+        self.timeout = timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.max_idle_seconds = max_idle_seconds
+        self.factory = factory
+        self._ssl_context = ssl_context
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _connect(self, key, pwd):
+        host, user, tls = key
+        # smtplib checks the certificate against the name it was given, so
+        # it must not be handed 'host:port'
+        name, colon, port = host.rpartition(':')
+        if colon and port.isdigit():
+            server = self.factory(name, int(port), timeout=self.timeout)
+        else:
+            server = self.factory(host, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if tls:
+                # raises SMTPNotSupportedError rather than sending in clear
+                server.starttls(context=self.ssl_context)
+                server.ehlo()
+            if user and pwd:
+                server.login(user, pwd)
+        except BaseException:
+            server.close()
+            raise
+        logger.debug('Opened {}SMTP session to {} as {}'.format(
+            '' if tls else 'plain ', host, user))
+        return _Session(server)
+
+    def _healthy(self, session):
+        if time.monotonic() - session.last_used > self.max_idle_seconds:
+            return False
+        try:
+            return session.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self, key, pwd):
+        """Return `(session, reused)` for `key`, a `(host, user, tls)`."""
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                session = idle.pop() if idle else None
+            if session is None:
+                return self._connect(key, pwd), False
+            if self._healthy(session):
+                return session, True
+            self._discard(session)
+
+    def _release(self, key, session):
+        session.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append(session)
+                return
+        self._discard(session, quit=True)
+
+    def _discard(self, session, quit=False):
+        try:
+            if quit:
+                session.server.quit()
+            else:
+                session.server.close()
+        except (smtplib.SMTPException, OSError):
+            session.server.close()
+
+    def _send(self, session, from_addr, to_addrs, msg):
+        if callable(msg):
+            return _send_stream(session.server, from_addr, to_addrs, msg())
+        return session.server.sendmail(from_addr, to_addrs, msg)
+
+    def sendmail(self, host, user, pwd, from_addr, to_addrs, msg, tls=True):
+        """Send `msg` through a pooled session.
+
+        `msg` is a string, or a callable returning an iterable of SMTP DATA
+        chunks (see `iter_message`); it is called again if the send has to
+        be retried. `tls=False` sends without STARTTLS.
+        """
+        key = (host or DEFAULT_HOST, user, bool(tls))
+        session, reused = self._acquire(key, pwd)
+        try:
+            self._send(session, from_addr, to_addrs, msg)
+        except _RECONNECT_ERRORS:
+            self._discard(session)
+            if not reused:
+                raise
+            # the server dropped a kept-alive session; try once more
+            session = self._connect(key, pwd)
+            try:
+                self._send(session, from_addr, to_addrs, msg)
+            except BaseException:
+                self._discard(session)
+                raise
+        except BaseException:
+            # the session may be mid-transaction; don't hand it out again
+            self._discard(session)
+            raise
+        self._release(key, session)
+
+    def close(self):
+        """Quit every idle session."""
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+        for session in sessions:
+            self._discard(session, quit=True)
+
+
+_default_pool = None
+
+
+def get_smtp_pool():
+    """Return the process-wide shared `SMTPPool`."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = SMTPPool()
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+def send_msg(user, pwd, recipients, subject, htmlmsgtext, attachments=None,
+             verbose=False, host=None, pool=None, tls=True):
 
     try:
-        # Make text version from HTML - First convert tags that produce a line
-        # break to carriage returns
-        msgtext = htmlmsgtext.replace(
-            '</br>', "\r").replace('<br />', "\r").replace('</p>', "\r")
-        # Then strip all the other tags out
-        msgtext = strip_tags(msgtext)
-
-        # necessary mimey stuff
-        msg = MIMEMultipart()
-        msg.preamble = 'This is a multi-part message in MIME format.\n'
-        msg.epilogue = ''
-
-        body = MIMEMultipart('alternative')
-        body.attach(MIMEText(msgtext))
-        body.attach(MIMEText(htmlmsgtext, 'html'))
-        msg.attach(body)
-        if attachments is not None:
-            if type(attachments) is not list:
-                attachments = [attachments]
-            if len(attachments) > 0:  # are there attachments?
-                for filename in attachments:
-                    f = filename
-                    part = MIMEBase('application', "octet-stream")
-                    part.set_payload(open(f, "rb").read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition', 'attachment; filename="%s"' % os.path.basename(f))
-                    msg.attach(part)
-
-        msg.add_header('From', user)
-        msg.add_header('To', ", ".join(recipients))
-        msg.add_header('Subject', subject)
-#         msg.add_header('Reply-To', replyto)
+        if attachments is not None and type(attachments) is not list:
+            attachments = [attachments]
+
+        def message():
+            return iter_message(user, recipients, subject, htmlmsgtext,
+                                attachments)
 
         # The actual email sendy bits
-        host = 'smtp.gmail.com:587'
-        server = smtplib.SMTP(host)
-        server.set_debuglevel(False)  # set to True for verbose output
-        try:
-            # gmail expect tls
-            server.starttls()
-            server.login(user, pwd)
-            server.sendmail(user, recipients, msg.as_string())
-            if verbose:
-                print('Email sent to {}'.format(recipients))
-            server.quit()  # bye bye
-        except:
-            # if tls is set for non-tls servers you would have raised an
-            # exception, so....
-            server.login(user, pwd)
-            server.sendmail(user, recipients, msg.as_string())
-            if verbose:
-                print('Email sent to {}'.format(recipients))
-            server.quit()  # sbye bye
-    except:
+        if pool is None:
+            pool = get_smtp_pool()
+        pool.sendmail(host, user, pwd, user, recipients, message, tls=tls)
+        if verbose:
+            print('Email sent to {}'.format(recipients))
+    except Exception:
         print('Email NOT sent to {} successfully. ERR: {} {} {} '.format(str(recipients),
                                                                          str(sys.exc_info()[
                                                                              0]),
@@ -101,4 +429,3 @@ def send_msg(user, pwd, recipients, subject, htmlmsgtext, attachments=None, verb
                                                                              1]),
                                                                          str(sys.exc_info()[2])))
         raise
-        #just in case
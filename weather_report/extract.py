@@ -0,0 +1,133 @@
+import io
+import re
+import csv
+
+import pandas
+from lxml import etree
+
+
+_RE_WHITESPACE = re.compile(r'[\r\n]+|\s{2,}')
+
+# first-column labels that identify the digital forecast table
+_SIGNATURE = ('date', 'hour')
+
+
+def _cell_text(cell):
+    # same normalization `pandas.read_html` applies to cell text
+    text = ''.join(cell.itertext())
+    return _RE_WHITESPACE.sub(' ', text).strip()
+
+
+def _span(cell, attr):
+    try:
+        return max(int(cell.get(attr, 1)), 1)
+    except ValueError:
+        return 1
+
+
+def _direct_rows(table):
+    rows = []
+    for child in table:
+        if child.tag == 'tr':
+            rows.append(child)
+        elif child.tag in ('thead', 'tbody', 'tfoot'):
+            rows.extend(r for r in child if r.tag == 'tr')
+    return rows
+
+
+def _is_forecast_table(rows, min_rows):
+    if len(rows) <= min_rows:
+        return False
+    labels = set()
+    for row in rows:
+        for cell in row:
+            if cell.tag in ('td', 'th'):
+                labels.add(_cell_text(cell).lower().split(' ')[0])
+                break
+    return all(i in labels for i in _SIGNATURE)
+
+
+def _expand_rows(rows):
+    """Cell text for each row with colspan/rowspan repeated like read_html."""
+    out = []
+    pending = {}
+    for row in rows:
+        texts = []
+        col = 0
+        cells = [c for c in row if c.tag in ('td', 'th')]
+        for cell in cells:
+            while col in pending:
+                text, left = pending.pop(col)
+                texts.append(text)
+                if left > 1:
+                    pending[col] = (text, left - 1)
+                col += 1
+            text = _cell_text(cell)
+            rowspan = _span(cell, 'rowspan')
+            for _ in range(_span(cell, 'colspan')):
+                texts.append(text)
+                if rowspan > 1:
+                    pending[col] = (text, rowspan - 1)
+                col += 1
+        while col in pending:
+            text, left = pending.pop(col)
+            texts.append(text)
+            if left > 1:
+                pending[col] = (text, left - 1)
+            col += 1
+        out.append(texts)
+    return out
+
+
+def _to_frame(rows):
+    """Frame of cell texts typed the way `pandas.read_html` types them.
+
+    `read_html` hands the cells to pandas' CSV type inference, so the rows
+    go through `pandas.read_csv`: empty cells become NaN and numeric
+    columns numbers.
+    """
+    width = max(len(r) for r in rows)
+    buf = io.StringIO()
+    csv.writer(buf).writerows(r + [''] * (width - len(r)) for r in rows)
+    buf.seek(0)
+    return pandas.read_csv(buf, header=None, thousands=',',
+                           skip_blank_lines=False)
+
+
+def extract_forecast_table(html, min_rows=16, encoding=None):
+    """Stream `html` and return only the NOAA digital forecast table.
+
+    The page is parsed incrementally and parsing stops as soon as the first
+    table with more than `min_rows` rows whose first column holds the
+    `Date` and `Hour` labels closes; no other table is converted. The
+    result matches the frame `pandas.read_html` returns for that table.
+    Returns `None` if no table on the page looks like the forecast, so the
+    caller can fall back to `pandas.read_html`.
+
+    `html` may be text or bytes; for bytes, pass the `encoding` from the
+    response headers when it is known.
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+        encoding = 'utf-8'
+
+    rows = None
+    context = etree.iterparse(io.BytesIO(html), events=('end',), tag='table',
+                              html=True, recover=True, encoding=encoding)
+    try:
+        for _, table in context:
+            candidate = _direct_rows(table)
+            if _is_forecast_table(candidate, min_rows):
+                if all(c.tag == 'th' for c in candidate[0]):
+                    # read_html would promote this row to a header
+                    return None
+                rows = _expand_rows(candidate)
+                break
+    except etree.LxmlError:
+        return None
+    finally:
+        del context
+
+    if not rows:
+        return None
+    return _to_frame(rows)
@@ -0,0 +1,255 @@
+import gzip
+import zlib
+import logging
+import threading
+import http.client
+from collections import OrderedDict
+from urllib.parse import urlsplit, urljoin
+
+from . import __version__
+
+logger = logging.getLogger(__name__)
+
+
+class FetchError(IOError):
+    pass
+
+
+class Response(object):
+
+    def __init__(self, url, status, headers, body, not_modified=False,
+                 from_cache=False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.not_modified = not_modified
+        self.from_cache = from_cache
+
+    @property
+    def etag(self):
+        return self.headers.get('etag')
+
+    @property
+    def last_modified(self):
+        return self.headers.get('last-modified')
+
+    @property
+    def validator(self):
+        """The token that identifies this version of the page, if any."""
+        return self.etag or self.last_modified
+
+    @property
+    def charset(self):
+        ctype = self.headers.get('content-type', '')
+        for param in ctype.split(';')[1:]:
+            k, _, v = param.strip().partition('=')
+            if k.lower() == 'charset' and v:
+                return v.strip('"\'')
+        return 'utf-8'
+
+    @property
+    def text(self):
+        try:
+            return self.body.decode(self.charset)
+        except (LookupError, UnicodeDecodeError):
+            return self.body.decode('latin-1')
+
+
+def _decode_body(body, encoding):
+    encoding = (encoding or '').lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def _request_target(parts):
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return path
+
+
+class Fetcher(object):
+    """Thread-safe HTTP(S) client shared by every site in a process.
+
+    Connections are kept alive and reused per host, responses are requested
+    gzip-compressed, and every page that carried an `ETag` or `Last-Modified`
+    header is revalidated with a conditional GET, so an unchanged page costs
+    a `304 Not Modified` rather than a full download. The last
+    `max_validated` such pages are kept in memory to answer those 304s.
+    """
+
+    max_redirects = 5
+
+    def __init__(self, timeout=30, max_idle_per_host=4, user_agent=None,
+                 max_validated=256):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.max_validated = max_validated
+        if user_agent is None:
+            user_agent = 'weather_report/{}'.format(__version__)
+        self.user_agent = user_agent
+
+        self._lock = threading.Lock()
+        self._idle = {}
+        # url: last validated response, least recently used first
+        self._validated = OrderedDict()
+
+    def _connect(self, scheme, netloc):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        if scheme == 'http':
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        raise FetchError('unsupported url scheme: {}'.format(scheme))
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    @property
+    def validated_nbytes(self):
+        """Memory held by the page bodies kept for revalidation."""
+        with self._lock:
+            return sum(len(r.body) for r in self._validated.values())
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _send(self, url, headers):
+        parts = urlsplit(url)
+        key = (parts.scheme.lower(), parts.netloc)
+        target = _request_target(parts)
+
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request('GET', target, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused:
+                    # the server dropped an idle keep-alive connection;
+                    # retry once on a fresh one.
+                    continue
+                raise FetchError('GET {} failed: {}'.format(url, e))
+
+            resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return resp.status, resp_headers, body
+
+    def get(self, url, revalidate=True, cache=None):
+        """Fetch `url` and return a `Response` with a decoded body.
+
+        If a previous response for `url` carried validators, the request is
+        made conditional and a 304 returns the previous body with
+        `not_modified` set. With a `ResponseCache`, a fresh entry is returned
+        without touching the network and a stale one supplies the
+        validators.
+        """
+        url = url.split('#')[0]
+        previous = None
+        if revalidate:
+            with self._lock:
+                previous = self._validated.get(url)
+                if previous is not None:
+                    self._validated.move_to_end(url)
+
+        entry = cache.get(url) if cache is not None else None
+        if entry is not None:
+            if cache.is_fresh(entry):
+                return Response(url, entry.status, entry.headers, entry.body,
+                                from_cache=True)
+            if revalidate:
+                previous = Response(url, entry.status, entry.headers,
+                                    entry.body)
+
+        headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        }
+        if previous is not None:
+            if previous.etag:
+                headers['If-None-Match'] = previous.etag
+            if previous.last_modified:
+                headers['If-Modified-Since'] = previous.last_modified
+
+        location = url
+        for _ in range(self.max_redirects + 1):
+            status, resp_headers, body = self._send(location, headers)
+            if status in (301, 302, 303, 307, 308) and 'location' in resp_headers:
+                location = urljoin(location, resp_headers['location'])
+                continue
+            break
+        else:
+            raise FetchError('too many redirects fetching {}'.format(url))
+
+        if status == 304 and previous is not None:
+            if cache is not None:
+                _store(cache, url, previous.status, previous.headers,
+                       previous.body)
+            return Response(url, status, previous.headers, previous.body,
+                            not_modified=True)
+
+        if status >= 400:
+            raise FetchError('GET {} returned HTTP {}'.format(url, status))
+
+        body = _decode_body(body, resp_headers.pop('content-encoding', None))
+        response = Response(url, status, resp_headers, body)
+
+        if response.validator is not None:
+            with self._lock:
+                self._validated[url] = response
+                self._validated.move_to_end(url)
+                while len(self._validated) > self.max_validated:
+                    self._validated.popitem(last=False)
+        if cache is not None:
+            _store(cache, url, status, resp_headers, body)
+        return response
+
+
+def _store(cache, url, status, headers, body):
+    """Put a response in `cache`; a cache that cannot be written is only
+    logged, the fetch itself succeeded."""
+    try:
+        cache.put(url, status, headers, body)
+    except OSError as e:
+        logger.warning('Could not cache {}: {}'.format(url, e))
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def get_fetcher():
+    """Return the process-wide shared `Fetcher`."""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from .helper import _lazy_import
+from . import metrics
+
+numpy = _lazy_import('numpy')
+pandas = _lazy_import('pandas')
+
+DEFAULT_BASE_URL = 'https://api.weather.gov'
+
+_DEG_F = '\N{DEGREE SIGN}F'
+
+# gridpoint layer: digital table column; in the digital table's order
+_LAYERS = OrderedDict([
+    ('temperature', 'Temperature ({})'.format(_DEG_F)),
+    ('dewpoint', 'Dewpoint ({})'.format(_DEG_F)),
+    ('windChill', 'Wind Chill ({})'.format(_DEG_F)),
+    ('windSpeed', 'Surface Wind (mph)'),
+    ('windDirection', 'Wind Dir'),
+    ('windGust', 'Gust'),
+    ('skyCover', 'Sky Cover (%)'),
+    ('probabilityOfPrecipitation', 'Precipitation Potential (%)'),
+    ('relativeHumidity', 'Relative Humidity (%)'),
+])
+
+# digital weather column: gridpoint weather types it covers
+_WEATHER = OrderedDict([
+    ('Rain', ('rain', 'rain_showers', 'drizzle')),
+    ('Thunder', ('thunderstorms',)),
+    ('Snow', ('snow', 'snow_showers', 'blowing_snow')),
+    ('Freezing Rain', ('freezing_rain', 'freezing_drizzle')),
+    ('Sleet', ('sleet', 'ice_pellets')),
+    ('Fog', ('fog', 'freezing_fog')),
+])
+
+_COVERAGE = {
+    'slight_chance': 'SChc', 'chance': 'Chc', 'likely': 'Lkly',
+    'definite': 'Def', 'isolated': 'Iso', 'scattered': 'Sct',
+    'numerous': 'Num', 'occasional': 'Ocnl', 'frequent': 'Frq',
+    'areas': 'Areas', 'patchy': 'Patchy', 'widespread': 'Wide',
+    'intermittent': 'Inter', 'brief': 'Brf', 'periods': 'Pds',
+}
+
+_COMPASS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+            'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+
+_DURATION = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?$')
+
+
+class GridpointCache(object):
+    """Remembers which NWS gridpoint each lat/lon falls in.
+
+    Gridpoints only change when the NWS redraws its grid, so a site is
+    resolved once and kept in a JSON file for every later run. Writes go
+    through a temp file and `os.replace`.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self._points = json.load(f)
+        except (OSError, ValueError):
+            self._points = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._points.get(key)
+
+    def put(self, key, point):
+        with self._lock:
+            self._points[key] = point
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._points, f, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+            except OSError:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_gridpoint_cache(path):
+    """Return the process-wide `GridpointCache` for `path`."""
+    path = os.path.realpath(path)
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = GridpointCache(path)
+        return _caches[path]
+
+
+def _coordinate(value):
+    # api.weather.gov redirects anything more precise than 4 decimals
+    return '{:.4f}'.format(float(value)).rstrip('0').rstrip('.')
+
+
+def resolve(coords, get, base_url=DEFAULT_BASE_URL, cache=None):
+    """The gridpoint of `coords` (as returned by `_get_lat_long`).
+
+    `get(url)` fetches a url and returns a `fetch.Response`. Returns a dict
+    with the forecast office (`gridId`), `gridX`, `gridY` and `timeZone`.
+    """
+    base_url = base_url.rstrip('/')
+    point = '{},{}'.format(_coordinate(coords['lat']),
+                           _coordinate(coords['lon']))
+    key = '{} {}'.format(base_url, point)
+    if cache is not None:
+        found = cache.get(key)
+        if found is not None:
+            return found
+
+    props = json.loads(get('{}/points/{}'.format(base_url, point)).text)
+    props = props['properties']
+    found = {k: props[k] for k in ('gridId', 'gridX', 'gridY', 'timeZone')}
+    if cache is not None:
+        cache.put(key, found)
+    return found
+
+
+def gridpoint_url(point, base_url=DEFAULT_BASE_URL):
+    return '{}/gridpoints/{}/{},{}'.format(
+        base_url.rstrip('/'), point['gridId'], point['gridX'],
+        point['gridY'])
+
+
+def _intervals(values):
+    """Start and end (epoch seconds) of each `validTime` interval."""
+    starts, seconds = [], []
+    for v in values:
+        start, _, duration = v['validTime'].partition('/')
+        match = _DURATION.match(duration)
+        if match is None:
+            raise ValueError('invalid duration {!r}'.format(duration))
+        d, h, m = (int(x or 0) for x in match.groups())
+        starts.append(start)
+        seconds.append(d * 86400 + h * 3600 + m * 60)
+    starts = pandas.to_datetime(starts, utc=True).values.astype(
+        'datetime64[s]').astype(numpy.int64)
+    return starts, starts + numpy.array(seconds, dtype=numpy.int64)
+
+
+def _on_hours(layer, hours):
+    """The value of a layer at each of `hours`, None where it has none."""
+    out = numpy.full(len(hours), None, dtype=object)
+    values = (layer or {}).get('values') or []
+    if not values:
+        return out
+    starts, ends = _intervals(values)
+    order = numpy.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    data = numpy.empty(len(values), dtype=object)
+    data[:] = [values[i]['value'] for i in order]
+
+    idx = numpy.searchsorted(starts, hours, side='right') - 1
+    valid = idx >= 0
+    valid[valid] = hours[valid] < ends[idx[valid]]
+    out[valid] = data[idx[valid]]
+    return out
+
+
+def _convert(values, uom):
+    """Numbers in the digital table's units (deg F, mph, %), rounded."""
+    x = numpy.array(values, dtype=float)
+    if uom == 'wmoUnit:degC':
+        x = x * 9 / 5 + 32
+    elif uom == 'wmoUnit:km_h-1':
+        x = x / 1.609344
+    elif uom == 'wmoUnit:m_s-1':
+        x = x * 2.2369363
+    return numpy.round(x)
+
+
+def _compass(degrees):
+    out = numpy.full(len(degrees), numpy.nan, dtype=object)
+    ok = ~numpy.isnan(degrees)
+    out[ok] = numpy.array(_COMPASS, dtype=object)[
+        numpy.round(degrees[ok] / 22.5).astype(int) % 16]
+    return out
+
+
+def _weather(values, kinds):
+    """Coverage code of the first of `kinds` in each hour, else '--'."""
+    out = []
+    for hour in values:
+        code = '--'
+        for w in hour or []:
+            if w.get('weather') in kinds:
+                code = _COVERAGE.get(w.get('coverage'), 'Chc')
+                break
+        out.append(code)
+    return out
+
+
+def gridpoint_frame(data, time_zone, hours=48, now=None):
+    """Lay gridpoint JSON out as the digital forecast table.
+
+    Returns `hours` hourly rows from the current hour (or from the first
+    hour of data, if the data does not cover now) with the digital table's
+    columns: a local `Date`, `Hour (<tz>)` and the values in deg F, mph,
+    percent and weather coverage codes.
+    """
+    props = data.get('properties', data)
+    temps = props.get('temperature') or {}
+    starts, ends = _intervals(temps.get('values') or [])
+    if not len(starts):
+        raise ValueError('gridpoint data has no temperature forecast')
+    first = starts.min() // 3600 * 3600
+    last = ends.max()
+    if now is None:
+        now = time.time()
+    current = int(now) // 3600 * 3600
+    start = current if first <= current < last else first
+    grid = numpy.arange(start, min(start + hours * 3600, last), 3600,
+                        dtype=numpy.int64)
+
+    local = pandas.to_datetime(grid, unit='s', utc=True).tz_convert(time_zone)
+    tz_name = local[0].strftime('%Z') if len(local) else 'LT'
+
+    out = OrderedDict()
+    out['Date'] = local.tz_localize(None).values
+    out['Hour ({})'.format(tz_name)] = local.hour.values.astype(float)
+    for name, column in _LAYERS.items():
+        layer = props.get(name)
+        values = _on_hours(layer, grid)
+        if name == 'windChill':
+            # the digital table shows the heat index instead in summer
+            heat = _on_hours(props.get('heatIndex'), grid)
+            if any(v is not None for v in heat):
+                layer, values = props['heatIndex'], heat
+                column = 'Heat Index ({})'.format(_DEG_F)
+        values = _convert(values, (layer or {}).get('uom'))
+        if name == 'windDirection':
+            out[column] = _compass(values)
+        elif name == 'windChill':
+            # text in the digital table
+            text = numpy.full(len(values), numpy.nan, dtype=object)
+            ok = ~numpy.isnan(values)
+            text[ok] = [str(int(v)) for v in values[ok]]
+            out[column] = text
+        else:
+            out[column] = values
+    weather = _on_hours(props.get('weather'), grid)
+    for column, kinds in _WEATHER.items():
+        out[column] = _weather(weather, kinds)
+    return pandas.DataFrame(out)
+
+
+def fetch_gridpoint(coords, get, base_url=DEFAULT_BASE_URL, cache=None,
+                    hours=48):
+    """Fetch the api.weather.gov forecast at `coords` as `noaa_tabular`.
+
+    The lat/lon is resolved to its gridpoint once (see `resolve`), then the
+    raw gridpoint JSON is fetched with `get(url)` and laid out like the
+    digital MapClick table (see `gridpoint_frame`), so nothing downstream
+    has to scrape or reshape HTML. Returns `(response, frame)`.
+    """
+    point = resolve(coords, get, base_url, cache)
+    response = get(gridpoint_url(point, base_url))
+    with metrics.span('parse', json_bytes=len(response.body)) as span:
+        frame = gridpoint_frame(json.loads(response.text), point['timeZone'],
+                                hours=hours)
+        span.attrs['rows'] = len(frame)
+    return response, frame
@@ -1,11 +1,44 @@
 import datetime
+import importlib
+
+
+class _LazyModule(object):
+    """Stand-in for a module that is only imported on first attribute use.
+
+    Lets heavy dependencies (pandas, pdfkit, ...) be named at module level
+    without paying their import cost until a code path actually needs them.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._name)
+
+
+def _lazy_import(name):
+    return _LazyModule(name)
+
+
+def _utc_stamp():
+    """Current UTC wall time as a float, as stored in the timestamp files."""
+    return datetime.datetime.utcnow().timestamp()
 
 
 def _write_timestamp(file, note=None):
     if note is None:
         note = ""
     with open(file, 'w') as f:
-        ts = str(datetime.datetime.utcnow().timestamp())
+        ts = str(_utc_stamp())
         f.write(note + ts)
 
 
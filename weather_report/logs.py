@@ -0,0 +1,155 @@
+import sys
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+_PACKAGE = __name__.rpartition('.')[0]
+
+FORMAT = '%(asctime)s %(name)-12s %(levelname)-8s %(message)s'
+
+_local = threading.local()
+_lock = threading.Lock()
+_listener = None
+_router = None
+_handler = None
+
+
+class SiteLogger(logging.LoggerAdapter):
+    """A logger whose records go to one site's log file."""
+
+    @property
+    def path(self):
+        return self.extra['site_log']
+
+    def process(self, msg, kwargs):
+        extra = dict(kwargs.get('extra') or {})
+        extra['site_log'] = self.path
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+
+class _CurrentSite(logging.Filter):
+    """Send records logged while a site runs to that site's file."""
+
+    def filter(self, record):
+        if getattr(record, 'site_log', None) is None:
+            record.site_log = getattr(_local, 'path', None)
+        return True
+
+
+class _Router(logging.Handler):
+    """Writes each record to its site's file, on the listener thread.
+
+    At most `max_open` files are kept open, least recently used closed
+    first. Records without a site go to the root logger's handlers if it
+    has any, else to `process`.
+    """
+
+    def __init__(self, max_open=64, process=None):
+        super().__init__()
+        self.max_open = max_open
+        self.process = process
+        self._files = OrderedDict()
+
+    def _handler(self, path):
+        handler = self._files.pop(path, None)
+        if handler is None:
+            handler = logging.FileHandler(path, delay=True)
+            handler.setFormatter(logging.Formatter(FORMAT))
+            while len(self._files) >= self.max_open:
+                self._files.popitem(last=False)[1].close()
+        self._files[path] = handler
+        return handler
+
+    def emit(self, record):
+        path = getattr(record, 'site_log', None)
+        if path is not None:
+            self._handler(path).handle(record)
+            return
+        root = logging.getLogger()
+        handlers = root.handlers or [self.process or logging.lastResort]
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def close(self):
+        for handler in self._files.values():
+            handler.close()
+        self._files.clear()
+        if self.process is not None:
+            self.process.close()
+        super().close()
+
+
+def _process_handler(path=None, level=logging.WARNING):
+    if path is None:
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.FileHandler(path, delay=True)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    handler.setLevel(level)
+    return handler
+
+
+def setup(level=logging.INFO, max_open=64, path=None,
+          process_level=logging.WARNING):
+    """Route the package's logging through one background writer.
+
+    Log calls only put the record on a queue; a `QueueListener` thread
+    writes it to the site's file. Records that belong to no site (the
+    daemon's, the outbox's, ...) go to the file at `path`, or to stderr,
+    from `process_level` up. Only the first call configures anything.
+    """
+    global _listener, _router, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        queue = SimpleQueue()
+        _handler = QueueHandler(queue)
+        _handler.addFilter(_CurrentSite())
+
+        package = logging.getLogger(_PACKAGE)
+        package.addHandler(_handler)
+        if package.level == logging.NOTSET:
+            package.setLevel(level)
+        # the router hands site-less records to the root handlers itself
+        package.propagate = False
+
+        _router = _Router(max_open=max_open,
+                          process=_process_handler(path, process_level))
+        _listener = QueueListener(queue, _router)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out everything queued and close the log files."""
+    global _listener, _router, _handler
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger(_PACKAGE).removeHandler(_handler)
+        _listener.stop()
+        _router.close()
+        _listener = _router = _handler = None
+
+
+def site_logger(path, name):
+    """A logger named `name` that writes to the file at `path`."""
+    setup()
+    return SiteLogger(logging.getLogger(name), {'site_log': path})
+
+
+@contextmanager
+def site(path):
+    """Send package records logged in this thread to the file at `path`."""
+    previous = getattr(_local, 'path', None)
+    _local.path = path
+    try:
+        yield
+    finally:
+        _local.path = previous
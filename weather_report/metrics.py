@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# per-site attributes summed into Prometheus counters, and the ones kept as
+# the latest value
+_COUNTERS = {'bytes': 'bytes_fetched_total', 'rows': 'rows_parsed_total'}
+_GAUGES = {'pdf_bytes': 'pdf_bytes'}
+
+_local = threading.local()
+
+
+class Span(object):
+    """One timed stage of a site's run."""
+
+    def __init__(self, stage, site=None, **attrs):
+        self.stage = stage
+        self.site = site
+        self.attrs = attrs
+        self.start = time.time()
+        self.seconds = None
+        self.error = None
+
+    def to_json(self):
+        out = {'stage': self.stage, 'site': self.site, 'start': self.start,
+               'seconds': self.seconds, 'ok': self.error is None}
+        if self.error is not None:
+            out['error'] = self.error
+        out.update(self.attrs)
+        return out
+
+
+class Recorder(object):
+    """Collects spans and exports them.
+
+    Spans wait in a bounded buffer until `flush_jsonl` appends them to a
+    JSON lines file. Per `(stage, site)` totals are kept for the lifetime of
+    the process and written by `write_prometheus` in the Prometheus
+    textfile-collector format.
+    """
+
+    def __init__(self, keep=100000):
+        self._pending = deque(maxlen=keep)
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self._pending.append(span)
+            totals = self._stages.setdefault((span.stage, span.site),
+                                             [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += span.seconds or 0.0
+            totals[2] += span.error is not None
+            for attr, value in span.attrs.items():
+                if attr in _COUNTERS and value:
+                    key = (_COUNTERS[attr], span.site)
+                    self._counters[key] = self._counters.get(key, 0) + value
+                elif attr in _GAUGES and value is not None:
+                    self._gauges[(_GAUGES[attr], span.site)] = value
+
+    def drain(self):
+        """Remove and return the spans recorded since the last drain."""
+        with self._lock:
+            spans = list(self._pending)
+            self._pending.clear()
+        return spans
+
+    def flush_jsonl(self, path):
+        """Append the pending spans to `path`; returns how many."""
+        spans = self.drain()
+        if spans:
+            with open(path, 'a') as f:
+                for span in spans:
+                    f.write(json.dumps(span.to_json(), default=str) + '\n')
+        return len(spans)
+
+    def prometheus(self):
+        def labels(**kw):
+            return ','.join('{}="{}"'.format(
+                k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                for k, v in sorted(kw.items()) if v is not None)
+
+        with self._lock:
+            stages = sorted(self._stages.items(), key=str)
+            counters = sorted(self._counters.items(), key=str)
+            gauges = sorted(self._gauges.items(), key=str)
+
+        lines = [
+            '# HELP weather_report_stage_seconds Time spent in each stage.',
+            '# TYPE weather_report_stage_seconds summary',
+        ]
+        for (stage, site), (count, seconds, _) in stages:
+            lines.append('weather_report_stage_seconds_sum{{{}}} {}'.format(
+                labels(stage=stage, site=site), seconds))
+            lines.append('weather_report_stage_seconds_count{{{}}} {}'.format(
+                labels(stage=stage, site=site), count))
+        lines.append('# TYPE weather_report_stage_failures_total counter')
+        for (stage, site), (_, _, failures) in stages:
+            lines.append('weather_report_stage_failures_total{{{}}} {}'.format(
+                labels(stage=stage, site=site), failures))
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            for name in sorted(set(n for (n, _), _ in items)):
+                lines.append('# TYPE weather_report_{} {}'.format(name, kind))
+                for (n, site), value in items:
+                    if n == name:
+                        lines.append('weather_report_{}{{{}}} {}'.format(
+                            name, labels(site=site), value))
+        lines.append('# TYPE weather_report_last_export_seconds gauge')
+        lines.append('weather_report_last_export_seconds {}'.format(time.time()))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Atomically replace `path`, as the textfile collector expects."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus())
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+_recorder = Recorder()
+_exports = {'jsonl': None, 'prometheus': None}
+
+
+def get_recorder():
+    """Return the process-wide `Recorder`."""
+    return _recorder
+
+
+def configure(jsonl=None, prometheus=None):
+    """Set the files `export` writes; None leaves that export off."""
+    _exports['jsonl'] = jsonl
+    _exports['prometheus'] = prometheus
+
+
+def export():
+    """Write the configured JSON lines and Prometheus files."""
+    if _exports['jsonl']:
+        _recorder.flush_jsonl(_exports['jsonl'])
+    else:
+        _recorder.drain()
+    if _exports['prometheus']:
+        _recorder.write_prometheus(_exports['prometheus'])
+
+
+@contextmanager
+def site(name):
+    """Label every span opened in this thread with the site `name`."""
+    previous = getattr(_local, 'site', None)
+    _local.site = name
+    try:
+        yield
+    finally:
+        _local.site = previous
+
+
+@contextmanager
+def span(stage, site=None, **attrs):
+    """Time a stage; yields the span so attributes can be added to it.
+
+    The site defaults to the one set with `site()` in this thread.
+    """
+    if site is None:
+        site = getattr(_local, 'site', None)
+    s = Span(stage, site, **attrs)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        s.seconds = time.perf_counter() - start
+        _recorder.record(s)
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from .state import SQLiteDatabase, get_state_store, KINDS
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site_key TEXT,
+    kind TEXT,
+    state_db TEXT,
+    host TEXT,
+    user TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attachments TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    claimed REAL,
+    sent REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+'''
+
+_COLUMNS = ('id', 'site_key', 'kind', 'state_db', 'host', 'user',
+            'recipients', 'subject', 'body', 'attachments', 'attempts')
+
+
+class Message(object):
+
+    def __init__(self, row):
+        for name, value in zip(_COLUMNS, row):
+            setattr(self, name, value)
+        self.recipients = json.loads(self.recipients)
+        self.attachments = json.loads(self.attachments)
+
+
+def _permanent(error):
+    """Errors retrying cannot fix."""
+    import smtplib
+    return isinstance(error, (FileNotFoundError,
+                              smtplib.SMTPRecipientsRefused))
+
+
+class Outbox(SQLiteDatabase):
+    """Durable queue of outgoing emails, delivered by a background thread.
+
+    `enqueue` only writes the message to SQLite, so a site run does not
+    wait on the mail server. The sender thread delivers due messages
+    through the shared `SMTPPool`; a failed send is retried after
+    `base_delay`, `2 * base_delay`, ... seconds (at most `max_delay`) and
+    given up after `max_attempts`. Messages that carry a site's state
+    database report their outcome to it (see `StateStore.record_delivery`).
+
+    Passwords are never written to disk: they are held in memory, by
+    `(host, user)`, from the reports that enqueue mail, along with whether
+    the account uses TLS. Messages left over from an earlier process wait
+    until a site using the same account has been loaded.
+
+    Several processes may share an outbox; a message claimed by a process
+    that died is handed out again after `stale_seconds`.
+    """
+
+    schema = _SCHEMA
+
+    def __init__(self, path, timeout=30, base_delay=30, max_delay=3600,
+                 max_attempts=8, stale_seconds=600, pool=None):
+        super().__init__(path, timeout=timeout)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.stale_seconds = stale_seconds
+        self.pool = pool
+        self._passwords = {}
+        self._tls = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def set_password(self, host, user, pwd, tls=True):
+        self._passwords[(host, user)] = pwd
+        self._tls[(host, user)] = tls
+        self._wake.set()
+
+    def enqueue(self, user, recipients, subject, body, attachments=None,
+                host=None, pwd=None, tls=True, site_key=None, kind=None,
+                state_db=None):
+        """Store a message for delivery; returns its id."""
+        if pwd is not None:
+            self._passwords[(host, user)] = pwd
+            self._tls[(host, user)] = tls
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                'INSERT INTO outbox (site_key, kind, state_db, host, user, '
+                'recipients, subject, body, attachments, created, '
+                'next_attempt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (site_key, kind, state_db, host, user, json.dumps(recipients),
+                 subject, body, json.dumps(list(attachments or [])), now,
+                 now))
+            message_id = cur.lastrowid
+        self.start()
+        self._wake.set()
+        return message_id
+
+    def _claim(self, now):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'pending' WHERE status = 'sending'"
+                " AND claimed < ?", (now - self.stale_seconds,))
+            rows = conn.execute(
+                'SELECT {} FROM outbox WHERE status = ? AND next_attempt <= ? '
+                'ORDER BY next_attempt, id'.format(', '.join(_COLUMNS)),
+                ('pending', now))
+            for row in rows:
+                message = Message(row)
+                if (message.host, message.user) in self._passwords:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'sending', claimed = ? "
+                        "WHERE id = ?", (now, message.id))
+                    return message
+        return None
+
+    def _report(self, message, ok, error=None, final=False):
+        if not (message.state_db and message.site_key) or \
+                message.kind not in KINDS:
+            return
+        try:
+            get_state_store(message.state_db).record_delivery(
+                message.site_key, message.kind, ok, error=error, final=final)
+        except Exception as e:
+            logger.exception('Could not record delivery of message {}: {}'
+                             .format(message.id, e))
+
+    def _deliver(self, message):
+        from .email_handler import get_smtp_pool, iter_message
+
+        pool = self.pool or get_smtp_pool()
+        pwd = self._passwords[(message.host, message.user)]
+        tls = self._tls.get((message.host, message.user), True)
+
+        def chunks():
+            return iter_message(message.user, message.recipients,
+                                message.subject, message.body,
+                                message.attachments)
+
+        try:
+            with metrics.span('smtp', site=message.site_key, kind=message.kind,
+                              recipients=len(message.recipients),
+                              attempt=message.attempts + 1):
+                pool.sendmail(message.host, message.user, pwd, message.user,
+                              message.recipients, chunks, tls=tls)
+        except Exception as e:
+            self._failed(message, e)
+            return False
+
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'sent', sent = ?, attempts = ?, "
+                "last_error = NULL WHERE id = ?",
+                (time.time(), message.attempts + 1, message.id))
+        logger.info('Delivered message {} ({} for {}) to {}'.format(
+            message.id, message.kind, message.site_key, message.recipients))
+        self._report(message, True)
+        return True
+
+    def _failed(self, message, error):
+        attempts = message.attempts + 1
+        final = attempts >= self.max_attempts or _permanent(error)
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?,'
+                ' last_error = ? WHERE id = ?',
+                ('failed' if final else 'pending', attempts,
+                 time.time() + delay, repr(error), message.id))
+        if final:
+            logger.error('Gave up on message {} after {} attempts: {}'.format(
+                message.id, attempts, error))
+        else:
+            logger.warning('Message {} failed (attempt {}), retrying in '
+                           '{:.0f}s: {}'.format(message.id, attempts, delay,
+                                                error))
+        self._report(message, False, error=repr(error), final=final)
+
+    def _seconds_until_next(self, now):
+        row = self._connection().execute(
+            'SELECT MIN(next_attempt) FROM outbox WHERE status = ?',
+            ('pending',)).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - now, 0)
+
+    def deliver_due(self):
+        """Deliver every message due now; returns the number delivered."""
+        delivered = 0
+        while not self._stop.is_set():
+            message = self._claim(time.time())
+            if message is None:
+                break
+            delivered += self._deliver(message)
+        return delivered
+
+    def _serve(self):
+        while not self._stop.is_set():
+            self._idle.clear()
+            self._wake.clear()
+            try:
+                self.deliver_due()
+            except Exception as e:
+                logger.exception('Outbox sender error: {}'.format(e))
+            self._idle.set()
+            wait = self._seconds_until_next(time.time())
+            self._wake.wait(30 if wait is None else min(max(wait, 0.05), 30))
+        self._idle.set()
+
+    def start(self):
+        """Start the background sender if it is not running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._serve, name='outbox-sender', daemon=True)
+                self._thread.start()
+
+    def pending(self, now=None):
+        """Number of messages waiting to be sent that are due by `now`."""
+        now = time.time() if now is None else now
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status = 'pending' AND "
+            "next_attempt <= ?", (now,)).fetchone()[0]
+
+    def counts(self):
+        rows = self._connection().execute(
+            'SELECT status, COUNT(*) FROM outbox GROUP BY status')
+        return dict(rows)
+
+    def drain(self, timeout=60):
+        """Wait until nothing deliverable is due, or `timeout` seconds.
+
+        Messages backing off after a failure stay in the outbox for a later
+        run. Returns the number of messages still due.
+        """
+        if self._thread is None:
+            return self.pending()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self._wake.set()
+            time.sleep(0.05)
+            if self._idle.wait(max(deadline - time.monotonic(), 0)) and \
+                    not self._deliverable():
+                break
+        return self.pending()
+
+    def _deliverable(self):
+        rows = self._connection().execute(
+            "SELECT host, user FROM outbox WHERE status = 'pending' AND "
+            "next_attempt <= ?", (time.time(),))
+        return any(tuple(r) in self._passwords for r in rows)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def queued_send_msg(outbox, kind=None):
+    """A stand-in for `email_handler.send_msg` that queues on `outbox`."""
+    def send_msg(user, pwd, recipients, subject, htmlmsgtext,
+                 attachments=None, verbose=False, host=None, tls=True):
+        outbox.enqueue(user, recipients, subject, htmlmsgtext, attachments,
+                       host=host, pwd=pwd, tls=tls, kind=kind)
+    return send_msg
+
+
+_outboxes = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_outbox(path):
+    """Return the process-wide `Outbox` for `path`."""
+    path = os.path.realpath(path)
+    with _outboxes_lock:
+        if path not in _outboxes:
+            _outboxes[path] = Outbox(path)
+        return _outboxes[path]
+
+
+def drain_outboxes(timeout=30):
+    """Give every outbox in this process up to `timeout` seconds to send,
+    then stop its sender.
+
+    Run modes call this before they return: at exit the SMTP pool and the
+    attachment spool are already closed.
+    """
+    with _outboxes_lock:
+        outboxes = list(_outboxes.values())
+    for outbox in outboxes:
+        left = outbox.drain(timeout)
+        outbox.stop(timeout)
+        if left:
+            logger.warning('{} messages still queued in {}'.format(
+                left, outbox.path))
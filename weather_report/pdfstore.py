@@ -0,0 +1,147 @@
+import os
+import re
+import html
+import shutil
+import hashlib
+import tempfile
+import threading
+from urllib.parse import urljoin
+
+_COMMENT = re.compile(rb'<!--.*?-->', re.S)
+_SPACE = re.compile(rb'\s+')
+_IMG_SRC = re.compile(
+    rb'<img\b[^>]*?\bsrc\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+
+
+def _normalize_page(body):
+    """Page bytes with comments and whitespace differences removed."""
+    return _SPACE.sub(b' ', _COMMENT.sub(b'', body)).strip()
+
+
+def image_urls(body, url):
+    """Absolute urls of the images a page shows, in order, without repeats.
+
+    wkhtmltopdf fetches these itself, so a page whose markup is unchanged
+    can still render differently (e.g. NOAA's forecast graphs).
+    """
+    found = []
+    for match in _IMG_SRC.finditer(_COMMENT.sub(b'', body)):
+        src = next(g for g in match.groups() if g is not None)
+        src = html.unescape(src.decode('utf-8', 'replace')).strip()
+        if not src or src.startswith('data:'):
+            continue
+        src = urljoin(url, src)
+        if src not in found:
+            found.append(src)
+    return found
+
+
+class PdfStore(object):
+    """Content-addressed copies of rendered PDFs.
+
+    Every rendered PDF is hardlinked into `directory` as `<digest>.pdf`,
+    where the digest covers everything the render depends on (see
+    `digest`). When a later run produces the same digest, `reuse` links
+    the stored file to the new timestamped name and no render happens.
+    Falls back to a copy where hardlinks are not supported.
+
+    `renders_avoided` counts reuses over the life of the process.
+    """
+
+    renders_avoided = 0
+    _count_lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def digest(pages, table_digest=None, options=None, images=None):
+        """Hash of the render inputs.
+
+        `pages` is a list of page bodies (bytes) or urls (str) for pages
+        that wkhtmltopdf fetches itself; `images` is a list of
+        `(url, version)` for the images those pages show, the version being
+        an ETag or a hash of the image; `table_digest` identifies the
+        parsed forecast and `options` the wkhtmltopdf options.
+        """
+        h = hashlib.sha256()
+        for page in pages:
+            if isinstance(page, str):
+                h.update(b'url:' + page.encode('utf-8'))
+            else:
+                h.update(b'page:' + _normalize_page(page))
+            h.update(b'\0')
+        for url, version in images or ():
+            h.update('img:{} {}\0'.format(url, version).encode('utf-8'))
+        if table_digest is not None:
+            h.update(b'table:' + table_digest.encode('ascii'))
+        for key in sorted(options or {}):
+            h.update('\0{}={}'.format(key, options[key]).encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + '.pdf')
+
+    def _link(self, src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            # no hardlinks here (or across devices); copy atomically
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst) or '.',
+                                       prefix='.', suffix='.tmp')
+            os.close(fd)
+            try:
+                shutil.copyfile(src, tmp)
+                os.replace(tmp, dst)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def reuse(self, digest, output):
+        """Link the stored PDF for `digest` to `output`.
+
+        Returns True if there was one, False if `output` must be rendered.
+        """
+        stored = self.path(digest)
+        if not os.path.exists(stored):
+            return False
+        if os.path.exists(output):
+            os.remove(output)
+        try:
+            self._link(stored, output)
+        except FileNotFoundError:
+            # pruned by another run meanwhile
+            return False
+        with PdfStore._count_lock:
+            PdfStore.renders_avoided += 1
+        return True
+
+    def add(self, digest, output):
+        """Keep the freshly rendered `output` under `digest`."""
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.path(digest)):
+            try:
+                self._link(output, self.path(digest))
+            except FileExistsError:
+                # another site rendered the same content meanwhile
+                pass
+
+    def prune(self):
+        """Drop stored PDFs no timestamped file links to any more.
+
+        Only meaningful where hardlinks work; returns the number removed.
+        """
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return removed
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.pdf'):
+                continue
+            try:
+                if os.stat(path).st_nlink == 1:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
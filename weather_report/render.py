@@ -0,0 +1,168 @@
+import sys
+import time
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .helper import _lazy_import
+
+pdfkit = _lazy_import('pdfkit')
+
+logger = logging.getLogger(__name__)
+
+
+class RenderError(OSError):
+    pass
+
+
+class RenderResult(object):
+
+    def __init__(self, output, site=None):
+        self.output = output
+        self.site = site
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.attempts = 0
+        self.warning = None
+
+    @property
+    def queue_wait(self):
+        if self.started is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def render_seconds(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+def _is_pdf(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4) == b'%PDF'
+    except OSError:
+        return False
+
+
+def _partial_success(output, message):
+    # wkhtmltopdf exits non-zero when one resource (an image, a slow host)
+    # fails but still finishes the document.
+    text = message.lower()
+    return _is_pdf(output) and 'printing pages' in text and 'done' in text
+
+
+class RenderQueue(object):
+    """A fixed pool of wkhtmltopdf workers shared by every site.
+
+    At most `workers` renders run at once; everything else waits in the
+    queue. Each attempt is killed after `timeout` seconds and failed
+    attempts are retried up to `retries` times, sleeping `backoff`,
+    `2 * backoff`, ... in between. A render that produced a complete PDF
+    is never repeated, even if wkhtmltopdf reported errors for part of the
+    page. Queue wait and render time are kept per job in `results`.
+    """
+
+    def __init__(self, workers=2, timeout=120, retries=2, backoff=2.0,
+                 configuration=None, keep=1000):
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.configuration = configuration
+        self.results = deque(maxlen=keep)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+
+    def _command(self, inputs, output, options):
+        kwargs = {'options': options}
+        if self.configuration is not None:
+            kwargs['configuration'] = self.configuration
+        return pdfkit.PDFKit(inputs, 'url', **kwargs).command(output)
+
+    def _attempt(self, args, output):
+        startupinfo = None
+        if sys.platform == 'win32':
+            # hide the cmd window
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+        try:
+            proc = subprocess.run(args, stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE,
+                                  timeout=self.timeout,
+                                  startupinfo=startupinfo)
+        except subprocess.TimeoutExpired:
+            return False, 'timed out after {}s'.format(self.timeout)
+
+        message = (proc.stderr or proc.stdout or b'').decode(
+            'utf-8', errors='replace')
+        if proc.returncode == 0 and _is_pdf(output):
+            return True, None
+        if _partial_success(output, message):
+            return True, message
+        return False, message or 'exit code {}'.format(proc.returncode)
+
+    def _execute(self, inputs, output, options, result):
+        result.started = time.perf_counter()
+        try:
+            args = self._command(inputs, output, options)
+            message = None
+            for attempt in range(self.retries + 1):
+                result.attempts = attempt + 1
+                ok, message = self._attempt(args, output)
+                if ok:
+                    result.warning = message
+                    return result
+                if attempt < self.retries:
+                    logger.warning('Render of {} failed (attempt {}): {}'.format(
+                        output, attempt + 1, message))
+                    time.sleep(self.backoff * 2 ** attempt)
+            raise RenderError('Could not render {}: {}'.format(output, message))
+        finally:
+            result.finished = time.perf_counter()
+            with self._lock:
+                self.results.append(result)
+
+    def submit(self, inputs, output, options=None, site=None):
+        """Queue a render; returns a future resolving to a `RenderResult`."""
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        result = RenderResult(output, site)
+        return self._pool.submit(self._execute, list(inputs), output,
+                                 dict(options or {}), result)
+
+    def render(self, inputs, output, options=None, site=None):
+        """Queue a render and wait for it; raises `RenderError` on failure."""
+        return self.submit(inputs, output, options, site).result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def configure_render_queue(**kwargs):
+    """Replace the process-wide `RenderQueue` with one built from `kwargs`."""
+    global _default_queue
+    with _default_lock:
+        old, _default_queue = _default_queue, RenderQueue(**kwargs)
+    if old is not None:
+        old.shutdown(wait=False)
+    return _default_queue
+
+
+def get_render_queue():
+    """Return the process-wide shared `RenderQueue`."""
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            _default_queue = RenderQueue()
+        return _default_queue
@@ -0,0 +1,197 @@
+import re
+import operator
+from collections import OrderedDict
+
+from .helper import _lazy_import
+
+numpy = _lazy_import('numpy')
+pandas = _lazy_import('pandas')
+
+# rule variable: lower-case substring of its forecast column
+VARIABLES = OrderedDict([
+    ('precip', 'precipitation potential'),
+    ('gust', 'gust'),
+    ('wind', 'surface wind'),
+    ('temp', 'temperature'),
+    ('humidity', 'relative humidity'),
+])
+
+_DESCRIPTIONS = {
+    'precip': ('chance of rain', '%'),
+    'gust': ('wind gusts', ' mph'),
+    'wind': ('sustained wind', ' mph'),
+    'temp': ('temperature', '\N{DEGREE SIGN}F'),
+    'humidity': ('relative humidity', '%'),
+}
+
+_OPS = OrderedDict([
+    ('>=', (operator.ge, 'at or above')),
+    ('<=', (operator.le, 'at or below')),
+    ('>', (operator.gt, 'above')),
+    ('<', (operator.lt, 'below')),
+])
+
+_RULE = re.compile(
+    r'^\s*(?P<variable>[a-z]+)\s*(?P<op>>=|<=|>|<)\s*(?P<value>-?\d+(\.\d*)?)'
+    r'\s*%?(\s+for\s+(?P<hours>\d+)\s*h(ours?|rs?)?)?\s*$', re.IGNORECASE)
+
+
+class Rule(object):
+    """One alert condition on a forecast variable.
+
+    Written as `<variable> <op> <value> [for <n>h]`, e.g. `gust >= 35` or
+    `precip >= 40 for 3h`; the second only holds once the chance of rain
+    stays at or above 40% for 3 consecutive forecast hours. Variables are
+    the keys of `VARIABLES`.
+    """
+
+    def __init__(self, variable, op, value, hours=1):
+        if variable not in VARIABLES:
+            e = 'unknown rule variable {!r}; use one of {}'.format(
+                variable, ', '.join(VARIABLES))
+            raise ValueError(e)
+        if op not in _OPS:
+            raise ValueError('unknown rule operator {!r}'.format(op))
+        if int(hours) < 1:
+            raise ValueError('a rule must hold for at least 1 hour')
+        self.variable = variable
+        self.op = op
+        self.value = float(value)
+        self.hours = int(hours)
+
+    @classmethod
+    def parse(cls, text):
+        match = _RULE.match(text)
+        if match is None:
+            e = 'invalid alert rule {!r}, expected e.g. "gust >= 35" or ' \
+                '"precip >= 40 for 3h"'.format(text)
+            raise ValueError(e)
+        return cls(match.group('variable').lower(), match.group('op'),
+                   match.group('value'), match.group('hours') or 1)
+
+    @property
+    def name(self):
+        name = '{} {} {:g}'.format(self.variable, self.op, self.value)
+        if self.hours > 1:
+            name += ' for {}h'.format(self.hours)
+        return name
+
+    def describe(self):
+        """The rule in words, for emails."""
+        label, unit = _DESCRIPTIONS[self.variable]
+        text = '{} {} {:g}{}'.format(label, _OPS[self.op][1], self.value, unit)
+        if self.hours > 1:
+            text += ' for {} hours'.format(self.hours)
+        return text
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return 'Rule({!r})'.format(self.name)
+
+    def hits(self, values):
+        """Rows whose value meets the rule; NaN never does."""
+        with numpy.errstate(invalid='ignore'):
+            return _OPS[self.op][0](values, self.value)
+
+
+def parse_rules(texts):
+    """`Rule`s from a list of rule strings, without duplicates."""
+    return list(OrderedDict.fromkeys(Rule.parse(t) for t in texts))
+
+
+def _find_column(df, key):
+    for c in df.columns:
+        if key in c.lower():
+            return c
+
+
+def stack_forecasts(frames, date='Date'):
+    """Stack many sites' forecasts into one frame indexed by `(site, time)`.
+
+    `frames` maps each site to its parsed (or compact) forecast. The result
+    has a float column per `VARIABLES` entry, NaN where a site's forecast
+    does not have it, and `time` in epoch seconds, ordered within each site.
+    """
+    names = list(frames)
+    times = []
+    columns = OrderedDict((v, []) for v in VARIABLES)
+    for name in names:
+        df = frames[name]
+        if date in df.columns:
+            stamps = df[date].values.astype('datetime64[s]').astype(
+                numpy.int64)
+        else:
+            stamps = numpy.asarray(df.index.values, dtype=numpy.int64)
+        order = numpy.argsort(stamps, kind='stable')
+        times.append(stamps[order])
+        for variable, key in VARIABLES.items():
+            col = _find_column(df, key)
+            if col is None:
+                values = numpy.full(len(stamps), numpy.nan)
+            else:
+                values = df[col].values.astype(float)[order]
+            columns[variable].append(values)
+
+    sizes = [len(t) for t in times]
+    codes = numpy.repeat(numpy.arange(len(names)), sizes)
+    index = pandas.MultiIndex.from_arrays(
+        [pandas.Categorical.from_codes(codes, categories=names),
+         numpy.concatenate(times) if times else numpy.array([], numpy.int64)],
+        names=['site', 'time'])
+    data = OrderedDict(
+        (v, numpy.concatenate(c) if c else numpy.array([], float))
+        for v, c in columns.items())
+    return pandas.DataFrame(data, index=index)
+
+
+def _held(hits, codes, times, hours):
+    """Rows that end a run of `hours` consecutive hourly hits of one site."""
+    if hours <= 1:
+        return hits
+    n = hours - 1
+    held = numpy.zeros(len(hits), dtype=bool)
+    if len(hits) > n:
+        counts = numpy.concatenate([[0], numpy.cumsum(hits)])
+        end = numpy.arange(n, len(hits))
+        start = end - n
+        held[n:] = ((counts[end + 1] - counts[start] == hours) &
+                    (codes[end] == codes[start]) &
+                    (times[end] - times[start] == n * 3600))
+    return held
+
+
+def evaluate(stacked, rules_by_site):
+    """The set of `(site, rule)` pairs whose rule the site's forecast meets.
+
+    `stacked` comes from `stack_forecasts` and `rules_by_site` maps sites to
+    their `Rule`s. Each distinct rule is evaluated once, as array operations
+    over every site's rows, and then kept for the sites that have it.
+    """
+    codes = stacked.index.codes[0]
+    names = list(stacked.index.levels[0])
+    times = stacked.index.get_level_values('time').values
+    position = {name: i for i, name in enumerate(names)}
+
+    sites_by_rule = OrderedDict()
+    for site, rules in rules_by_site.items():
+        if site in position:
+            for rule in rules:
+                sites_by_rule.setdefault(rule, []).append(position[site])
+
+    triggered = set()
+    for rule, sites in sites_by_rule.items():
+        hits = _held(rule.hits(stacked[rule.variable].values), codes, times,
+                     rule.hours)
+        wanted = numpy.zeros(len(names), dtype=bool)
+        wanted[sites] = True
+        for code in numpy.unique(codes[hits & wanted[codes]]):
+            triggered.add((names[code], rule))
+    return triggered
@@ -0,0 +1,391 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .configurator import read_sites, get_config_cache
+from .weather_report import (
+    WeatherReport, _grid_cell, _get_lat_long, parsed_pages_nbytes)
+from .fetch import get_fetcher
+from .outbox import drain_outboxes
+from .state import register_reports
+from .rules import stack_forecasts, evaluate
+from . import metrics, logs
+
+logger = logging.getLogger(__name__)
+
+
+class SiteResult(object):
+
+    def __init__(self, input_file, site=None, ok=True, error=None,
+                 seconds=0.0, silent=False):
+        self.input_file = input_file
+        self.site = site
+        self.ok = ok
+        self.error = error
+        self.seconds = seconds
+        self.silent = silent
+        self.cell = None
+        self.nbytes = 0
+        self.fetched = False
+        self.render = None
+        self.reused = False
+
+    @property
+    def status(self):
+        if self.ok:
+            return 'ok'
+        if self.silent:
+            return 'failed (silent)'
+        return 'failed'
+
+
+class SharedForecast(object):
+    """Fetch and parse one tabular forecast on first use, for many sites.
+
+    Instances are installed as `WeatherReport.forecast_source` for every
+    site in a grid cell; whichever site asks first calls `load` (e.g. its
+    `fetch_forecast`) and the rest receive the same `(response, frame)` (or
+    the same error). Only the frame is shared: each site renders its own
+    tabular page into its PDF. Once all `users` sites have been served the
+    result is dropped, so it does not outlive the sites' own copies; a
+    later call loads it again.
+    """
+
+    def __init__(self, load, users=None):
+        self.load = load
+        self.users = users
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._done = False
+        self._served = 0
+        self._result = None
+        self._error = None
+
+    def __call__(self):
+        with self._lock:
+            if not self._done:
+                self.loads += 1
+                try:
+                    self._result = self.load()
+                except Exception as e:
+                    self._error = e
+                self._done = True
+            result, error = self._result, self._error
+            self._served += 1
+            if self.users is not None and self._served >= self.users:
+                self._done = False
+                self._served = 0
+                self._result = self._error = None
+        if error is not None:
+            raise error
+        return result
+
+
+def group_by_grid_cell(reports, km=2.5):
+    """Map each forecast grid cell to the reports that fall inside it.
+
+    Digital sites are grouped by their coordinates rounded to a `km` grid.
+    Gridpoint sites are grouped by the NWS gridpoint they resolve to, so
+    they only share a forecast that is exactly theirs.
+    """
+    groups = OrderedDict()
+    for report in reports:
+        try:
+            cell = _grid_cell(_get_lat_long(report.site_map_click_url), km=km)
+        except (KeyError, ValueError):
+            cell = ('url', report.urls[1])
+        if report.forecast_backend == 'gridpoint':
+            try:
+                point = report.gridpoint
+                cell = (report.gridpoint_base_url, point['gridId'],
+                        point['gridX'], point['gridY'])
+            except Exception:
+                # fetching the forecast will report the error
+                pass
+        if report.forecast_backend != 'digital':
+            # sites only share a forecast from the same backend
+            cell = (report.forecast_backend,) + cell
+        groups.setdefault(cell, []).append(report)
+    return groups
+
+
+def share_forecasts(reports, km=2.5):
+    """Give every report in the same grid cell one `SharedForecast`.
+
+    Returns the number of distinct cells, i.e. the most forecast fetches
+    the run can make.
+    """
+    groups = group_by_grid_cell(reports, km=km)
+    for cell, members in groups.items():
+        source = SharedForecast(members[0].fetch_forecast,
+                                users=len(members))
+        for report in members:
+            report.forecast_source = source
+            report.grid_key = cell
+    return len(groups)
+
+
+def _load_sites(input_file):
+    """A `(report, SiteResult)` for every site `input_file` describes.
+
+    A bulk file gives one pair per site. The report is None when the site
+    (or the whole file) could not be loaded; the result says why.
+    """
+    try:
+        configs = read_sites(input_file)
+    except Exception as e:
+        return [(None, SiteResult(input_file, ok=False, error=e))]
+
+    loaded = []
+    for config, options, error in configs:
+        name = input_file if config.site is None else config.filename
+        result = SiteResult(name, site=config.site)
+        try:
+            if error is not None:
+                raise ValueError(error)
+            report = WeatherReport.from_options(options, config)
+        except Exception as e:
+            result.ok = False
+            result.error = e
+            loaded.append((None, result))
+            continue
+        result.site = report.site_short_name
+        result.silent = bool(report.silent_mode_bool)
+        loaded.append((report, result))
+    return loaded
+
+
+def _run_site(report, result):
+    """Run one site, isolating any failure to that site's result."""
+    start = time.perf_counter()
+    try:
+        report.run()
+    except Exception as e:
+        result.ok = False
+        result.error = e
+    result.seconds = time.perf_counter() - start
+    result.nbytes = report.retained_nbytes
+    result.fetched = report.forecast_fetched
+    result.render = report._render_result
+    result.reused = report._pdf_reused
+    return result
+
+
+def _load_forecast(report):
+    with metrics.site(report.site_short_name), logs.site(report.logger.path):
+        try:
+            return report.noaa_tabular
+        except Exception:
+            # logged already; the site's run fetches again and reports it
+            return None
+
+
+def evaluate_alerts(reports, pool=None):
+    """Decide the alerts of many sites in one pass.
+
+    The forecast of every site whose alert is due is loaded (on `pool`, if
+    given), all of them are stacked into one frame and every site's
+    `alert_rules` are evaluated together. Each of those reports gets its
+    `triggered_rules`, so its run does not evaluate them again. Returns the
+    set of triggered `(report, rule)` pairs.
+    """
+    due = [r for r in reports
+           if r.alert_email_list and r.alert_rules and r.alert_due]
+    if not due:
+        return set()
+    if pool is None:
+        tables = [_load_forecast(r) for r in due]
+    else:
+        tables = list(pool.map(_load_forecast, due))
+
+    # keyed by position; two reports may share a name
+    frames = {i: t for i, t in enumerate(tables) if t is not None}
+    stacked = stack_forecasts(frames)
+    with metrics.span('rules', sites=len(frames), rows=len(stacked)):
+        pairs = evaluate(stacked, {i: due[i].alert_rules for i in frames})
+    for i in frames:
+        due[i].triggered_rules = [rule for rule in due[i].alert_rules
+                                  if (i, rule) in pairs]
+    return set((due[i], rule) for i, rule in pairs)
+
+
+def prune_pdf_stores(reports):
+    """`PdfStore.prune` every store `reports` saved to, once each.
+
+    Returns the number of stored PDFs removed.
+    """
+    removed = 0
+    # reports that never touched their folder have nothing stored
+    stores = OrderedDict((r.pdf_store.directory, r.pdf_store)
+                         for r in reports if r._save_dir is not None)
+    for store in stores.values():
+        try:
+            removed += store.prune()
+        except OSError as e:
+            logger.warning('Could not prune {}: {}'.format(
+                store.directory, e))
+    return removed
+
+
+def run_sites(input_files, workers=1, grid_km=2.5, compact=False,
+              state_db=None, digest=None, outbox=None):
+    """Run every input file on a bounded pool of `workers` threads.
+
+    Sites that fall in the same `grid_km` forecast cell share a single
+    fetch and parse of the tabular forecast; pass `grid_km=None` to fetch
+    per site. Input files may be bulk files describing many sites (see
+    `configurator.read_sites`); results are returned one per site, in the
+    order of `input_files`. A failing site never stops the others; whether
+    it is re-raised is up to the caller. `compact` turns on
+    `compact_mode_bool` and `state_db` sets `state_db_path` for every site,
+    `outbox` sets `outbox_path`. With a `digest.Digest`, sites queue their
+    emails on it and the caller sends them. Alerts are decided for all
+    sites at once before any site runs (see `evaluate_alerts`). Stored
+    PDFs that no site's folder links to any more are pruned afterwards.
+    """
+    workers = max(1, int(workers))
+
+    loaded = [pair for i in input_files for pair in _load_sites(i)]
+    get_config_cache().save()
+    reports = [r for r, _ in loaded if r is not None]
+    for report in reports:
+        if compact:
+            report.compact_mode_bool = True
+        if state_db:
+            report.state_db_path = os.path.realpath(state_db)
+        if outbox:
+            report.outbox_path = os.path.realpath(outbox)
+        report.digest = digest
+    register_reports(reports)
+    if grid_km:
+        share_forecasts(reports, km=grid_km)
+
+    jobs = [(r, res) for r, res in loaded if r is not None]
+    for report, result in jobs:
+        result.cell = getattr(report, 'grid_key', None)
+    if workers == 1 or len(jobs) <= 1:
+        evaluate_alerts(reports)
+        for report, result in jobs:
+            _run_site(report, result)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            evaluate_alerts(reports, pool)
+            list(pool.map(lambda job: _run_site(*job), jobs))
+    prune_pdf_stores(reports)
+
+    return [res for _, res in loaded]
+
+
+def format_digest(digest):
+    return ('digest: {} emails sent ({} failed) in place of {} per-site '
+            'emails'.format(digest.sent, digest.failed, digest.replaced))
+
+
+def shared_cache_nbytes():
+    """Forecast memory held process-wide rather than by any one site."""
+    return parsed_pages_nbytes() + get_fetcher().validated_nbytes
+
+
+def format_summary(results, elapsed=None, shared=None):
+    lines = []
+    width = max([len(r.site or r.input_file) for r in results] + [4])
+    row = '{:<{w}}  {:<16}  {:>8}'
+    lines.append(row.format('site', 'status', 'seconds', w=width))
+    lines.append('-' * len(lines[0]))
+    for r in results:
+        lines.append(row.format(r.site or r.input_file, r.status,
+                                '{:.2f}'.format(r.seconds), w=width))
+        if r.error is not None:
+            lines.append('    {}: {}'.format(type(r.error).__name__, r.error))
+
+    n_ok = sum(r.ok for r in results)
+    lines.append('-' * len(lines[0]))
+    summary = '{} sites, {} ok, {} failed'.format(
+        len(results), n_ok, len(results) - n_ok)
+    if elapsed is not None:
+        summary += ' in {:.2f}s (site time {:.2f}s)'.format(
+            elapsed, sum(r.seconds for r in results))
+    cells = set(r.cell for r in results if r.cell is not None)
+    if cells:
+        summary += ', {} forecast grid cells'.format(len(cells))
+    lines.append(summary)
+
+    skipped = sum(r.ok and not r.fetched for r in results)
+    lines.append('forecast needed by {} sites, skipped by {} (nothing due)'
+                 .format(sum(r.fetched for r in results), skipped))
+
+    renders = [r.render for r in results
+               if r.render is not None and r.render.finished is not None]
+    if renders:
+        lines.append('renders: {}, mean queue wait {:.2f}s, mean render '
+                     '{:.2f}s, max render {:.2f}s'.format(
+                         len(renders),
+                         sum(x.queue_wait for x in renders) / len(renders),
+                         sum(x.render_seconds for x in renders) / len(renders),
+                         max(x.render_seconds for x in renders)))
+    reused = sum(r.reused for r in results)
+    if reused:
+        lines.append('renders avoided: {} (forecast unchanged)'.format(reused))
+
+    held = [r.nbytes for r in results if r.nbytes]
+    if held or shared:
+        total = sum(held) + (shared or 0)
+        line = 'forecast memory: {} bytes retained'.format(total)
+        if held:
+            line += ', {:.0f} bytes/site'.format(sum(held) / len(held))
+        if shared:
+            line += ', {} bytes in shared caches'.format(shared)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main_parallel(input_files, workers, grid_km=2.5, compact=False,
+                  state_db=None, summary=True, stream=None, digest=False,
+                  outbox=None):
+    """Run all sites on `workers` threads and print a summary.
+
+    With `digest`, every site's PDF and alert emails are grouped into one
+    message per recipient, sent after all sites have run. Without
+    `summary`, only the sites that failed are reported, on stderr.
+
+    Returns a process exit code: non-zero if any site that is not in
+    `silent_mode_bool` failed.
+    """
+    if stream is None:
+        stream = sys.stdout
+
+    collector = None
+    if digest:
+        from .digest import Digest
+        collector = Digest()
+
+    start = time.perf_counter()
+    results = run_sites(input_files, workers=workers, grid_km=grid_km,
+                        compact=compact, state_db=state_db, digest=collector,
+                        outbox=outbox)
+    if collector is not None:
+        send_msg = None
+        if outbox:
+            from .outbox import get_outbox, queued_send_msg
+            send_msg = queued_send_msg(get_outbox(outbox), kind='digest')
+        collector.send(send_msg)
+    drain_outboxes()
+    elapsed = time.perf_counter() - start
+
+    if summary:
+        print(format_summary(results, elapsed, shared_cache_nbytes()),
+              file=stream)
+        if collector is not None:
+            print(format_digest(collector), file=stream)
+
+    failed = [r for r in results if not r.ok and not r.silent]
+    if not summary:
+        for r in failed:
+            print('{}: {}: {}'.format(r.site or r.input_file,
+                                      type(r.error).__name__, r.error),
+                  file=sys.stderr)
+    return 1 if failed or (collector is not None and collector.failed) else 0
@@ -0,0 +1,307 @@
+import os
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from .helper import _read_timestamp, _utc_stamp
+
+logger = logging.getLogger(__name__)
+
+# same slack `needs_new_pdf` / `needs_alert` allow on their intervals
+TOLERANCE_SECONDS = 5 * 60
+
+KINDS = ('pdf', 'alert')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sites (
+    site_key TEXT PRIMARY KEY,
+    pdf_interval_hours REAL NOT NULL DEFAULT 0,
+    alert_interval_hours REAL NOT NULL DEFAULT 0,
+    last_pdf REAL,
+    last_alert REAL,
+    next_pdf_due REAL NOT NULL DEFAULT 0,
+    next_alert_due REAL NOT NULL DEFAULT 0,
+    next_due REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sites_next_due ON sites (next_due);
+'''
+
+# added after the first release; created on older databases when opened
+_DELIVERY_COLUMNS = [
+    ('last_pdf_delivered', 'REAL'),
+    ('last_alert_delivered', 'REAL'),
+    ('last_delivery_error', 'TEXT'),
+]
+
+
+def _next_due(last, interval_hours):
+    if last is None:
+        return 0.0
+    return last + max(interval_hours * 3600 - TOLERANCE_SECONDS, 0)
+
+
+class SQLiteDatabase(object):
+    """Per-thread SQLite connections in WAL mode, with write transactions.
+
+    Writes run in `BEGIN IMMEDIATE` transactions, so concurrent processes
+    and threads serialize cleanly. `schema` is run once when opened.
+    """
+
+    schema = ''
+
+    def __init__(self, path, timeout=30):
+        self.path = os.path.realpath(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connection().executescript(self.schema)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class StateStore(SQLiteDatabase):
+    """Transactional store of when each site last saved a PDF or sent an alert.
+
+    Replaces the per-directory `.pdf_last_saved` / `.alert_last_sent` files
+    with one SQLite database. Each row also carries the site's next due
+    time, indexed, so `due()` answers "which sites need attention" with one
+    query. Timestamps use the same encoding as the dotfiles (see
+    `helper._utc_stamp`).
+
+    Connections are per thread; writes run in `BEGIN IMMEDIATE`
+    transactions, so concurrent processes and threads serialize cleanly.
+
+    When emails go through an outbox, `record_delivery` keeps when each
+    kind was last actually delivered and the last delivery error.
+    """
+
+    schema = _SCHEMA
+
+    def __init__(self, path, timeout=30):
+        super().__init__(path, timeout=timeout)
+        if self._missing_columns(self._connection()):
+            # another process may be migrating too: look again once this
+            # one holds the write lock
+            with self._transaction() as conn:
+                for name, kind in self._missing_columns(conn):
+                    conn.execute('ALTER TABLE sites ADD COLUMN {} {}'.format(
+                        name, kind))
+
+    @staticmethod
+    def _missing_columns(conn):
+        have = set(r[1] for r in conn.execute('PRAGMA table_info(sites)'))
+        return [(name, kind) for name, kind in _DELIVERY_COLUMNS
+                if name not in have]
+
+    def register(self, site_key, pdf_interval_hours=0, alert_interval_hours=0,
+                 dotfiles=None):
+        """Make sure `site_key` has a row and its intervals are current.
+
+        `dotfiles` maps 'pdf' / 'alert' to `(path, note)` of the legacy
+        timestamp files; they are imported the first time a site is seen.
+        """
+        self.register_many([(site_key, pdf_interval_hours,
+                             alert_interval_hours, dotfiles)])
+
+    def register_many(self, sites):
+        """`register` every `(site_key, pdf_interval_hours,
+        alert_interval_hours, dotfiles)` of `sites` in one transaction."""
+        with self._transaction() as conn:
+            for site in sites:
+                self._register(conn, *site)
+
+    def _register(self, conn, site_key, pdf_interval_hours=0,
+                  alert_interval_hours=0, dotfiles=None):
+        row = conn.execute(
+            'SELECT last_pdf, last_alert FROM sites WHERE site_key = ?',
+            (site_key,)).fetchone()
+        if row is None:
+            last = {k: None for k in KINDS}
+            for kind, (path, note) in (dotfiles or {}).items():
+                try:
+                    ts = _read_timestamp(path, note=note)
+                except (OSError, ValueError):
+                    continue
+                last[kind] = ts.timestamp()
+            conn.execute(
+                'INSERT INTO sites (site_key, last_pdf, last_alert) '
+                'VALUES (?, ?, ?)',
+                (site_key, last['pdf'], last['alert']))
+        else:
+            last = dict(zip(KINDS, row))
+        self._update_due(conn, site_key, last['pdf'], last['alert'],
+                         pdf_interval_hours, alert_interval_hours)
+
+    def _update_due(self, conn, site_key, last_pdf, last_alert,
+                    pdf_interval_hours, alert_interval_hours):
+        pdf_due = _next_due(last_pdf, pdf_interval_hours)
+        alert_due = _next_due(last_alert, alert_interval_hours)
+        conn.execute(
+            'UPDATE sites SET pdf_interval_hours = ?, alert_interval_hours = ?,'
+            ' last_pdf = ?, last_alert = ?, next_pdf_due = ?,'
+            ' next_alert_due = ?, next_due = ? WHERE site_key = ?',
+            (pdf_interval_hours, alert_interval_hours, last_pdf, last_alert,
+             pdf_due, alert_due, min(pdf_due, alert_due), site_key))
+
+    def read(self, site_key, kind):
+        """Last time `kind` ('pdf' or 'alert') happened for a site, or None."""
+        if kind not in KINDS:
+            raise ValueError('unknown timestamp kind {!r}'.format(kind))
+        row = self._connection().execute(
+            'SELECT last_{} FROM sites WHERE site_key = ?'.format(kind),
+            (site_key,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return datetime.fromtimestamp(row[0])
+
+    def write(self, site_key, kind, when=None):
+        """Record that `kind` happened for a site now (or at naive UTC `when`)."""
+        if kind not in KINDS:
+            raise ValueError('unknown timestamp kind {!r}'.format(kind))
+        stamp = _utc_stamp() if when is None else when.timestamp()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT last_pdf, last_alert, pdf_interval_hours, '
+                'alert_interval_hours FROM sites WHERE site_key = ?',
+                (site_key,)).fetchone()
+            if row is None:
+                conn.execute('INSERT INTO sites (site_key) VALUES (?)',
+                             (site_key,))
+                row = (None, None, 0, 0)
+            last = dict(zip(KINDS, row[:2]))
+            last[kind] = stamp
+            self._update_due(conn, site_key, last['pdf'], last['alert'],
+                             row[2], row[3])
+
+    def record_delivery(self, site_key, kind, ok, error=None, final=False,
+                        when=None):
+        """Record the outcome of delivering a `kind` email for a site.
+
+        A `final` failure (the outbox gave up) rewinds the site's last
+        `kind` time to the last delivery that did succeed, so the site is
+        due again instead of counting an email nobody received.
+        """
+        if kind not in KINDS:
+            raise ValueError('unknown timestamp kind {!r}'.format(kind))
+        stamp = _utc_stamp() if when is None else when.timestamp()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT last_pdf, last_alert, pdf_interval_hours, '
+                'alert_interval_hours, last_{}_delivered FROM sites '
+                'WHERE site_key = ?'.format(kind), (site_key,)).fetchone()
+            if row is None:
+                return
+            if ok:
+                conn.execute(
+                    'UPDATE sites SET last_{}_delivered = ?, '
+                    'last_delivery_error = NULL WHERE site_key = ?'.format(kind),
+                    (stamp, site_key))
+                return
+            conn.execute(
+                'UPDATE sites SET last_delivery_error = ? WHERE site_key = ?',
+                (error, site_key))
+            if final:
+                last = dict(zip(KINDS, row[:2]))
+                last[kind] = row[4]
+                self._update_due(conn, site_key, last['pdf'], last['alert'],
+                                 row[2], row[3])
+
+    def delivery(self, site_key, kind):
+        """`(last delivered, last delivery error)` for a site's `kind` emails."""
+        if kind not in KINDS:
+            raise ValueError('unknown timestamp kind {!r}'.format(kind))
+        row = self._connection().execute(
+            'SELECT last_{}_delivered, last_delivery_error FROM sites '
+            'WHERE site_key = ?'.format(kind), (site_key,)).fetchone()
+        if row is None:
+            return None, None
+        delivered = None if row[0] is None else datetime.fromtimestamp(row[0])
+        return delivered, row[1]
+
+    def next_due(self, site_key):
+        row = self._connection().execute(
+            'SELECT next_due FROM sites WHERE site_key = ?',
+            (site_key,)).fetchone()
+        if row is None:
+            return None
+        return datetime.fromtimestamp(row[0])
+
+    def due(self, now=None):
+        """Keys of every site whose PDF or alert interval has elapsed.
+
+        `now` is a naive UTC datetime, like `datetime.utcnow()`.
+        """
+        stamp = _utc_stamp() if now is None else now.timestamp()
+        rows = self._connection().execute(
+            'SELECT site_key FROM sites WHERE next_due <= ? ORDER BY next_due',
+            (stamp,))
+        return [r[0] for r in rows]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_state_store(path):
+    """Return the process-wide `StateStore` for `path`."""
+    path = os.path.realpath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+        return _stores[path]
+
+
+def register_reports(reports):
+    """Register the state of many `WeatherReport`s, one transaction per
+    state database, so a run does not write once per site.
+
+    Reports already registered, and those without a state database, are
+    left alone; the rest find their store registered when they run. If a
+    database cannot be written, its reports are left to register one by
+    one, so each site reports the error itself.
+    """
+    batches = {}
+    for report in reports:
+        if report._state_store is not None:
+            continue
+        path = report.state_store_path
+        if path:
+            batches.setdefault(os.path.realpath(path), []).append(report)
+    for path, members in batches.items():
+        try:
+            store = get_state_store(path)
+            store.register_many(r.state_registration for r in members)
+        except Exception as e:
+            logger.warning('Could not register sites in {}: {}'.format(
+                path, e))
+            continue
+        for report in members:
+            report._state_store = store
@@ -1,13 +1,36 @@
 
+import io
 import os
+import math
+import hashlib
+import re
+import tempfile
+import threading
 from datetime import datetime, timedelta
-import pandas
-import pdfkit
-import logging
+from collections import OrderedDict
 
 from .configurator import WeatherParser
-from .helper import _write_timestamp, _read_timestamp
-from .email_handler import send_msg
+from .helper import _write_timestamp, _read_timestamp, _lazy_import
+from .fetch import get_fetcher, FetchError
+from .cache import ResponseCache
+from .archive import ForecastArchive, issued_time, _frame_digest
+from .state import get_state_store
+from .outbox import get_outbox
+from .render import get_render_queue, RenderError
+from .pdfstore import PdfStore, image_urls
+from .gridpoint import (
+    DEFAULT_BASE_URL, fetch_gridpoint, get_gridpoint_cache, resolve)
+from .rules import VARIABLES, Rule, parse_rules, stack_forecasts, evaluate
+from . import metrics, logs
+
+# heavy dependencies are imported when a parse, render or email needs them
+numpy = _lazy_import('numpy')
+pandas = _lazy_import('pandas')
+pdfkit = _lazy_import('pdfkit')
+
+# where `noaa_tabular` comes from: the scraped MapClick digital page, or the
+# api.weather.gov gridpoint JSON (see `gridpoint.py`)
+FORECAST_BACKENDS = ('digital', 'gridpoint')
 
 
 def _find_weather_data(tables):
@@ -18,12 +41,13 @@ def _find_weather_data(tables):
 
 
 def _get_nan_indices(table):
-    idxs = list(pandas.isnull(table[0]).nonzero()[0])
+    idxs = list(numpy.flatnonzero(pandas.isnull(table[0]).values))
     idxs.append(len(table))
     return idxs
 
 
-def _cleanup_table(table, nan_indices):
+def _cleanup_blocks(table, nan_indices):
+    """Transpose each NaN-separated block and stack them, one at a time."""
     dfs = []
     i = 0
     for ix in nan_indices:
@@ -36,40 +60,253 @@ def _cleanup_table(table, nan_indices):
     return pandas.concat(dfs).reset_index(drop=True)
 
 
+def _cleanup_table(table, nan_indices=None):
+    """Reshape the raw forecast grid into one row per forecast hour.
+
+    The raw table is a stack of blocks separated by blank rows; each block
+    has one row per variable (label in the first column) and one column per
+    hour. When every block has the same labels -- always the case for NOAA's
+    page -- the whole grid is reshaped in one step with NumPy. Otherwise the
+    blocks are transposed one by one.
+    """
+    values = table.values
+    keep = pandas.notnull(values[:, 0])
+    block_ids = numpy.cumsum(~keep)[keep]
+    rows = values[keep]
+
+    _, counts = numpy.unique(block_ids, return_counts=True)
+    if len(counts) == 0 or (counts != counts[0]).any():
+        if nan_indices is None:
+            nan_indices = _get_nan_indices(table)
+        return _cleanup_blocks(table, nan_indices)
+
+    n_labels = counts[0]
+    blocks = rows.reshape(len(counts), n_labels, values.shape[1])
+    labels = blocks[0, :, 0]
+    if (blocks[:, :, 0] != labels).any():
+        if nan_indices is None:
+            nan_indices = _get_nan_indices(table)
+        return _cleanup_blocks(table, nan_indices)
+
+    data = blocks[:, :, 1:].transpose(0, 2, 1).reshape(-1, n_labels)
+    return pandas.DataFrame(data, columns=pandas.Index(labels, dtype=object))
+
+
 def _coerce_float(clean, col_strs):
     float_cols = []
     for c in clean.columns:
         for col in col_strs:
             if col in c.lower():
                 float_cols.append(c)
+                break
     clean[float_cols] = clean[float_cols].astype(float)
     return clean
 
 
-def _cleanup_date(clean, date):
-    clean[date] = clean[date].fillna(method='ffill')
+def _forecast_years(months, now):
+    """Year of each forecast month, rolling over at the new year.
+
+    A forecast never spans more than a few days, so a month far behind
+    `now` belongs to next year and one far ahead to last year.
+    """
+    delta = months - now.month
+    return now.year + (delta < -6).astype(int) - (delta > 6).astype(int)
+
+
+def _cleanup_date(clean, date, now=None):
+    if now is None:
+        now = datetime.now()
     for c in clean.columns:
         if 'hour' in c.lower():
             hour_col = c
-    clean[date] = str(datetime.now().year) + " " + \
-        clean[date] + " " + clean[hour_col].astype(str)
-    clean[date] = pandas.to_datetime(clean[date], format='%Y %m/%d %H.%M')
+
+    # only a handful of distinct dates; split those and broadcast back
+    codes, uniques = pandas.factorize(clean[date].ffill())
+    month_day = numpy.array([list(map(int, u.split('/'))) for u in uniques])
+    months = month_day[codes, 0]
+    stamps = pandas.to_datetime(pandas.DataFrame({
+        'year': _forecast_years(months, now),
+        'month': months,
+        'day': month_day[codes, 1],
+    }))
+    hours = pandas.to_timedelta(clean[hour_col].astype(float).values, unit='h')
+    clean[date] = stamps.values + hours
     return clean
 
 
-def _process_html(url):
-    tables = pandas.read_html(url)
-    table = _find_weather_data(tables)
-    nan_indices = _get_nan_indices(table)
+def _read_forecast_table(html, encoding=None):
+    """Pull the raw digital forecast table out of a page.
+
+    Uses the targeted streaming extractor and falls back to parsing every
+    table with `pandas.read_html` if the page layout is not recognized.
+    """
+    from .extract import extract_forecast_table
+
+    table = extract_forecast_table(html, encoding=encoding)
+    if table is None:
+        if isinstance(html, bytes):
+            html = html.decode(encoding or 'utf-8', errors='replace')
+        tables = pandas.read_html(io.StringIO(html))
+        table = _find_weather_data(tables)
+    return table
+
 
-    clean = (table
-             .pipe(_cleanup_table, nan_indices)
-             .pipe(_coerce_float, ['dewpoint', 'gust', 'hour', 'humidity', 'mph', 'temperature', '%'])
-             .pipe(_cleanup_date, 'Date')
-             )
+def _parse_tabular(html, encoding=None):
+    with metrics.span('parse', html_bytes=len(html)) as span:
+        table = _read_forecast_table(html, encoding)
+        span.attrs['raw_rows'] = len(table)
+
+    with metrics.span('cleanup') as span:
+        clean = (table
+                 .pipe(_cleanup_table)
+                 .pipe(_coerce_float, ['dewpoint', 'gust', 'hour', 'humidity', 'mph', 'temperature', '%'])
+                 .pipe(_cleanup_date, 'Date')
+                 )
+        span.attrs['rows'] = len(clean)
+    return clean
+
+
+# url: (sha1, frame) of the last parse of each url, least recently used
+# first; bounded so a long-running process does not keep every frame
+_parsed_lock = threading.Lock()
+_parsed_pages = OrderedDict()
+_PARSED_PAGES_MAX = 64
+
+
+def _parse_response(response):
+    """Parse a fetched tabular page, reusing the last parse of the same body.
+
+    A 304, a cache hit or an unchanged reissue all produce a body identical
+    to the last one parsed for that url, so the previous frame is returned
+    instead of parsing the same page again.
+    """
+    digest = hashlib.sha1(response.body).hexdigest()
+
+    with _parsed_lock:
+        cached = _parsed_pages.get(response.url)
+        if cached is not None:
+            _parsed_pages.move_to_end(response.url)
+    if cached is not None and cached[0] == digest:
+        return cached[1].copy()
+
+    clean = _parse_tabular(response.body, response.charset)
+    with _parsed_lock:
+        _parsed_pages[response.url] = (digest, clean.copy())
+        _parsed_pages.move_to_end(response.url)
+        while len(_parsed_pages) > _PARSED_PAGES_MAX:
+            _parsed_pages.popitem(last=False)
     return clean
 
 
+def parsed_pages_nbytes():
+    """Memory held by the frames kept to skip re-parsing unchanged pages."""
+    with _parsed_lock:
+        frames = [frame for _, frame in _parsed_pages.values()]
+    return sum(int(f.memory_usage(deep=True).sum()) for f in frames)
+
+
+def _fetch_page(url, fetcher, cache=None):
+    """`fetcher.get(url)`, timed as a 'fetch' span."""
+    with metrics.span('fetch', url=url) as span:
+        response = fetcher.get(url, cache=cache)
+        span.attrs.update(bytes=len(response.body), status=response.status,
+                          from_cache=response.from_cache,
+                          not_modified=response.not_modified)
+    return response
+
+
+def _fetch_tabular(url, fetcher=None, cache=None):
+    """Fetch the tabular forecast at `url`; returns `(response, frame)`."""
+    if fetcher is None:
+        fetcher = get_fetcher()
+    response = _fetch_page(url, fetcher, cache)
+    return response, _parse_response(response)
+
+
+def _process_html(url, fetcher=None, cache=None):
+    """Fetch and parse the tabular forecast at `url`.
+
+    The page is fetched through the shared `Fetcher` (and `cache`, if
+    given).
+    """
+    return _fetch_tabular(url, fetcher, cache)[1]
+
+
+def _add_base_href(body, url):
+    """Point relative links in a saved page back at `url`."""
+    tag = '<base href="{}">'.format(url).encode('utf-8')
+    match = re.search(br'<head[^>]*>', body, flags=re.IGNORECASE)
+    if match is None:
+        return tag + body
+    return body[:match.end()] + tag + body[match.end():]
+
+
+def _stage_pages(urls, get_page, directory):
+    """Save each page as a local html file for wkhtmltopdf.
+
+    `get_page(url)` returns the fetched `Response`, so pages already
+    downloaded this run are rendered from memory. Returns the list of
+    renderer inputs. Pages that cannot be fetched here are passed through
+    as urls so wkhtmltopdf can try them itself.
+    """
+    inputs = []
+    for i, url in enumerate(urls):
+        try:
+            response = get_page(url)
+        except FetchError:
+            inputs.append(url)
+            continue
+        if 'html' not in response.headers.get('content-type', 'text/html'):
+            inputs.append(url)
+            continue
+        path = os.path.join(directory, 'page{:02d}.html'.format(i))
+        with open(path, 'wb') as f:
+            f.write(_add_base_href(response.body, url))
+        inputs.append(path)
+    return inputs
+
+
+# columns kept by `_compact_table`, i.e. those alert rules can use; matched
+# as lower-case substrings
+_COMPACT_COLUMNS = list(VARIABLES.values())
+
+
+def _compact_table(df, keep=None, date='Date'):
+    """Shrink a parsed forecast to what the thresholds and reports use.
+
+    Only the `Date` and the `keep` columns survive. Numbers become float32,
+    text becomes categorical and `Date` becomes an int64 index of epoch
+    seconds.
+    """
+    if keep is None:
+        keep = _COMPACT_COLUMNS
+    cols = [c for c in df.columns
+            if c != date and any(k in c.lower() for k in keep)]
+
+    out = {}
+    for c in cols:
+        col = df[c]
+        if col.dtype.kind == 'f':
+            out[c] = col.values.astype(numpy.float32)
+        elif col.dtype.kind in 'iub':
+            out[c] = col.values
+        else:
+            out[c] = pandas.Categorical(col.values)
+
+    stamps = df[date].values.astype('datetime64[s]').astype(numpy.int64)
+    return pandas.DataFrame(out, columns=cols,
+                            index=pandas.Index(stamps, name=date))
+
+
+def _expand_compact(df, date='Date'):
+    """Give a compact frame its datetime `Date` column back."""
+    if date in df.columns:
+        return df
+    out = df.reset_index()
+    out[date] = pandas.to_datetime(out[date], unit='s')
+    return out
+
+
 def _get_precip_col(df):
     for c in df.columns:
         if all([i in c.lower() for i in ['precip', 'potential']]):
@@ -104,6 +341,18 @@ def _get_lat_long(url):
     return out
 
 
+def _grid_cell(coords, km=2.5):
+    """Snap `coords` (as returned by `_get_lat_long`) to a ~`km` grid.
+
+    NOAA's digital forecast is issued on a 2.5 km grid, so sites that snap to
+    the same cell receive the same forecast page.
+    """
+    lat, lon = float(coords['lat']), float(coords['lon'])
+    lat_step = km / 111.32
+    lon_step = lat_step / max(math.cos(math.radians(lat)), 0.01)
+    return int(round(lat / lat_step)), int(round(lon / lon_step))
+
+
 def _replace_query(url, dct):
     domain, query = url.split('?')
     queries = query.split("&")
@@ -173,13 +422,27 @@ class WeatherReport(object):
                  alert_email_list=None,
                  attach_alert_pdf_bool=None,
                  alert_resend_interval_hours=None,
+                 alert_rules_list=None,
                  pdf_content_order_list=None,
                  additional_urls_list=None,
                  silent_mode_bool=None,
+                 cache_ttl_minutes=None,
+                 compact_mode_bool=None,
+                 archive_folder=None,
+                 state_db_path=None,
+                 smtp_host=None,
+                 smtp_tls_bool=None,
+                 outbox_path=None,
+                 forecast_backend=None,
+                 gridpoint_base_url=None,
                  **kwargs,
                  ):
         self.user = user
         self.pwd = pwd
+        self.smtp_host = smtp_host
+        if smtp_tls_bool is None:
+            smtp_tls_bool = True
+        self.smtp_tls_bool = smtp_tls_bool
         self.primary_contact_name = primary_contact_name
         self.primary_contact_email = primary_contact_email
         self.site_description = site_description
@@ -224,6 +487,9 @@ class WeatherReport(object):
             alert_resend_interval_hours = 0
         self.alert_resend_interval_hours = float(alert_resend_interval_hours)
 
+        self.alert_rules_list = _to_list(alert_rules_list)
+        self._rules = parse_rules(self.alert_rules_list)
+
         if pdf_content_order_list is None:
             pdf_content_order_list = [1, 2, 3]
         self.pdf_content_order_list = pdf_content_order_list
@@ -234,6 +500,32 @@ class WeatherReport(object):
             silent_mode_bool = False
         self.silent_mode_bool = silent_mode_bool
 
+        if cache_ttl_minutes is None:
+            cache_ttl_minutes = 60
+        self.cache_ttl_minutes = float(cache_ttl_minutes)
+
+        if compact_mode_bool is None:
+            compact_mode_bool = False
+        self.compact_mode_bool = compact_mode_bool
+
+        self.archive_folder = archive_folder
+
+        self.state_db_path = state_db_path
+
+        self.outbox_path = outbox_path
+
+        if forecast_backend is None:
+            forecast_backend = 'digital'
+        if forecast_backend not in FORECAST_BACKENDS:
+            e = "forecast_backend must be one of {}, not {!r}".format(
+                ', '.join(FORECAST_BACKENDS), forecast_backend)
+            raise ValueError(e)
+        self.forecast_backend = forecast_backend
+
+        if gridpoint_base_url is None:
+            gridpoint_base_url = DEFAULT_BASE_URL
+        self.gridpoint_base_url = gridpoint_base_url
+
         self.unused_args = kwargs
 
         required = ['primary_contact_name', 'primary_contact_email',
@@ -267,12 +559,39 @@ class WeatherReport(object):
         self._precip_column = None
         self._precip_table = None
         self._logger = None
+        self._fetcher = None
+        self._response_cache = None
+        self._tabular_issued = None
+        self._pages = {}
+        self._pdf_reused = False
+        self._archive = None
+        self._state_store = None
+        self._outbox = None
+        self._render_result = None
+        self._triggered_rules = None
+
+        # optional callable returning the fetched tabular page and its
+        # parsed frame; used to share one fetch between sites in the same
+        # forecast grid cell.
+        self.forecast_source = None
+        # a `digest.Digest` collecting this site's emails, if any
+        self.digest = None
+        self.grid_key = None
 
     @classmethod
     def from_input_file(cls, input_file):
         config = WeatherParser(input_file)
-        options = config.dict
-        w = cls(**options['project_info'], **options['options'], **options['gmail'])
+        return cls.from_options(config.dict, config)
+
+    @classmethod
+    def from_options(cls, options, config=None):
+        """Build a report from parsed `{section: {option: value}}` options.
+
+        `config` is the `WeatherParser` or `SiteConfig` they came from.
+        """
+        w = cls(**options.get('project_info', {}),
+                **options.get('options', {}),
+                **options.get('gmail', {}))
         w._config = config
         return w
 
@@ -288,24 +607,140 @@ class WeatherReport(object):
                 directory = self.config.directory
             logfile = self.site_short_name + ".log"
 
-            logging.basicConfig(filename=os.path.join(directory, logfile),
-                                format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                                level=logging.INFO,
-                                )
-            self._logger = logging.getLogger(__name__)
+            # per-site file, written by the shared background log writer
+            self._logger = logs.site_logger(
+                os.path.join(directory, logfile), __name__)
         return self._logger
 
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            self._fetcher = get_fetcher()
+        return self._fetcher
+
+    @fetcher.setter
+    def fetcher(self, value):
+        self._fetcher = value
+
+    @property
+    def response_cache(self):
+        if self._response_cache is None and self.cache_ttl_minutes > 0:
+            directory = os.getcwd()
+            if self.config is not None:
+                directory = self.config.directory
+            self._response_cache = ResponseCache(
+                os.path.join(directory, '.weather_cache'),
+                ttl=self.cache_ttl_minutes * 60)
+        return self._response_cache
+
     @property
     def noaa_tabular(self):
         if self._noaa_tabular is None:
             try:
-                self._noaa_tabular = _process_html(self.urls[1])
+                if self.forecast_source is not None:
+                    page, table = self.forecast_source()
+                else:
+                    page, table = self.fetch_forecast()
+                # a shared forecast may be a neighbour's page; only our own
+                # is rendered into our PDF, see `_get_page`
+                if page.url == self.urls[1]:
+                    self._pages[self.urls[1]] = page
+                # only the issue time; the body is not kept past the parse
+                self._tabular_issued = issued_time(page)
+                self._noaa_tabular = table
+                if self.archive is not None:
+                    self._archive_forecast()
+                if self.compact_mode_bool:
+                    self._noaa_tabular = _compact_table(self._noaa_tabular)
+                self.logger.info("Forecast table: {} bytes".format(
+                    self.tabular_nbytes))
             except Exception as e:
                 self.logger.exception(e)
                 if not self.silent_mode_bool:
                     raise(e)
         return self._noaa_tabular
 
+    @property
+    def gridpoint_cache(self):
+        directory = os.getcwd()
+        if self.config is not None:
+            directory = self.config.directory
+        return get_gridpoint_cache(
+            os.path.join(directory, '.weather_cache', 'gridpoints.json'))
+
+    def _fetch(self, url):
+        return _fetch_page(url, self.fetcher, self.response_cache)
+
+    @property
+    def gridpoint(self):
+        """This site's api.weather.gov gridpoint (see `gridpoint.resolve`)."""
+        return resolve(_get_lat_long(self.site_map_click_url), self._fetch,
+                       base_url=self.gridpoint_base_url,
+                       cache=self.gridpoint_cache)
+
+    def fetch_forecast(self):
+        """Fetch and parse this site's forecast from `forecast_backend`.
+
+        Returns `(response, frame)`; the frame has the digital table's
+        columns whichever backend it came from.
+        """
+        if self.forecast_backend == 'gridpoint':
+            return fetch_gridpoint(
+                _get_lat_long(self.site_map_click_url), self._fetch,
+                base_url=self.gridpoint_base_url,
+                cache=self.gridpoint_cache)
+        return _fetch_tabular(self.urls[1], self.fetcher, self.response_cache)
+
+    def _get_page(self, url):
+        """Fetch `url` at most once per run.
+
+        The tabular page comes from loading `noaa_tabular`, so the bytes
+        that were parsed are the bytes that get rendered, unless the
+        forecast came from the gridpoint backend or was shared by another
+        site; then this site's own page is fetched.
+        """
+        if url not in self._pages and url == self.urls[1]:
+            self.noaa_tabular
+        if url not in self._pages:
+            self._pages[url] = _fetch_page(url, self.fetcher,
+                                           self.response_cache)
+        return self._pages[url]
+
+    @property
+    def archive(self):
+        if self._archive is None and self.archive_folder:
+            directory = os.getcwd()
+            if self.config is not None:
+                directory = self.config.directory
+            self._archive = ForecastArchive(
+                os.path.join(directory, self.archive_folder))
+        return self._archive
+
+    def _archive_forecast(self):
+        try:
+            path = self.archive.append(self.site_short_name, self._noaa_tabular,
+                                       issued=self._tabular_issued)
+            if path is not None:
+                self.logger.info("Archived forecast: {}".format(path))
+        except Exception as e:
+            self.logger.exception(e)
+            if not self.silent_mode_bool:
+                raise(e)
+
+    @property
+    def tabular_nbytes(self):
+        """Memory held by this site's parsed forecast, including strings."""
+        if self._noaa_tabular is None:
+            return 0
+        return int(self._noaa_tabular.memory_usage(deep=True).sum())
+
+    @property
+    def retained_nbytes(self):
+        """Memory this site holds until `reset`: its parsed forecast and
+        the bodies of the pages it fetched for its PDF."""
+        return self.tabular_nbytes + sum(
+            len(page.body) for page in self._pages.values())
+
     @property
     def precip_column(self):
         if self._precip_column is None:
@@ -316,7 +751,8 @@ class WeatherReport(object):
     def precip_table(self):
         if self._precip_table is None:
             self._precip_table = (
-                self.noaa_tabular.loc[:, ('Date', self.precip_column)]
+                _expand_compact(self.noaa_tabular)
+                .loc[:, ('Date', self.precip_column)]
                 .pipe(_get_greater_than, self.precip_column, self.alert_threshold_value, pct_threshold=25)
             )
         return self._precip_table
@@ -328,65 +764,217 @@ class WeatherReport(object):
         return 0
 
     @property
-    def needs_alert(self):
-        over_thresh = self.precip_max >= self.alert_threshold_value
+    def state_key(self):
+        """Identifies this site in the state store."""
+        if self.config is not None:
+            return self.config.filename
+        return self.site_short_name
 
-        try:
-            last_alert_time = self._read_last_alert_file()
-            tolerance = timedelta(minutes=5)
-            interval = timedelta(hours=float(
-                self.alert_resend_interval_hours)) - tolerance
-            out_of_date = datetime.utcnow() - interval > last_alert_time
+    @property
+    def state_store_path(self):
+        # queued mail reports back to a state store, so a site that has an
+        # outbox but no state database keeps its state in the outbox's
+        path = self.state_db_path or self.outbox_path
+        if not path:
+            return None
+        directory = os.getcwd()
+        if self.config is not None:
+            directory = self.config.directory
+        return os.path.join(directory, path)
 
-        except FileNotFoundError as e:
-            out_of_date = True
+    @property
+    def state_registration(self):
+        """Arguments of `StateStore.register` for this site."""
+        return (self.state_key, self.pdf_save_interval_hours,
+                self.alert_resend_interval_hours, {
+                    'pdf': (self._dotfile(self.pdf_fname), self.pdf_tsnote),
+                    'alert': (self._dotfile(self.alert_fname),
+                              self.alert_tsnote),
+                })
 
-        return over_thresh and out_of_date
+    @property
+    def state_store(self):
+        # `state.register_reports` registers many sites at once
+        path = self.state_store_path
+        if self._state_store is None and path:
+            store = get_state_store(path)
+            store.register(*self.state_registration)
+            self._state_store = store
+        return self._state_store
 
-    def _read_last_alert_file(self):
+    @property
+    def outbox(self):
+        if self._outbox is None and self.outbox_path:
+            directory = os.getcwd()
+            if self.config is not None:
+                directory = self.config.directory
+            outbox = get_outbox(os.path.join(directory, self.outbox_path))
+            outbox.set_password(self.smtp_host, self.user, self.pwd,
+                                tls=self.smtp_tls_bool)
+            self._outbox = outbox
+        return self._outbox
+
+    def _send_email(self, kind, recipients, subject, body, attachments):
+        """Send an email now, or queue it when there is an outbox.
+
+        Returns 'Queued' or 'Sent'.
+        """
+        attachment_bytes = sum(os.path.getsize(a) for a in attachments
+                               if a and os.path.exists(a))
+        if self.outbox is not None:
+            state_db = None
+            if self.state_store is not None:
+                state_db = self.state_store.path
+            with metrics.span('enqueue', kind=kind,
+                              recipients=len(recipients),
+                              attachment_bytes=attachment_bytes):
+                self.outbox.enqueue(self.user, recipients, subject, body,
+                                    attachments, host=self.smtp_host,
+                                    pwd=self.pwd, tls=self.smtp_tls_bool,
+                                    site_key=self.state_key, kind=kind,
+                                    state_db=state_db)
+            return 'Queued'
+
+        from .email_handler import send_msg
+        with metrics.span('smtp', kind=kind, recipients=len(recipients),
+                          attachment_bytes=attachment_bytes):
+            send_msg(self.user, self.pwd, recipients, subject, body,
+                     attachments=attachments, verbose=False,
+                     host=self.smtp_host, tls=self.smtp_tls_bool)
+        return 'Sent'
+
+    def _dotfile(self, fname):
         directory = os.getcwd()
         if self.config is not None:
             directory = self.config.directory
-        fpath = os.path.join(directory, self.alert_fname)
+            if self.config.site is not None:
+                # the sites of a bulk file share its folder
+                fname = '{}.{}'.format(fname, self.config.slug)
+        return os.path.join(directory, fname)
+
+    @property
+    def last_alert_time(self):
+        """Naive UTC time the last alert was sent, or None."""
+        try:
+            return self._read_last_alert_file()
+        except FileNotFoundError as e:
+            return None
+
+    @property
+    def last_pdf_time(self):
+        """Naive UTC time the last PDF was saved, or None."""
+        try:
+            return self._read_last_pdf_file()
+        except FileNotFoundError as e:
+            return None
+
+    @property
+    def alert_due(self):
+        """Whether the alert resend interval has passed; never fetches."""
+        last_alert_time = self.last_alert_time
+        if last_alert_time is None:
+            return True
+        tolerance = timedelta(minutes=5)
+        interval = timedelta(hours=float(
+            self.alert_resend_interval_hours)) - tolerance
+        return datetime.utcnow() - interval > last_alert_time
+
+    @property
+    def alert_rules(self):
+        """The `Rule`s that raise an alert: `alert_threshold_value` on the
+        chance of rain, if above 0, and each of `alert_rules_list`."""
+        rules = list(self._rules)
+        if self.alert_threshold_value > 0:
+            threshold = Rule('precip', '>=', self.alert_threshold_value)
+            if threshold not in rules:
+                rules.insert(0, threshold)
+        return rules
+
+    @property
+    def triggered_rules(self):
+        """The `alert_rules` this run's forecast meets.
+
+        Evaluated on first use unless the runner already set it from one
+        pass over many sites (see `runner.evaluate_alerts`).
+        """
+        if self._triggered_rules is None:
+            rules = self.alert_rules
+            table = self.noaa_tabular if rules else None
+            if table is None:
+                return []
+            with metrics.span('rules', sites=1, rows=len(table)):
+                pairs = evaluate(stack_forecasts({self.state_key: table}),
+                                 {self.state_key: rules})
+            self._triggered_rules = [r for r in rules
+                                     if (self.state_key, r) in pairs]
+        return self._triggered_rules
+
+    @triggered_rules.setter
+    def triggered_rules(self, rules):
+        self._triggered_rules = rules
+
+    @property
+    def alert_conditions(self):
+        """Triggered rules other than the plain chance-of-rain threshold,
+        in words."""
+        threshold = Rule('precip', '>=', self.alert_threshold_value)
+        return [r.describe() for r in self.triggered_rules if r != threshold]
+
+    @property
+    def needs_alert(self):
+        # check the cheap timestamp first; only fetch the forecast if the
+        # answer depends on it.
+        if not self.alert_due:
+            return False
+        if not self.alert_rules:
+            # no threshold or rules: alert every interval
+            return True
+        return bool(self.triggered_rules)
+
+    def _read_last_alert_file(self):
+        if self.state_store is not None:
+            return self.state_store.read(self.state_key, 'alert')
+        fpath = self._dotfile(self.alert_fname)
         return _read_timestamp(fpath, note=self.alert_tsnote)
 
     def _write_last_alert_file(self):
-
-        directory = os.getcwd()
-        if self.config is not None:
-            directory = self.config.directory
-        fpath = os.path.join(directory, self.alert_fname)
+        if self.state_store is not None:
+            self.state_store.write(self.state_key, 'alert')
+            return
+        fpath = self._dotfile(self.alert_fname)
         _write_timestamp(fpath, note=self.alert_tsnote)
 
     @property
     def needs_new_pdf(self):
-        over_thresh = self.precip_max >= self.pdf_threshold_value
-
-        try:
-            last_pdf_time = self._read_last_pdf_file()
+        # check the cheap timestamp first; only fetch the forecast if the
+        # answer depends on it.
+        last_pdf_time = self.last_pdf_time
+        if last_pdf_time is None:
+            out_of_date = True
+        else:
             tolerance = timedelta(minutes=5)
             interval = timedelta(hours=float(
                 self.pdf_save_interval_hours)) - tolerance
             out_of_date = datetime.utcnow() - interval > last_pdf_time
 
-        except FileNotFoundError as e:
-            out_of_date = True
-
-        return over_thresh and out_of_date
+        if not out_of_date:
+            return False
+        if self.pdf_threshold_value <= 0:
+            # precip_max is never negative
+            return True
+        return self.precip_max >= self.pdf_threshold_value
 
     def _read_last_pdf_file(self):
-        directory = os.getcwd()
-        if self.config is not None:
-            directory = self.config.directory
-        fpath = os.path.join(directory, self.pdf_fname)
+        if self.state_store is not None:
+            return self.state_store.read(self.state_key, 'pdf')
+        fpath = self._dotfile(self.pdf_fname)
         return _read_timestamp(fpath, note=self.pdf_tsnote)
 
     def _write_last_pdf_file(self):
-
-        directory = os.getcwd()
-        if self.config is not None:
-            directory = self.config.directory
-        fpath = os.path.join(directory, self.pdf_fname)
+        if self.state_store is not None:
+            self.state_store.write(self.state_key, 'pdf')
+            return
+        fpath = self._dotfile(self.pdf_fname)
         _write_timestamp(fpath, note=self.pdf_tsnote)
 
     @property
@@ -395,7 +983,7 @@ class WeatherReport(object):
             if self.config is None:
                 if not os.path.exists(self.local_pdf_folder):
                     os.makedirs(self.local_pdf_folder)
-                self.save_dir = self.local_pdf_folder
+                self._save_dir = self.local_pdf_folder
             else:
                 path = os.path.join(self.config.directory,
                                     self.local_pdf_folder)
@@ -410,11 +998,24 @@ class WeatherReport(object):
             self._urls = _build_default_url_list(self.site_map_click_url)
         return self._urls
 
+    @property
+    def grid_cell(self):
+        return _grid_cell(_get_lat_long(self.site_map_click_url))
+
     @property
     def pdf_path(self):
         return self._pdf_path
 
     def send_pdf_email(self):
+        attachments = []
+        if self.attach_pdf_bool:
+            attachments.append(self.pdf_path)
+
+        if self.digest is not None:
+            self.digest.add(self, 'pdf', self.pdf_email_list, attachments)
+            self.logger.info(
+                "PDF Email queued for digest to: {}".format(self.pdf_email_list))
+            return
 
         _email_subject = 'NOAA Forecast for {}.'.format(
             self.site_short_name
@@ -442,24 +1043,42 @@ class WeatherReport(object):
                            self.precip_table.to_html(index=False),
                            self.urls[1], self.primary_contact_name
                            )
-        attachments = []
-        if self.attach_pdf_bool:
-            attachments.append(self.pdf_path)
-
         try:
-            send_msg(self.user, self.pwd, self.pdf_email_list, _email_subject,
-                     _email_body, attachments=attachments, verbose=False)
+            status = self._send_email('pdf', self.pdf_email_list,
+                                      _email_subject, _email_body, attachments)
             self.logger.info(
-                "PDF Email Sent to: {}".format(self.pdf_email_list))
+                "PDF Email {} to: {}".format(status, self.pdf_email_list))
         except Exception as e:
             self.logger.exception(e)
             if not self.silent_mode_bool:
                 raise(e)
 
     def send_alert_email(self):
+        attachments = []
+        if self.attach_alert_pdf_bool:
+            # reuse the PDF saved earlier in this run, if there is one
+            if self.pdf_path is None or not os.path.exists(self.pdf_path):
+                self.save_pdf()
+            attachments.append(self.pdf_path)
+
+        if self.digest is not None:
+            self.digest.add(self, 'alert', self.alert_email_list, attachments,
+                            on_sent=self._write_last_alert_file)
+            self.logger.info(
+                "Alert Email queued for digest to: {}".format(
+                    self.alert_email_list))
+            return
+
         _email_subject = 'ALERT: NOAA Forecast expects greater than {}% chance of rain in next 48 hours at {}.'.format(
             self.alert_threshold_value, self.site_short_name
         )
+        _conditions = ''
+        if self.alert_conditions:
+            _email_subject = 'ALERT: NOAA Forecast expects {} at {}.'.format(
+                '; '.join(self.alert_conditions), self.site_short_name)
+            _conditions = '<p><TT>Alert conditions met:</TT><ul>{}</ul>'.format(
+                ''.join('<li><TT>{}</TT></li>'.format(c)
+                        for c in self.alert_conditions))
 
         _email_body = '''
                 <p><TT>
@@ -471,7 +1090,7 @@ class WeatherReport(object):
                 A project near {} expects a {}%
                 chance of rain in the next 48 hrs.
                 The forecast is shown below:</TT>
-
+                {}
                 <p><TT>{}</TT>
                 <p><TT>Source: {}</TT>
                 <hr>
@@ -480,26 +1099,60 @@ class WeatherReport(object):
                 contact {}.
                 </TT>
                 '''.format(self.site_short_name , self.precip_max,
+                           _conditions,
                            self.precip_table.to_html(index=False),
                            self.urls[1], self.primary_contact_name
                            )
 
-        attachments = []
-        if self.attach_alert_pdf_bool:
-            self.save_pdf()
-            attachments.append(self.pdf_path)
-
         try:
-            send_msg(self.user, self.pwd, self.alert_email_list, _email_subject,
-                     _email_body, attachments=attachments, verbose=False)
+            status = self._send_email('alert', self.alert_email_list,
+                                      _email_subject, _email_body, attachments)
             self.logger.info(
-                "Alert Email Sent to: {}".format(self.alert_email_list))
+                "Alert Email {} to: {}".format(status, self.alert_email_list))
 
         except Exception as e:
             self.logger.exception(e)
             if not self.silent_mode_bool:
                 raise(e)
 
+    @property
+    def pdf_store(self):
+        return PdfStore(os.path.join(self.save_dir, '.pdf_store'))
+
+    def _render_digest(self, urls, options):
+        """Hash of everything the PDF would be rendered from, or None.
+
+        Besides the pages, this covers the images they show, by ETag (or
+        Last-Modified, or a hash of the image when the server sends
+        neither); those go through the response cache, so an unchanged
+        image costs a conditional GET. None means some page or image could
+        not be fetched here, so the PDF has to be rendered (wkhtmltopdf
+        will try them itself).
+        """
+        try:
+            responses = [self._get_page(url) for url in urls]
+            images = []
+            for url, response in zip(urls, responses):
+                if 'html' not in response.headers.get('content-type',
+                                                      'text/html'):
+                    continue
+                # relative to `url`, like the <base> of the staged page
+                for src in image_urls(response.body, url):
+                    if any(src == u for u, _ in images):
+                        continue
+                    image = _fetch_page(src, self.fetcher,
+                                        self.response_cache)
+                    images.append((src, image.validator or hashlib.sha1(
+                        image.body).hexdigest()))
+        except Exception as e:
+            self.logger.info("Not reusing PDF: {}".format(e))
+            return None
+        table = None
+        if self._noaa_tabular is not None:
+            table = _frame_digest(self._noaa_tabular)
+        return PdfStore.digest([r.body for r in responses], table, options,
+                               images)
+
     def save_pdf(self):
 
         # for debugging: ("%Y-%m-%d %H%M%S.%f")[:-3]
@@ -508,56 +1161,123 @@ class WeatherReport(object):
         pdf_path = os.path.join(self.save_dir, pdfname)
 
         self._pdf_path = pdf_path
+        self._render_result = None
+        self._pdf_reused = False
 
-        # for pdfkit, suppress cmd output
+        # for pdfkit, suppress cmd output. Pages are staged as local files.
         pdfoptions = {
             'quiet': '',
+            'enable-local-file-access': '',
         }
 
         urls = [self.urls[
             int(i) - 1] for i in self.pdf_content_order_list] + self.additional_urls_list
 
-        try:
-            pdfkit.from_url(urls,  self.pdf_path, options=pdfoptions)
+        digest = self._render_digest(urls, pdfoptions)
+        if digest is not None and self.pdf_store.reuse(digest, pdf_path):
+            self._pdf_reused = True
+            with metrics.span('render', reused=True,
+                              pdf_bytes=os.path.getsize(pdf_path)):
+                pass
+            self.logger.info(
+                "Forecast unchanged; linked {} to {}".format(
+                    self.pdf_path, self.pdf_store.path(digest)))
+            return
 
-        except OSError as e:
-            try:
-                pdfkit.from_url(urls,  self.pdf_path, options={})
-
-            except OSError as e:
-                error_str = "".join(e.args)
-                if "HostNotFoundError" in error_str and all([_ in error_str.lower() for _ in ['printing pages', 'done']]):
-                    if not self.silent_mode_bool:
-                        print('Host Error Encountered.', error_str)
-                        print('PDF saved anyway.')
-                else:
-                    self.logger.exception(e)
-                    if not self.silent_mode_bool:
-                        print(
-                            'Save Process Unsuccessful. Check Input File and URL Paths.')
-                        raise(e)
+        staging = tempfile.TemporaryDirectory(prefix='weather_report_')
+        try:
+            pages = _stage_pages(urls, self._get_page, staging.name)
+            with metrics.span('render', pages=len(pages)) as span:
+                result = get_render_queue().render(
+                    pages, self.pdf_path, options=pdfoptions,
+                    site=self.site_short_name)
+                span.attrs.update(pdf_bytes=os.path.getsize(self.pdf_path),
+                                  queue_wait=result.queue_wait,
+                                  attempts=result.attempts)
+            self._render_result = result
+            if digest is not None:
+                self.pdf_store.add(digest, self.pdf_path)
+
+            if result.warning is not None and not self.silent_mode_bool:
+                print('Host Error Encountered.', result.warning)
+                print('PDF saved anyway.')
+
+        except RenderError as e:
+            self.logger.exception(e)
+            if not self.silent_mode_bool:
+                print(
+                    'Save Process Unsuccessful. Check Input File and URL Paths.')
+                raise(e)
 
         except Exception as e:
             self.logger.exception(e)
             if not self.silent_mode_bool:
                 raise(e)
 
+        finally:
+            staging.cleanup()
+
         self.logger.info("Saved PDF: {}".format(self.pdf_path))
+        if self._render_result is not None:
+            self.logger.info(
+                "Render took {:.2f}s after waiting {:.2f}s ({} attempts)".format(
+                    self._render_result.render_seconds,
+                    self._render_result.queue_wait,
+                    self._render_result.attempts))
+
+    def reset(self):
+        """Forget everything fetched or produced by the previous run."""
+        self._noaa_tabular = None
+        self._precip_column = None
+        self._precip_table = None
+        self._tabular_issued = None
+        self._pages = {}
+        self._pdf_path = None
+        self._render_result = None
+        self._pdf_reused = False
+        self._triggered_rules = None
+
+    @property
+    def forecast_fetched(self):
+        """Whether this run has needed the forecast so far."""
+        return self._tabular_issued is not None or \
+            self._noaa_tabular is not None
 
     def run(self):
+        # every stage timed and everything logged during the run is
+        # labelled with this site
+        with metrics.site(self.site_short_name), logs.site(self.logger.path), \
+                metrics.span('run'):
+            self._run()
+
+    def _run(self):
+        # the PDF from a previous run is never attached to this run's emails
+        self._pdf_path = None
+
+        if self.outbox is not None:
+            # deliver mail left from earlier runs while this one works
+            self.outbox.start()
+
+        # cheapest conditions first, so an idle run never fetches anything
         try:
-            if self.needs_new_pdf and _get_current_hour_minute() >= self.pdf_save_interval_start_time:
+            if _get_current_hour_minute() >= self.pdf_save_interval_start_time \
+                    and self.needs_new_pdf:
                 self.save_pdf()
                 self._write_last_pdf_file()
                 if self.pdf_email_list:
                     self.send_pdf_email()
 
-            if self.needs_alert:
-                if self.alert_email_list:
-                    self.send_alert_email()
+            if self.alert_email_list and self.needs_alert:
+                self.send_alert_email()
+                if self.digest is None:
+                    # a digest records it once the digest has been sent
                     self._write_last_alert_file()
 
         except Exception as e:
             self.logger.exception(e)
             if not self.silent_mode_bool:
                 raise(e)
+
+        finally:
+            if not self.forecast_fetched:
+                self.logger.info("Nothing due; skipped forecast fetch")